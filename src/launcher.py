@@ -18,9 +18,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from __future__ import annotations
 
+import multiprocessing
 
 from restreamlocal.__main__ import cli
 
 
 if __name__ == "__main__":  # pragma: no cover
+    multiprocessing.freeze_support()  # the preview runs in a child process, which re-runs this executable
     cli()
@@ -18,25 +18,137 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from __future__ import annotations
 
+import asyncio
+import json
 import shelve
+from pathlib import Path
+from typing import Optional
 
 import typer
 
+from . import _assets
+from .cascade import Topology
+from .control import run_headless
+from .control import run_node
+from .session import RestreamSession
+from .trace import Tracer
 from .windows_utils import get_project_appdata_dir
 from .window import create_restream_window
 
 cli = typer.Typer()
 
 
-@cli.command()
-def main() -> None:
+@cli.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    control_port: Optional[int] = typer.Option(  # noqa: B008
+        None, help="Accept JSON-RPC control requests on this local port."
+    ),
+    topology: Optional[Path] = typer.Option(  # noqa: B008
+        None, help="Run headless as one node of this relay topology (JSON), see --node."
+    ),
+    node: Optional[str] = typer.Option(  # noqa: B008
+        None, help="Which node of the topology this instance is, the origin by default."
+    ),
+    trace: Optional[Path] = typer.Option(  # noqa: B008
+        None, help="Append a JSONL trace of the stream's lifecycle events to this file."
+    ),
+) -> None:
     """Run the ReStreamLocal GUI."""
-    appdata_dir = get_project_appdata_dir()
-    appdata_dir.mkdir(parents=True, exist_ok=True)
-    config_file = appdata_dir / "config"
-    with shelve.open(str(config_file), writeback=True) as config:
-        window = create_restream_window(config)
-        window.mainloop()
+    if ctx.invoked_subcommand is not None:
+        if topology is not None or node is not None:
+            hint = "--topology/--node"
+            raise typer.BadParameter(f"can't be combined with {ctx.invoked_subcommand}", param_hint=hint)
+        ctx.obj = {"control_port": control_port, "trace": trace}  # for the subcommand, its own options win
+        return
+    tracer = Tracer(path=trace) if trace is not None else None
+    try:
+        if topology is not None:
+            loaded = Topology.load(topology)
+            try:
+                asyncio.run(run_node(loaded, node or loaded.origin.name, control_port, tracer))
+            except KeyboardInterrupt:
+                pass
+            return
+        appdata_dir = get_project_appdata_dir()
+        appdata_dir.mkdir(parents=True, exist_ok=True)
+        config_file = appdata_dir / "config"
+        with shelve.open(str(config_file), writeback=True) as config:
+            window = create_restream_window(config, control_port, tracer)
+            window.mainloop()
+    finally:
+        if tracer is not None:
+            tracer.close()
+
+
+def inherited_options(
+    ctx: typer.Context, control_port: int | None, trace: Path | None
+) -> tuple[int | None, Path | None]:
+    """--control-port and --trace, from the subcommand or else from before it."""
+    obj = ctx.obj or {}
+    return (
+        control_port if control_port is not None else obj.get("control_port"),
+        trace if trace is not None else obj.get("trace"),
+    )
+
+
+@cli.command()
+def playout(
+    ctx: typer.Context,
+    file: Path = typer.Argument(  # noqa: B008
+        ..., exists=True, dir_okay=False, help="An FLV or MP4 recording."
+    ),
+    destinations: list[str] = typer.Argument(..., help="Where to push it."),  # noqa: B008
+    loop: bool = typer.Option(False, help="Play the file again and again, until interrupted."),  # noqa: B008
+    control_port: Optional[int] = typer.Option(  # noqa: B008
+        None, help="Accept JSON-RPC control requests on this local port."
+    ),
+    trace: Optional[Path] = typer.Option(  # noqa: B008
+        None, help="Append a JSONL trace of the stream's lifecycle events to this file."
+    ),
+) -> None:
+    """Play a recording to destinations at real time pace, without MonaServer or an encoder."""
+    control_port, trace = inherited_options(ctx, control_port, trace)
+    tracer = Tracer(path=trace) if trace is not None else None
+
+    async def run() -> None:
+        async with RestreamSession(playout=file, playout_loop=loop, tracer=tracer) as session:
+            session.destinations = list(destinations)
+            await run_headless(session, control_port, start_ingest=False, until_played=not loop)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if tracer is not None:
+            tracer.close()
+
+
+@cli.command()
+def analyze(
+    ctx: typer.Context,
+    source: str = typer.Argument(  # noqa: B008
+        ..., help="A recorded FLV file, or a url (e.g. the ingest) to tap for --duration seconds."
+    ),
+    duration: float = typer.Option(30.0, help="How long to tap a url for, in seconds."),  # noqa: B008
+    json_output: bool = typer.Option(False, "--json", help="Print the report as JSON."),  # noqa: B008
+) -> None:
+    """Print timing statistics of a stream: jitter, GOP length, bitrate variance and A/V drift."""
+    if any(value is not None for value in (ctx.obj or {}).values()):
+        raise typer.BadParameter("can't be combined with analyze", param_hint="--control-port/--trace")
+    try:
+        from . import analyze as analysis
+    except ImportError as error:  # numpy is an optional extra, the GUI doesn't need it
+        typer.echo(f"analyze needs numpy, install restreamlocal[analyze]: {error}", err=True)
+        raise typer.Exit(1) from error
+    if "://" in source:
+        ffmpeg_executable = str(_assets.get_ffmpeg_executable())
+        index = asyncio.run(analysis.tap(ffmpeg_executable, source, duration))
+    else:
+        index = analysis.index_file(Path(source))
+    report = analysis.analyze(index)
+    typer.echo(json.dumps(report, indent=2) if json_output else analysis.format_report(report))
 
 
 if __name__ == "__main__":  # pragma: no cover
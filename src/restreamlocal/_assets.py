@@ -18,7 +18,16 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from __future__ import annotations
 
+import subprocess
+import sys
+import tempfile
+import zipfile
+from importlib.abc import Traversable
 from importlib.resources import files
+from io import BytesIO
+from pathlib import Path
+from sys import platform
+from typing import cast
 
 
 # The root of the package. This may not be a path if the package is installed, so just access the Traversable.
@@ -26,4 +35,84 @@ PACKAGE = files(__package__)
 # If you use all of your files in a folder like `assets` or `resources` (recommended), use the following line.
 RESOURCES = PACKAGE / "resources"
 
-__all__ = ("RESOURCES",)
+
+# mona process handling
+def get_mona_server_zip() -> Traversable:
+    if platform != "win32":
+        raise NotImplementedError("Only Windows is supported for now.")
+    python_is_64_bit = sys.maxsize > 2 ** 32  # https://stackoverflow.com/questions/1405913/how-do-i-determine-if-my-python-shell-is-executing-in-32bit-or-64bit
+    if python_is_64_bit:
+        # If the python is 64 bit, the system must be as well
+        return RESOURCES / "MonaServer_Win64.zip"
+    else:
+        # While the python is 32 bit, the system could be 32 or 64 bit, use 32 bit which works on both
+        return RESOURCES / "MonaServer_Win32.zip"
+
+
+def get_mona_server_directory() -> Path:
+    # first, see if we already made a mona server tempdir
+    mona_server_dir = Path(tempfile.gettempdir()) / "mona_server"
+    mona_server_dir.mkdir(exist_ok=True, parents=True)  # for some reason, just using the local appdata directory always returns true
+    mona_server_executable = mona_server_dir / "MonaServer.exe"
+    if mona_server_dir.exists() and mona_server_executable.exists():
+        print("Using existing MonaServer")
+        print(mona_server_dir)
+        return mona_server_dir
+
+    # if we didn't, make one
+    mona_server_zip = get_mona_server_zip()
+
+    # all of the files of the zip are top level, just extract straight
+    if mona_server_zip.is_file():
+        with zipfile.ZipFile(cast(Path, mona_server_zip), "r") as zip_ref:
+            zip_ref.extractall(mona_server_dir)
+    else:
+        with BytesIO() as zip_data:
+            zip_data.write(mona_server_zip.read_bytes())
+            zip_data.seek(0)
+            with zipfile.ZipFile(zip_data, "r") as zip_ref:
+                zip_ref.extractall(mona_server_dir)
+
+    print("Successfully extracted MonaServer")
+    print(mona_server_dir)
+
+    return mona_server_dir
+
+
+def kill_all_monaservers() -> None:
+    """Kills all MonaServer instances using taskkill, even if we have lost track of them."""
+    # a little bit of a hack, but it will work for us
+
+    # taskkill /IM MonaServer.exe /F
+
+    subprocess.run(["taskkill", "/IM", "MonaServer.exe", "/F"], shell=True)
+
+
+def get_ffmpeg_executable() -> Path:
+    ffmpeg_traversable = RESOURCES / "ffmpeg.exe"
+    if ffmpeg_traversable.is_file():
+        return cast(Path, ffmpeg_traversable)
+
+    # we need to check to see if we already made a tempdir
+    project_appdata_dir = Path(tempfile.gettempdir()) / "restreamlocal"
+    project_appdata_dir.mkdir(exist_ok=True)
+    ffmpeg_executable = project_appdata_dir / "ffmpeg.exe"
+    if ffmpeg_executable.exists():
+        print("Using existing ffmpeg")
+        print(ffmpeg_executable)
+        return ffmpeg_executable
+
+    # if we didn't, make one
+    with open(ffmpeg_executable, "wb") as f:
+        f.write(ffmpeg_traversable.read_bytes())
+
+    return ffmpeg_executable
+
+
+__all__ = (
+    "RESOURCES",
+    "get_ffmpeg_executable",
+    "get_mona_server_directory",
+    "get_mona_server_zip",
+    "kill_all_monaservers",
+)
@@ -0,0 +1,52 @@
+"""Event loop utilities for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any
+from typing import Coroutine
+from typing import TypeVar
+
+
+T = TypeVar("T")
+
+
+class BackgroundLoop:
+    """An asyncio event loop running in a daemon thread, so that tkinter can keep the main thread."""
+
+    def __init__(self) -> None:
+        self.loop = asyncio.new_event_loop()  # proactor on windows, which is what subprocesses need
+        self._thread = threading.Thread(target=self.loop.run_forever, name="restreamlocal-loop", daemon=True)
+        self._thread.start()
+
+    def submit(self, coroutine: Coroutine[Any, Any, T]) -> Future[T]:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def call(self, coroutine: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+        """Run a coroutine on the loop and block until it is done."""
+        return self.submit(coroutine).result(timeout)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+
+
+__all__ = ("BackgroundLoop",)
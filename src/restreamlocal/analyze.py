@@ -0,0 +1,348 @@
+"""Stream analysis for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+import mmap
+import struct
+from array import array
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .flv import AUDIO_FORMAT_AAC
+from .flv import FLV_HEADER_SIZE
+from .flv import PREVIOUS_TAG_SIZE
+from .flv import TAG_HEADER_SIZE
+from .flv import TAG_TYPE_AUDIO
+from .flv import TAG_TYPE_VIDEO
+from .flv import VIDEO_CODEC_AVC
+from .flv import check_flv_header
+from .output import print_stderr
+from .output import stop_process
+
+
+# The indexer only ever looks at tag headers and the first byte or two of each body, straight out of the
+# mmap, so a multi-hour recording is never copied. Each tag costs 18 bytes in the index, and everything
+# after indexing is whole-array numpy.
+KEYFRAME = 1
+SEQUENCE_HEADER = 2
+
+_TAG_START = struct.Struct(">II")  # type & size, then the timestamp & its extension
+_READ_SIZE = 65536
+
+
+def _flags(tag_type: int, first: int, second: int) -> int:
+    """KEYFRAME & SEQUENCE_HEADER from the first two body bytes, see FlvTag.is_keyframe."""
+    flags = 0
+    if tag_type == TAG_TYPE_VIDEO:
+        if first & 0x80:  # enhanced rtmp
+            if (first >> 4) & 0x07 == 1:
+                flags |= KEYFRAME
+            if first & 0x0F == 0:
+                flags |= SEQUENCE_HEADER
+        else:
+            if first >> 4 == 1:
+                flags |= KEYFRAME
+            if first & 0x0F == VIDEO_CODEC_AVC and second == 0:
+                flags |= SEQUENCE_HEADER
+    elif tag_type == TAG_TYPE_AUDIO and first >> 4 == AUDIO_FORMAT_AAC and second == 0:
+        flags |= SEQUENCE_HEADER
+    return flags
+
+
+class TagIndex:
+    """Where every tag of an FLV stream is, with its type, size, timestamp & flags, as numpy arrays.
+
+    arrival is when each tag was read, for live taps, in seconds since the tap started.
+    """
+
+    def __init__(
+        self,
+        offset: np.ndarray,
+        size: np.ndarray,
+        timestamp: np.ndarray,
+        tag_type: np.ndarray,
+        flags: np.ndarray,
+        arrival: np.ndarray | None = None,
+    ) -> None:
+        self.offset = offset
+        self.size = size
+        self.timestamp = timestamp
+        self.tag_type = tag_type
+        self.flags = flags
+        self.arrival = arrival
+
+    def __len__(self) -> int:
+        return len(self.offset)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.offset, self.size, self.timestamp, self.tag_type, self.flags, self.arrival)
+        return sum(values.nbytes for values in arrays if values is not None)
+
+    @property
+    def video(self) -> np.ndarray:
+        return np.asarray(self.tag_type == TAG_TYPE_VIDEO, dtype=np.bool_)
+
+    @property
+    def audio(self) -> np.ndarray:
+        return np.asarray(self.tag_type == TAG_TYPE_AUDIO, dtype=np.bool_)
+
+
+class FlvIndexer:
+    """Builds a TagIndex from FLV bytes fed in any number of pieces.
+
+    feed returns how many bytes it used; hand the rest back, with more appended, on the next call.
+    """
+
+    def __init__(self) -> None:
+        self.position = 0  # of the next unread byte in the whole stream
+        self._started = False
+        self._offset = array("q")
+        self._size = array("I")
+        self._timestamp = array("I")
+        self._tag_type = array("B")
+        self._flags = array("B")
+        self._arrival = array("d")
+
+    def feed(self, view: memoryview | bytes, arrival: float | None = None) -> int:
+        """Index every complete tag at the start of view, which begins at self.position."""
+        consumed = 0
+        end = len(view)
+        if not self._started:
+            if end < FLV_HEADER_SIZE:
+                return 0
+            data_offset = check_flv_header(view[:FLV_HEADER_SIZE])
+            if end < data_offset + PREVIOUS_TAG_SIZE:
+                return 0
+            consumed = data_offset + PREVIOUS_TAG_SIZE
+            self._started = True
+        # bound once, this loop runs for every tag of the recording
+        unpack_from = _TAG_START.unpack_from
+        offsets, sizes, timestamps = self._offset.append, self._size.append, self._timestamp.append
+        tag_types, flags = self._tag_type.append, self._flags.append
+        position = self.position
+        count = 0
+        while consumed + TAG_HEADER_SIZE <= end:
+            type_and_size, timestamp = unpack_from(view, consumed)
+            size = type_and_size & 0xFFFFFF
+            tag_end = consumed + TAG_HEADER_SIZE + size + PREVIOUS_TAG_SIZE
+            if tag_end > end:
+                break
+            tag_type = (type_and_size >> 24) & 0x1F
+            body = consumed + TAG_HEADER_SIZE
+            offsets(position + consumed)
+            sizes(size)
+            timestamps((timestamp >> 8) | ((timestamp & 0xFF) << 24))
+            tag_types(tag_type)
+            flags(_flags(tag_type, view[body], view[body + 1]) if size >= 2 else 0)
+            consumed = tag_end
+            count += 1
+        if arrival is not None and count:
+            self._arrival.extend([arrival] * count)
+        self.position += consumed
+        return consumed
+
+    def index(self) -> TagIndex:
+        """The index, once done feeding. The arrays share memory with the indexer, which can't grow after."""
+        arrival = None
+        if len(self._arrival):
+            arrival = np.frombuffer(self._arrival, dtype=np.float64)
+        return TagIndex(
+            np.frombuffer(self._offset, dtype=np.int64),
+            np.frombuffer(self._size, dtype=np.uint32),
+            np.frombuffer(self._timestamp, dtype=np.uint32),
+            np.frombuffer(self._tag_type, dtype=np.uint8),
+            np.frombuffer(self._flags, dtype=np.uint8),
+            arrival,
+        )
+
+
+def index_file(path: Path) -> TagIndex:
+    """Index a recorded FLV file through an mmap. A truncated final tag is ignored."""
+    indexer = FlvIndexer()
+    with open(path, "rb") as file:
+        if file.seek(0, 2) == 0:
+            return indexer.index()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                indexer.feed(view)
+            finally:
+                view.release()
+    return indexer.index()
+
+
+async def index_stream(reader: asyncio.StreamReader, duration: float) -> TagIndex:
+    """Index a live FLV byte stream for duration seconds, or until it ends, noting when each tag arrived."""
+    indexer = FlvIndexer()
+    buffer = bytearray()
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    while (remaining := start + duration - loop.time()) > 0:
+        try:
+            chunk = await asyncio.wait_for(reader.read(_READ_SIZE), remaining)
+        except asyncio.TimeoutError:
+            break
+        if not chunk:
+            break
+        buffer += chunk
+        with memoryview(buffer) as view:
+            consumed = indexer.feed(view, loop.time() - start)
+        del buffer[:consumed]
+    return indexer.index()
+
+
+async def tap(ffmpeg_executable: str, url: str, duration: float) -> TagIndex:
+    """Pull a stream (the ingest, or any url ffmpeg can read) without reencoding, and index it."""
+    process = await asyncio.create_subprocess_exec(
+        ffmpeg_executable,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        url,
+        "-c",
+        "copy",
+        "-map",
+        "0",
+        "-f",
+        "flv",
+        "pipe:1",
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stderr_task = asyncio.create_task(print_stderr(process, "tap"))
+    assert process.stdout is not None  # nosec
+    try:
+        return await index_stream(process.stdout, duration)
+    finally:
+        await stop_process(process)
+        await stderr_task
+
+
+def _summary(values: np.ndarray) -> dict[str, float]:
+    if not len(values):
+        return {}
+    return {
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+
+
+def _unwrap(timestamps: np.ndarray) -> np.ndarray:
+    """Timestamps as int64 milliseconds, with 32 bit wraparound (every 49.7 days) undone."""
+    values = timestamps.astype(np.int64)
+    wraps = np.cumsum(np.diff(values, prepend=values[:1]) < -(2**31))
+    return values + wraps * 2**32
+
+
+def analyze(index: TagIndex) -> dict[str, Any]:
+    """Timing statistics of an indexed stream. Times are in milliseconds, bitrates in kbit/s."""
+    timestamp = _unwrap(index.timestamp) if len(index) else index.timestamp.astype(np.int64)
+    video, audio = index.video, index.audio
+    media = (video | audio) & ((index.flags & SEQUENCE_HEADER) == 0)
+    report: dict[str, Any] = {
+        "tags": len(index),
+        "video_frames": int(np.count_nonzero(video & media)),
+        "audio_frames": int(np.count_nonzero(audio & media)),
+        "bytes": int(index.size.sum(dtype=np.int64)),
+        "index_bytes": int(index.nbytes),
+    }
+    if not media.any():
+        return report
+    media_timestamp = timestamp[media]
+    report["duration"] = float(media_timestamp.max() - media_timestamp.min())
+
+    video_timestamp = timestamp[video & media]
+    if len(video_timestamp) > 1:
+        intervals = np.diff(video_timestamp)
+        report["frame_interval"] = _summary(intervals)  # std is the jitter
+        report["fps"] = 1000 / float(intervals.mean()) if intervals.mean() > 0 else 0.0
+        report["timestamps_backwards"] = int(np.count_nonzero(intervals < 0))
+
+    # GOPs, in time and in frames
+    video_flags = index.flags[video & media]
+    keyframes = np.flatnonzero(video_flags & KEYFRAME)
+    report["keyframes"] = len(keyframes)
+    if len(keyframes) > 1:
+        report["gop_length"] = _summary(np.diff(video_timestamp[keyframes]))
+        report["gop_frames"] = _summary(np.diff(keyframes))
+
+    # bitrate per whole second of stream time
+    seconds = (media_timestamp - media_timestamp.min()) // 1000
+    per_second = np.bincount(seconds, weights=index.size[media]) * 8 / 1000
+    if len(per_second) > 2:
+        per_second = per_second[:-1]  # the last second is usually partial
+    bitrate = _summary(per_second)
+    if bitrate:
+        bitrate["cv"] = bitrate["std"] / bitrate["mean"] if bitrate["mean"] else 0.0
+    report["bitrate"] = bitrate
+
+    # A/V drift: each audio frame against the latest video frame before it in the stream
+    if video_timestamp.size and (audio & media).any():
+        media_video = (video & media)[media]
+        latest_video = np.maximum.accumulate(np.where(media_video, media_timestamp, np.iinfo(np.int64).min))
+        media_audio = (audio & media)[media]
+        paired = media_audio & (latest_video > np.iinfo(np.int64).min)
+        if paired.any():
+            drift = (media_timestamp - latest_video)[paired]
+            drift_report = _summary(drift)
+            at = media_timestamp[paired]
+            if len(at) > 1 and at.max() > at.min():
+                # the trend, a growing offset is drift rather than interleaving
+                drift_report["per_minute"] = float(np.polyfit((at - at.min()) / 60_000, drift, 1)[0])
+            report["av_drift"] = drift_report
+
+    # for live taps, how irregularly tags arrive compared to their timestamps
+    if index.arrival is not None and len(index.arrival) == len(index):
+        lateness = index.arrival[media] * 1000 - (media_timestamp - media_timestamp.min())
+        report["arrival_jitter"] = float((lateness - lateness.min()).std())
+    return report
+
+
+def format_report(report: dict[str, Any]) -> str:
+    """The report as aligned lines, for printing."""
+    lines = []
+    for key, value in report.items():
+        name = key.replace("_", " ")
+        if isinstance(value, dict):
+            value = ", ".join(f"{part} {number:.2f}" for part, number in value.items()) or "n/a"
+        elif isinstance(value, float):
+            value = f"{value:.2f}"
+        lines.append(f"{name:>20}: {value}")
+    return "\n".join(lines)
+
+
+__all__ = (
+    "FlvIndexer",
+    "KEYFRAME",
+    "SEQUENCE_HEADER",
+    "TagIndex",
+    "analyze",
+    "format_report",
+    "index_file",
+    "index_stream",
+    "tap",
+)
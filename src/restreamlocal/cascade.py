@@ -0,0 +1,369 @@
+"""Cascading for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+import hmac
+import json
+import socket
+import time
+from pathlib import Path
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import NamedTuple
+
+from .flv import FlvTag
+from .output import BufferBudget
+from .output import Output
+from .trace import Tracer
+
+
+# One instance can forward its stream to other instances over a "link": a plain TCP connection carrying
+# the same FLV the relay feeds its outputs. There's no ffmpeg, RTMP handshake or MonaServer on a hop, so
+# each one only adds a socket write. The downstream instance's relay reads the link like an ingest.
+# Before the FLV, the upstream sends the topology's token on a line of its own, it's in the link url as
+# restreamlocal://TOKEN@host:port. The downstream drops a connection that doesn't, so nobody else who can
+# reach the port can take the link over.
+LINK_SCHEME = "restreamlocal"
+DEFAULT_LINK_PORT = 1946
+CONNECT_TIMEOUT = 5.0
+
+
+class TopologyError(ValueError):
+    """Raised for a topology that can't be run."""
+
+
+def is_link_url(url: str) -> bool:
+    return url.startswith(f"{LINK_SCHEME}://")
+
+
+def build_link_url(host: str, port: int, token: str = "") -> str:
+    return f"{LINK_SCHEME}://{token}@{host}:{port}" if token else f"{LINK_SCHEME}://{host}:{port}"
+
+
+def parse_link_url(url: str) -> tuple[str, int]:
+    """Split restreamlocal://[token@]host:port, the port defaults to DEFAULT_LINK_PORT."""
+    if not is_link_url(url):
+        raise ValueError(f"Not a {LINK_SCHEME}:// url: {url}")
+    address = url[len(LINK_SCHEME) + 3 :].rstrip("/").rpartition("@")[2]
+    host, _, port = address.rpartition(":")
+    if not host:
+        return port, DEFAULT_LINK_PORT
+    return host, int(port)
+
+
+def link_token(url: str) -> str:
+    """The token of restreamlocal://token@host:port, empty without one."""
+    return url[len(LINK_SCHEME) + 3 :].rpartition("@")[0]
+
+
+def valid_link_token(token: str) -> bool:
+    return bool(token) and "@" not in token and "/" not in token and not any(char.isspace() for char in token)
+
+
+async def authenticate_link(reader: asyncio.StreamReader, token: str) -> bool:
+    """Read the token line an upstream starts with, False if it's wrong or doesn't come in time."""
+    try:
+        line = await asyncio.wait_for(reader.readuntil(b"\n"), CONNECT_TIMEOUT)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        return False
+    return bool(token) and hmac.compare_digest(line[:-1], token.encode())
+
+
+class LinkOutput(Output):
+    """An output that feeds a downstream ReStreamLocal over TCP instead of through ffmpeg.
+
+    Progress is the socket draining, so the watchdog reconnects a downstream that stops reading, and one
+    that can't be reached is retried with the usual backoff.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        get_headers: Callable[[], list[FlvTag]],
+        *,
+        queue_size: int = 1024,
+        tracer: Tracer | None = None,
+        buffer_budget: BufferBudget | None = None,
+    ) -> None:
+        super().__init__(
+            "", url, get_headers, queue_size=queue_size, tracer=tracer, buffer_budget=buffer_budget
+        )
+        self._writer: asyncio.StreamWriter | None = None
+        self._started = False
+        self._last_sample = (0.0, 0)
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    @property
+    def running(self) -> bool:
+        return self._writer is not None and bool(self._tasks) and not self._tasks[0].done()
+
+    def build_command(self) -> list[str]:
+        return []  # nothing to run
+
+    async def _link_write_loop(self, writer: asyncio.StreamWriter) -> None:
+        token = link_token(self.target_url)
+        writer.write((token.encode() + b"\n" if token else b"") + self.flv_header)
+        try:
+            while True:
+                data, _ = await self._queue.get()
+                self._dequeued(data)
+                writer.write(data)
+                self.bytes_in += len(data)
+                self.fed_since_progress += len(data)
+                await writer.drain()
+                # there's no ffmpeg to report progress, what the socket took is what went out
+                if self.total_size == 0:
+                    self.tracer.emit(
+                        "output_first_byte", self.name, key=self.url, total_size=self.fed_since_progress
+                    )
+                self.total_size += self.fed_since_progress
+                self.fed_since_progress = 0
+                self.last_progress = time.monotonic()
+                self.restarts_since_progress = 0
+                if self.stall_detected_at is not None:
+                    self.recovery_times.append(self.last_progress - self.stall_detected_at)
+                    self.stall_detected_at = None
+        except ConnectionError:
+            print(f"[{self.name}] downstream disconnected")
+
+    async def start(self) -> None:
+        print(f"Starting link {self.name}")
+        self.tracer.emit("output_start", self.name, key=self.url, restarts=self.restarts)
+        self._started = True
+        self.joined = False
+        self._skipping_video = False
+        self._clear_queue()
+        self.total_size = 0
+        self.last_progress = self.started_at = time.monotonic()
+        self.fed_since_progress = 0
+        writer = await self._connect()
+        if writer is None:
+            return  # not running, the watchdog retries
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # don't hold small tags back
+        self.tracer.emit("output_connect", self.name, key=self.url)
+        self._writer = writer
+        self._tasks = [asyncio.create_task(self._link_write_loop(writer))]
+
+    async def _connect(self) -> asyncio.StreamWriter | None:
+        host, port = parse_link_url(self.target_url)
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), CONNECT_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as error:
+            print(f"[{self.name}] could not connect: {error!r}")
+            return None
+        return writer
+
+    async def stop(self, grace: float = 0.0) -> None:
+        self._started = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+            self._writer = None
+        self._clear_queue()  # gives its share of the buffer budget back
+        self.tracer.emit("output_stop", self.name)
+
+    def sample(self) -> None:
+        # the rate the downstream took data at, ffmpeg reports this for the other outputs
+        now = time.monotonic()
+        last_time, last_size = self._last_sample
+        self._last_sample = (now, self.total_size)
+        if self.running and last_time and self.total_size >= last_size:
+            bitrate = (self.total_size - last_size) * 8 / 1000 / (now - last_time)
+            self.telemetry.append(bitrate, 0, self.queue_depth)
+        else:
+            self.telemetry.append(0, 0, self.queue_depth if self.running else 0)
+
+
+class TapOutput(LinkOutput):
+    """A LinkOutput over a connection somebody else opened, e.g. the preview's, see RestreamSession.
+
+    Taps aren't destinations: nothing restarts them, once the other end goes away they are done.
+    """
+
+    def __init__(self, writer: asyncio.StreamWriter, get_headers: Callable[[], list[FlvTag]]) -> None:
+        host, port = writer.get_extra_info("peername")[:2]
+        super().__init__(build_link_url(host, port), get_headers)
+        self._accepted: asyncio.StreamWriter | None = writer
+
+    async def _connect(self) -> asyncio.StreamWriter | None:
+        writer, self._accepted = self._accepted, None
+        return writer
+
+
+def create_output(
+    ffmpeg_executable: str,
+    url: str,
+    get_headers: Callable[[], list[FlvTag]],
+    resolve_url: Callable[[str], Awaitable[str]] | None = None,
+    tracer: Tracer | None = None,
+    buffer_budget: BufferBudget | None = None,
+) -> Output:
+    """The right kind of output for a destination url."""
+    if is_link_url(url):
+        return LinkOutput(url, get_headers, tracer=tracer, buffer_budget=buffer_budget)
+    return Output(
+        ffmpeg_executable,
+        url,
+        get_headers,
+        resolve_url=resolve_url,
+        tracer=tracer,
+        buffer_budget=buffer_budget,
+    )
+
+
+class NodeConfig(NamedTuple):
+    """One instance in a topology."""
+
+    name: str
+    link: tuple[str, int] | None = None  # where it listens for its upstream, None for the origin
+    control_port: int | None = None
+    destinations: tuple[str, ...] = ()
+    downstream: tuple[str, ...] = ()  # names of the nodes it forwards to
+
+
+class Topology:
+    """Which instance forwards to which, and which destinations each one serves.
+
+    Declared as JSON, every instance can be given the same file and pick its own node:
+
+        {
+          "nodes": {
+            "origin": {"control_port": 1936, "destinations": ["rtmp://a/app/key"], "downstream": ["edge"]},
+            "edge": {"link": "10.0.0.2:1946", "control_port": 1937, "destinations": ["rtmp://b/app/key"]}
+          }
+        }
+
+    The origin is the node without a link, it takes the ingest from OBS. Every other node receives the
+    stream from exactly one upstream node. As soon as there are links, "token" has to be given next to
+    "nodes": a shared secret without spaces, @ or /, which a node checks its upstream for.
+    """
+
+    def __init__(self, nodes: dict[str, NodeConfig], token: str = "") -> None:
+        self.nodes = nodes
+        self.token = token
+        self._validate()
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> Topology:
+        nodes = {}
+        try:
+            for name, node in data["nodes"].items():
+                link = None
+                if node.get("link") is not None:
+                    link = parse_link_url(f"{LINK_SCHEME}://{node['link']}")
+                nodes[name] = NodeConfig(
+                    name,
+                    link,
+                    node.get("control_port"),
+                    tuple(node.get("destinations", ())),
+                    tuple(node.get("downstream", ())),
+                )
+            token = str(data.get("token", ""))
+        except (KeyError, AttributeError, TypeError, ValueError) as error:
+            raise TopologyError(f"Invalid topology: {error!r}") from error
+        return cls(nodes, token)
+
+    @classmethod
+    def load(cls, path: Path) -> Topology:
+        with open(path, encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
+
+    def _validate(self) -> None:
+        for node in self.nodes.values():
+            self._validate_node(node)
+        self._validate_graph()
+        if len(self.nodes) > 1 and not valid_link_token(self.token):
+            raise TopologyError("A topology with links needs a token without spaces, @ or /")
+
+    def _validate_node(self, node: NodeConfig) -> None:
+        """A node can only forward to other nodes of the topology that have a link address."""
+        for name in node.downstream:
+            if name not in self.nodes:
+                raise TopologyError(f"{node.name} forwards to unknown node {name}")
+            if self.nodes[name].link is None:
+                raise TopologyError(f"{node.name} forwards to {name}, which has no link address")
+
+    def _validate_graph(self) -> None:
+        """One origin, and every other node fed by it through a single upstream node."""
+        upstreams: dict[str, str] = {}
+        for node in self.nodes.values():
+            for name in node.downstream:
+                if name in upstreams:
+                    raise TopologyError(f"{name} has two upstream nodes, {upstreams[name]} and {node.name}")
+                upstreams[name] = node.name
+        origins = [node.name for node in self.nodes.values() if node.link is None]
+        if len(origins) != 1:
+            raise TopologyError(f"A topology needs exactly one node without a link, not {origins}")
+        for name in self.nodes:  # every node has to be fed by the origin, which also rules out cycles
+            current = name
+            seen = {current}
+            while current in upstreams:
+                current = upstreams[current]
+                if current in seen:
+                    raise TopologyError(f"{current} is part of a cycle")
+                seen.add(current)
+            if current != origins[0]:
+                raise TopologyError(f"{name} is not fed by {origins[0]}")
+
+    @property
+    def origin(self) -> NodeConfig:
+        return next(node for node in self.nodes.values() if node.link is None)
+
+    def link_url(self, name: str) -> str:
+        link = self.nodes[name].link
+        if link is None:
+            raise TopologyError(f"{name} has no link address")
+        return build_link_url(*link, self.token)
+
+    def destinations_for(self, name: str) -> list[str]:
+        """Everything a node pushes to, its own destinations and then its downstream nodes."""
+        node = self.nodes[name]
+        return list(node.destinations) + [self.link_url(downstream) for downstream in node.downstream]
+
+
+__all__ = (
+    "DEFAULT_LINK_PORT",
+    "LINK_SCHEME",
+    "LinkOutput",
+    "NodeConfig",
+    "TapOutput",
+    "Topology",
+    "TopologyError",
+    "authenticate_link",
+    "build_link_url",
+    "create_output",
+    "is_link_url",
+    "link_token",
+    "parse_link_url",
+    "valid_link_token",
+)
@@ -0,0 +1,266 @@
+"""Control socket for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+from pathlib import Path
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+
+from .cascade import Topology
+from .cascade import TopologyError
+from .session import RestreamSession
+from .trace import Tracer
+
+
+# JSON-RPC 2.0, one request or response per line, on loopback only since stream keys go over it in the clear.
+DEFAULT_CONTROL_HOST = "127.0.0.1"
+DEFAULT_CONTROL_PORT = 1936
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+class ControlError(Exception):
+    """An error response from a control server."""
+
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(code, message)
+        self.code = code
+        self.message = message
+
+    def __str__(self) -> str:
+        return f"{self.message} ({self.code})"
+
+
+def session_methods(session: RestreamSession) -> dict[str, Callable[..., Awaitable[Any] | Any]]:
+    """The methods a control server exposes for a session."""
+
+    async def set_hold(hold: bool) -> None:
+        session.hold = hold  # takes effect the next time the relay starts
+
+    async def set_backup_stream_key(backup_stream_key: str | None) -> None:
+        session.backup_stream_key = backup_stream_key  # same
+
+    async def set_buffer_budget(limit: int) -> None:
+        if isinstance(limit, bool) or not isinstance(limit, int) or limit <= 0:
+            raise ValueError(f"limit must be a positive number of bytes, not {limit!r}")
+        session.buffer_budget.limit = limit  # takes effect on the next send
+
+    async def set_playout(path: str | None, loop: bool = False) -> None:
+        session.playout = Path(path) if path is not None else None  # same
+        session.playout_loop = loop
+
+    return {
+        "start_ingest": session.start_ingest,
+        "stop_ingest": session.stop_ingest,
+        "start_relay": session.start_relay,
+        "stop_relay": session.stop_relay,
+        "add_destination": session.add_destination,
+        "remove_destination": session.remove_destination,
+        "set_destinations": session.set_destinations,
+        "list_destinations": lambda: list(session.destinations),
+        "set_hold": set_hold,
+        "set_backup_stream_key": set_backup_stream_key,
+        "set_playout": set_playout,
+        "set_buffer_budget": set_buffer_budget,
+        "stats": session.stats,
+        "trace": session.tracer.recent,
+    }
+
+
+def _error(request_id: Any, code: int, message: str) -> dict[str, Any]:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+async def _dispatch(method: Callable[..., Awaitable[Any] | Any], params: Any) -> Any:
+    """Call a method with a request's params, raises the ControlError to respond with if that fails."""
+    if not isinstance(params, (dict, list)):
+        raise ControlError(INVALID_PARAMS, "params must be an array or object")
+    try:
+        result = method(**params) if isinstance(params, dict) else method(*params)
+    except (TypeError, ValueError) as error:  # the wrong arguments, or ones the method refuses
+        raise ControlError(INVALID_PARAMS, str(error)) from error
+    except Exception as error:  # noqa: B902 - reported back to the caller instead
+        raise ControlError(INTERNAL_ERROR, str(error)) from error
+    if not asyncio.iscoroutine(result):
+        return result
+    try:
+        return await result
+    except ValueError as error:  # e.g. a destination with invalid # options
+        raise ControlError(INVALID_PARAMS, str(error)) from error
+    except Exception as error:  # noqa: B902 - reported back to the caller instead
+        raise ControlError(INTERNAL_ERROR, str(error)) from error
+
+
+class ControlServer:
+    """Serves a session's methods over a local socket, so a running instance can be reconfigured."""
+
+    def __init__(
+        self,
+        session: RestreamSession,
+        host: str = DEFAULT_CONTROL_HOST,
+        port: int = DEFAULT_CONTROL_PORT,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.methods = session_methods(session)
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]  # in case we were given port 0
+        print(f"Control socket listening on {self.host}:{self.port}")
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def handle(self, request: Any) -> dict[str, Any] | None:
+        """Handle a single decoded request, returns the response or None for notifications."""
+        if not isinstance(request, dict) or not isinstance(request.get("method"), str):
+            return _error(None, INVALID_REQUEST, "Invalid request")
+        request_id = request.get("id")
+        method = self.methods.get(request["method"])
+        if method is None:
+            return _error(request_id, METHOD_NOT_FOUND, f"Method not found: {request['method']}")
+        try:
+            result = await _dispatch(method, request.get("params", []))
+        except ControlError as error:
+            return _error(request_id, error.code, error.message)
+        if "id" not in request:
+            return None
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as error:
+                    response: dict[str, Any] | None = _error(None, PARSE_ERROR, str(error))
+                else:
+                    response = await self.handle(request)
+                if response is not None:
+                    writer.write(json.dumps(response).encode() + b"\n")
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class ControlClient:
+    """A minimal client for a ControlServer, used by automation and by upstream relays."""
+
+    def __init__(self, host: str = DEFAULT_CONTROL_HOST, port: int = DEFAULT_CONTROL_PORT) -> None:
+        self.host = host
+        self.port = port
+        self._ids = itertools.count(1)
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._lock = asyncio.Lock()
+
+    async def connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        if args and kwargs:
+            raise ValueError("Use either positional or keyword arguments, not both")
+        async with self._lock:
+            if self._writer is None:
+                await self.connect()
+            assert self._reader is not None and self._writer is not None  # nosec
+            request_id = next(self._ids)
+            request = {"jsonrpc": "2.0", "id": request_id, "method": method, "params": kwargs or list(args)}
+            self._writer.write(json.dumps(request).encode() + b"\n")
+            await self._writer.drain()
+            line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Control server closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise ControlError(response["error"]["code"], response["error"]["message"])
+        return response.get("result")
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._writer = None
+
+
+async def run_headless(
+    session: RestreamSession,
+    control_port: int | None = None,
+    *,
+    start_ingest: bool = True,
+    until_played: bool = False,
+) -> None:
+    """Run a session without a window, reconfigurable over its control socket.
+
+    Runs until cancelled, or with until_played, until a playout file that doesn't loop has been played.
+    """
+    control_server = None
+    if control_port is not None:
+        control_server = ControlServer(session, port=control_port)
+        await control_server.start()
+    try:
+        if start_ingest:
+            await session.start_ingest()
+        await session.start_relay()
+        while not until_played or session.relay is None or not session.relay.playout_done.is_set():
+            await asyncio.sleep(1)  # the relay can be restarted over the control socket
+    finally:
+        if control_server is not None:
+            await control_server.close()
+
+
+async def run_node(
+    topology: Topology, name: str, control_port: int | None = None, tracer: Tracer | None = None
+) -> None:
+    """Run one node of a topology without a window until cancelled."""
+    if name not in topology.nodes:
+        raise TopologyError(f"No node named {name}, the topology has {', '.join(topology.nodes)}")
+    node = topology.nodes[name]
+    control_port = control_port if control_port is not None else node.control_port
+    async with RestreamSession.from_topology(topology, name, tracer=tracer) as session:
+        # only the origin has a MonaServer for OBS to publish to
+        await run_headless(session, control_port, start_ingest=node.link is None)
+
+
+__all__ = (
+    "ControlClient",
+    "ControlError",
+    "ControlServer",
+    "DEFAULT_CONTROL_PORT",
+    "run_headless",
+    "run_node",
+    "session_methods",
+)
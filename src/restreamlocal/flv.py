@@ -0,0 +1,282 @@
+"""FLV utilities for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+import struct
+from typing import Any
+from typing import AsyncIterator
+from typing import Callable
+from typing import Generator
+from typing import NamedTuple
+
+
+# https://veovera.org/docs/legacy/video-file-format-v10-1-spec.pdf
+TAG_TYPE_AUDIO = 8
+TAG_TYPE_VIDEO = 9
+TAG_TYPE_SCRIPT = 18
+
+FLV_HEADER_SIZE = 9
+TAG_HEADER_SIZE = 11
+PREVIOUS_TAG_SIZE = 4
+
+VIDEO_CODEC_AVC = 7
+AUDIO_FORMAT_AAC = 10
+
+FLV_HEADER = b"FLV\x01\x05\x00\x00\x00\x09" + b"\x00\x00\x00\x00"  # audio + video, PreviousTagSize0
+TAG_OVERHEAD = TAG_HEADER_SIZE + PREVIOUS_TAG_SIZE  # bytes a tag takes on top of its data
+
+
+def build_flv_header(audio: bool = True, video: bool = True) -> bytes:
+    """A file header announcing the given tracks, followed by PreviousTagSize0."""
+    flags = (0x04 if audio else 0) | (0x01 if video else 0)
+    return b"FLV\x01" + bytes((flags,)) + b"\x00\x00\x00\x09" + b"\x00\x00\x00\x00"
+
+
+class FlvError(ValueError):
+    """Raised when a byte stream is not valid FLV."""
+
+
+class FlvTag(NamedTuple):
+    """A single FLV tag. The timestamp is in milliseconds."""
+
+    tag_type: int
+    timestamp: int
+    data: bytes
+
+    @property
+    def is_video(self) -> bool:
+        return self.tag_type == TAG_TYPE_VIDEO
+
+    @property
+    def is_audio(self) -> bool:
+        return self.tag_type == TAG_TYPE_AUDIO
+
+    @property
+    def is_script(self) -> bool:
+        return self.tag_type == TAG_TYPE_SCRIPT
+
+    @property
+    def is_keyframe(self) -> bool:
+        if not self.is_video or not self.data:
+            return False
+        first = self.data[0]
+        if first & 0x80:  # enhanced rtmp, frame type is in bits 4-6
+            return (first >> 4) & 0x07 == 1
+        return first >> 4 == 1
+
+    @property
+    def is_sequence_header(self) -> bool:
+        """True for AVC/HEVC decoder configuration records and AAC AudioSpecificConfig."""
+        if len(self.data) < 2:
+            return False
+        first = self.data[0]
+        if self.is_video:
+            if first & 0x80:  # enhanced rtmp, PacketTypeSequenceStart
+                return first & 0x0F == 0
+            return first & 0x0F == VIDEO_CODEC_AVC and self.data[1] == 0
+        if self.is_audio:
+            return first >> 4 == AUDIO_FORMAT_AAC and self.data[1] == 0
+        return False
+
+    @property
+    def is_header(self) -> bool:
+        """True for tags a decoder needs before it can join the stream (metadata & sequence headers)."""
+        return self.is_script or self.is_sequence_header
+
+    def encode(self) -> bytes:
+        """Serialize the tag, including its trailing PreviousTagSize field."""
+        size = len(self.data)
+        timestamp = self.timestamp & 0xFFFFFFFF
+        header = (
+            bytes((self.tag_type,))
+            + size.to_bytes(3, "big")
+            + (timestamp & 0xFFFFFF).to_bytes(3, "big")
+            + bytes((timestamp >> 24, 0, 0, 0))  # extended timestamp, stream id
+        )
+        return header + bytes(self.data) + struct.pack(">I", TAG_HEADER_SIZE + size)
+
+
+def parse_tag_header(header: bytes | memoryview) -> tuple[int, int, int]:
+    """Returns the tag type, data size and timestamp of an 11 byte tag header."""
+    tag_type = header[0] & 0x1F  # the upper bits are reserved/filter
+    size = (header[1] << 16) | (header[2] << 8) | header[3]
+    timestamp = (header[7] << 24) | (header[4] << 16) | (header[5] << 8) | header[6]
+    return tag_type, size, timestamp
+
+
+def check_flv_header(header: bytes | memoryview) -> int:
+    """Validates a file header and returns the offset of PreviousTagSize0."""
+    if bytes(header[:3]) != b"FLV":
+        raise FlvError("Missing FLV signature")
+    return int.from_bytes(header[5:9], "big")
+
+
+def iter_flv_tags(buffer: bytes | memoryview) -> Generator[FlvTag, None, None]:
+    """Iterates over the tags of a complete FLV file held in memory. A truncated final tag is ignored."""
+    view = memoryview(buffer)
+    offset = check_flv_header(view[:FLV_HEADER_SIZE]) + PREVIOUS_TAG_SIZE
+    end = len(view)
+    while offset + TAG_HEADER_SIZE <= end:
+        tag_type, size, timestamp = parse_tag_header(view[offset : offset + TAG_HEADER_SIZE])
+        data_start = offset + TAG_HEADER_SIZE
+        if data_start + size > end:
+            break
+        yield FlvTag(tag_type, timestamp, bytes(view[data_start : data_start + size]))
+        offset = data_start + size + PREVIOUS_TAG_SIZE
+
+
+async def read_flv_tags(
+    reader: asyncio.StreamReader, timeout: float | None = None
+) -> AsyncIterator[FlvTag]:
+    """Reads tags from a live FLV byte stream until EOF.
+
+    If timeout is given and no bytes arrive for that long, asyncio.TimeoutError is raised.
+    """
+    try:
+        header = await asyncio.wait_for(reader.readexactly(FLV_HEADER_SIZE), timeout)
+        data_offset = check_flv_header(header)
+        await asyncio.wait_for(
+            reader.readexactly(data_offset - FLV_HEADER_SIZE + PREVIOUS_TAG_SIZE), timeout
+        )
+        while True:
+            tag_header = await asyncio.wait_for(reader.readexactly(TAG_HEADER_SIZE), timeout)
+            tag_type, size, timestamp = parse_tag_header(tag_header)
+            body = await asyncio.wait_for(reader.readexactly(size + PREVIOUS_TAG_SIZE), timeout)
+            yield FlvTag(tag_type, timestamp, body[:size])
+    except asyncio.IncompleteReadError:
+        return
+
+
+# AMF0, just enough to read onMetaData. Each reader starts just after the type marker.
+def _read_amf0_number(data: bytes, offset: int) -> tuple[Any, int]:
+    return struct.unpack_from(">d", data, offset)[0], offset + 8
+
+
+def _read_amf0_boolean(data: bytes, offset: int) -> tuple[Any, int]:
+    return data[offset] != 0, offset + 1
+
+
+def _read_amf0_string(data: bytes, offset: int) -> tuple[Any, int]:
+    (length,) = struct.unpack_from(">H", data, offset)
+    offset += 2
+    return data[offset : offset + length].decode("utf-8", "replace"), offset + length
+
+
+def _read_amf0_long_string(data: bytes, offset: int) -> tuple[Any, int]:
+    (length,) = struct.unpack_from(">I", data, offset)
+    offset += 4
+    return data[offset : offset + length].decode("utf-8", "replace"), offset + length
+
+
+def _read_amf0_object(data: bytes, offset: int) -> tuple[Any, int]:
+    result: dict[str, Any] = {}
+    while offset + 3 <= len(data):
+        (length,) = struct.unpack_from(">H", data, offset)
+        offset += 2
+        if length == 0 and data[offset] == 0x09:
+            return result, offset + 1
+        key = data[offset : offset + length].decode("utf-8", "replace")
+        result[key], offset = _read_amf0(data, offset + length)
+    return result, offset
+
+
+def _read_amf0_ecma_array(data: bytes, offset: int) -> tuple[Any, int]:
+    return _read_amf0_object(data, offset + 4)  # approximate count, the end marker is what counts
+
+
+def _read_amf0_strict_array(data: bytes, offset: int) -> tuple[Any, int]:
+    (count,) = struct.unpack_from(">I", data, offset)
+    offset += 4
+    items = []
+    for _ in range(count):
+        item, offset = _read_amf0(data, offset)
+        items.append(item)
+    return items, offset
+
+
+def _read_amf0_date(data: bytes, offset: int) -> tuple[Any, int]:
+    return struct.unpack_from(">d", data, offset)[0], offset + 10
+
+
+def _read_amf0_null(data: bytes, offset: int) -> tuple[Any, int]:
+    return None, offset
+
+
+_AMF0_READERS: dict[int, Callable[[bytes, int], tuple[Any, int]]] = {
+    0x00: _read_amf0_number,
+    0x01: _read_amf0_boolean,
+    0x02: _read_amf0_string,
+    0x03: _read_amf0_object,
+    0x05: _read_amf0_null,
+    0x06: _read_amf0_null,  # undefined
+    0x08: _read_amf0_ecma_array,
+    0x0A: _read_amf0_strict_array,
+    0x0B: _read_amf0_date,
+    0x0C: _read_amf0_long_string,
+}
+
+
+def _read_amf0(data: bytes, offset: int) -> tuple[Any, int]:
+    marker = data[offset]
+    reader = _AMF0_READERS.get(marker)
+    if reader is None:
+        raise FlvError(f"Unsupported AMF0 marker {marker:#x}")
+    return reader(data, offset + 1)
+
+
+def decode_amf0(data: bytes) -> list[Any]:
+    """Decodes every AMF0 value in a script tag body."""
+    values = []
+    offset = 0
+    while offset < len(data):
+        value, offset = _read_amf0(data, offset)
+        values.append(value)
+    return values
+
+
+def parse_metadata(tag: FlvTag) -> dict[str, Any] | None:
+    """Returns the onMetaData properties of a script tag, or None if it is some other script tag."""
+    if not tag.is_script:
+        return None
+    try:
+        values = decode_amf0(tag.data)
+    except (FlvError, IndexError, struct.error):
+        return None
+    # either "onMetaData", {...} or "@setDataFrame", "onMetaData", {...}
+    for name, value in zip(values, values[1:]):
+        if name == "onMetaData" and isinstance(value, dict):
+            return value
+    return None
+
+
+__all__ = (
+    "FLV_HEADER",
+    "FlvError",
+    "FlvTag",
+    "TAG_OVERHEAD",
+    "TAG_TYPE_AUDIO",
+    "TAG_TYPE_SCRIPT",
+    "TAG_TYPE_VIDEO",
+    "build_flv_header",
+    "decode_amf0",
+    "iter_flv_tags",
+    "parse_metadata",
+    "read_flv_tags",
+)
@@ -0,0 +1,570 @@
+"""Outputs for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Iterable
+from typing import NamedTuple
+from urllib.parse import parse_qs
+
+from .flv import TAG_OVERHEAD
+from .flv import FlvTag
+from .flv import build_flv_header
+from .presets import build_auto_url
+from .presets import is_auto_url
+from .presets import split_auto_url
+from .telemetry import OutputTelemetry
+from .telemetry import parse_rate
+from .trace import Tracer
+
+
+async def print_stream(stream: asyncio.StreamReader, name: str) -> None:
+    """Forward a child's output to the console. Not reading it at all would eventually block the child."""
+    async for line in stream:
+        print(f"[{name}] {line.decode(errors='replace').rstrip()}")
+
+
+async def print_stderr(process: asyncio.subprocess.Process, name: str) -> None:
+    assert process.stderr is not None  # nosec
+    await print_stream(process.stderr, name)
+
+
+async def stop_process(process: asyncio.subprocess.Process, grace: float = 0.0) -> None:
+    """Kill a child, first giving it grace seconds to exit by itself after closing its stdin."""
+    if grace > 0 and process.stdin is not None and process.returncode is None:
+        process.stdin.close()
+        try:
+            await asyncio.wait_for(process.wait(), grace)
+        except asyncio.TimeoutError:
+            pass
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+    await process.wait()
+
+
+def redact_url(url: str) -> str:
+    """Strip any user@ and the stream key (the last path segment, or all of an auto:// url's) for printing."""
+    url = url.partition("#")[0]
+    if is_auto_url(url):
+        return build_auto_url(split_auto_url(url)[0])
+    scheme, separator, rest = url.partition("://")
+    if not separator:
+        scheme, rest = "", url
+    address, _, path = rest.partition("/")
+    path = path.rstrip("/").rpartition("/")[0]  # rtmp://host/app/KEY/ and rtmp://host/KEY keep no key either
+    return scheme + separator + address.rpartition("@")[2] + (f"/{path}" if path else "")
+
+
+TRACKS = ("video", "audio")
+CAP_BURST = 1.0  # seconds of max_kbps a capped output can save up
+DEFAULT_BUFFER_BUDGET = 128 * 2**20  # bytes queued for all outputs together
+
+
+class DestinationOptions(NamedTuple):
+    """What an output sends, given after a # in its url: rtmp://host/app/key#tracks=audio&max_kbps=128.
+
+    FLV carries at most one video and one audio track, so tracks picks among those two. Outputs with a lower
+    priority lose their queue first when the BufferBudget runs out.
+    """
+
+    tracks: tuple[str, ...] = TRACKS
+    max_kbps: float | None = None
+    priority: int = 0
+
+    @classmethod
+    def from_url(cls, url: str) -> DestinationOptions:
+        _, _, fragment = url.partition("#")
+        options = parse_qs(fragment, keep_blank_values=True)
+        unknown = sorted(set(options) - set(cls._fields))
+        if unknown:  # a typo would otherwise look like an option that is in place
+            raise ValueError(f"unknown option {', '.join(unknown)}, use {', '.join(cls._fields)}: {url}")
+        tracks: tuple[str, ...] = TRACKS
+        if "tracks" in options:
+            tracks = tuple(track for track in TRACKS if track in options["tracks"][-1].split(","))
+            if not tracks:
+                raise ValueError(f"tracks has to include video and/or audio: {url}")
+        max_kbps = None
+        if "max_kbps" in options:
+            max_kbps = float(options["max_kbps"][-1])
+            if not math.isfinite(max_kbps) or max_kbps <= 0:
+                raise ValueError(f"max_kbps has to be a positive number: {url}")
+        priority = int(options["priority"][-1]) if "priority" in options else 0
+        return cls(tracks, max_kbps, priority)
+
+    @property
+    def video(self) -> bool:
+        return "video" in self.tracks
+
+    @property
+    def audio(self) -> bool:
+        return "audio" in self.tracks
+
+    def wants(self, tag: FlvTag) -> bool:
+        """Whether a tag belongs to a selected track, metadata always does."""
+        return (self.video or not tag.is_video) and (self.audio or not tag.is_audio)
+
+
+def strip_options(url: str) -> str:
+    """The url without its DestinationOptions, which is what ffmpeg gets."""
+    return url.partition("#")[0]
+
+
+class TokenBucket:
+    """Allows rate bytes per second on average, with bursts of up to capacity bytes.
+
+    take may overdraw the bucket, a tag can't be split; the debt is paid back before anything else passes.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float | None = None) -> float:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return self.tokens
+
+    def take(self, amount: float) -> None:
+        self.tokens -= amount
+
+
+class BufferBudget:
+    """A limit on the bytes queued for all outputs together, each output's share being an even split.
+
+    When a send doesn't fit, whole queues are evicted until it does: the lowest priority first, and among
+    equals the one furthest over its share. An output never evicts one with a higher priority; when it is
+    the one to go, its send is dropped too, and like with a full queue it rejoins on its next keyframe.
+    """
+
+    def __init__(
+        self, limit: int = DEFAULT_BUFFER_BUDGET, get_outputs: Callable[[], Iterable[Output]] = tuple
+    ) -> None:
+        self.limit = limit
+        self.get_outputs = get_outputs
+        self.used = 0
+        self.peak = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    @property
+    def share(self) -> int:
+        return self.limit // max(1, len(list(self.get_outputs())))
+
+    def reserve(self, output: Output, size: int) -> bool:
+        """Account for size more bytes queued for output, evicting others if needed. False if it can't be."""
+        while self.used + size > self.limit:
+            share = self.share
+            priority = output.options.priority
+            candidates = [
+                other
+                for other in self.get_outputs()
+                if other.buffered_bytes > 0 and other.options.priority <= priority
+            ]
+            if not candidates:
+                return False
+            victim = min(candidates, key=lambda other: (other.options.priority, share - other.buffered_bytes))
+            self.evictions += 1
+            self.evicted_bytes += victim.evict()
+            if victim is output:
+                return False
+        self.used += size
+        self.peak = max(self.peak, self.used)
+        return True
+
+    def release(self, size: int) -> None:
+        self.used -= size
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "used": self.used,
+            "peak": self.peak,
+            "share": self.share,
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+        }
+
+
+def can_join(tag: FlvTag, headers: list[FlvTag]) -> bool:
+    """Whether a decoder can start at this tag. Audio only streams can start on any audio frame."""
+    if tag.is_keyframe:
+        return True
+    return tag.is_audio and not tag.is_header and not any(header.is_video for header in headers)
+
+
+def _narrowed(
+    tags: list[FlvTag], data: bytes | None, kept: list[FlvTag]
+) -> tuple[list[FlvTag], bytes | None]:
+    """kept in place of tags, with the encoded data only still valid if nothing was dropped."""
+    return kept, data if len(kept) == len(tags) else None
+
+
+class Output:
+    """One destination, pushed by its own ffmpeg so that it can be restarted without touching the others.
+
+    The relay hands every output the same tags. An output that has just (re)started waits for the next
+    keyframe and sends the current decoder headers in front of it.
+
+    The ffmpeg reports its progress on stdout, which the watchdog uses to notice outputs that are alive but
+    frozen. resolve_url, if given, picks the url ffmpeg actually pushes to on every start, see
+    restreamlocal.presets.
+
+    Tracks that aren't selected (see DestinationOptions) are dropped before they reach ffmpeg. With
+    max_kbps, video that doesn't fit the cap is dropped up to the next keyframe that does, everything is
+    still stream copied.
+
+    Starting, joining the stream, ffmpeg's first progress report (it has connected) and the first bytes it
+    sent out are recorded in the tracer, see restreamlocal.trace.
+
+    With a buffer_budget, what is queued counts against that limit shared with the other outputs.
+    """
+
+    def __init__(
+        self,
+        ffmpeg_executable: str,
+        url: str,
+        get_headers: Callable[[], list[FlvTag]],
+        *,
+        queue_size: int = 1024,
+        resolve_url: Callable[[str], Awaitable[str]] | None = None,
+        tracer: Tracer | None = None,
+        buffer_budget: BufferBudget | None = None,
+    ) -> None:
+        self.ffmpeg_executable = ffmpeg_executable
+        self.url = url
+        self.options = DestinationOptions.from_url(url)
+        self.target_url = strip_options(url)
+        self.resolve_url = resolve_url
+        self.name = redact_url(self.target_url)
+        self.get_headers = get_headers
+        self.process: asyncio.subprocess.Process | None = None
+        self.joined = False
+        self.restarts = 0
+        self.dropped_tags = 0
+        self.filtered_bytes = 0  # tracks that weren't selected
+        self.capped_tags = 0  # video dropped to stay under max_kbps
+        self.capped_bytes = 0
+        self._bucket: TokenBucket | None = None
+        if self.options.max_kbps is not None:
+            rate = self.options.max_kbps * 1000 / 8
+            self._bucket = TokenBucket(rate, rate * CAP_BURST)
+        self._skipping_video = False
+        self.bytes_in = 0
+        self.recovery_times: list[float] = []  # seconds from a stall being detected to progress resuming
+        self.progress: dict[str, str] = {}
+        self.out_time_us = 0
+        self.total_size = 0
+        self.last_progress = time.monotonic()  # when out_time or total_size last went up
+        self.fed_since_progress = 0  # bytes handed to ffmpeg since then
+        self.stall_detected_at: float | None = None
+        self.started_at = 0.0
+        self.restarts_since_progress = 0
+        self.telemetry = OutputTelemetry()
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        self._connected = False  # since the last start, for the trace
+        self.buffer_budget = buffer_budget
+        self.buffered_bytes = 0  # in the queue
+        self.evictions = 0  # times the queue was dropped to make room in the budget
+        self._queue: asyncio.Queue[tuple[bytes, int]] = asyncio.Queue(queue_size)  # chunks & their tag count
+        self._tasks: list[asyncio.Task[Any]] = []
+
+    @property
+    def started(self) -> bool:
+        """Between start and stop, whether or not the ffmpeg is still alive."""
+        return self.process is not None
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def build_command(self) -> list[str]:
+        return [
+            self.ffmpeg_executable,
+            "-hide_banner",
+            "-loglevel",
+            "warning",
+            "-nostats",
+            "-progress",
+            "pipe:1",
+            "-f",
+            "flv",
+            "-i",
+            "pipe:0",
+            "-c",
+            "copy",  # no reencoding
+            *(["-map", "0:v?"] if self.options.video else []),
+            *(["-map", "0:a?"] if self.options.audio else []),
+            "-f",
+            "flv",
+            self.target_url,
+        ]
+
+    @property
+    def flv_header(self) -> bytes:
+        return build_flv_header(audio=self.options.audio, video=self.options.video)
+
+    def _select(self, tags: list[FlvTag]) -> list[FlvTag]:
+        kept = [tag for tag in tags if self.options.wants(tag)]
+        if len(kept) != len(tags):
+            dropped = (tag for tag in tags if not self.options.wants(tag))
+            self.filtered_bytes += sum(len(tag.data) + TAG_OVERHEAD for tag in dropped)
+        return kept
+
+    def _cap(self, tags: list[FlvTag]) -> list[FlvTag]:
+        """Drop the video the bucket has no room for, and everything depending on it."""
+        assert self._bucket is not None  # nosec
+        self._bucket.refill()
+        kept = []
+        for tag in tags:
+            size = len(tag.data) + TAG_OVERHEAD
+            if tag.is_video and not tag.is_header:
+                if (self._skipping_video and not tag.is_keyframe) or self._bucket.tokens <= 0:
+                    self._skipping_video = True
+                    self.capped_tags += 1
+                    self.capped_bytes += size
+                    continue
+                self._skipping_video = False
+            self._bucket.take(size)  # audio & headers always go, they're small and can't be skipped
+            kept.append(tag)
+        return kept
+
+    def send(self, tags: list[FlvTag], data: bytes | None = None) -> None:
+        """Queue tags for this output. Never blocks, a full queue means the output rejoins on a keyframe.
+
+        data is the tags already encoded, so that the relay only has to encode them once for every output.
+        """
+        if not self.running:
+            return
+        if self.options.tracks != TRACKS:
+            tags, data = _narrowed(tags, data, self._select(tags))
+        if not self.joined:
+            joined = self._join(tags)
+            if joined is None:
+                return
+            tags, data = joined, None
+        if self._bucket is not None:
+            tags, data = _narrowed(tags, data, self._cap(tags))
+        if tags:
+            self._enqueue(b"".join(tag.encode() for tag in tags) if data is None else data, len(tags))
+
+    def _join(self, tags: list[FlvTag]) -> list[FlvTag] | None:
+        """The tags from the first one a decoder can start at, behind the headers. None if there's none."""
+        headers = [header for header in self.get_headers() if self.options.wants(header)]
+        for index, tag in enumerate(tags):
+            if can_join(tag, headers):
+                self.joined = True
+                self.tracer.emit("output_join", self.name, key=self.url, timestamp=tag.timestamp)
+                return [header._replace(timestamp=tag.timestamp) for header in headers] + tags[index:]
+        return None
+
+    def _enqueue(self, data: bytes, tag_count: int) -> None:
+        """Queue encoded tags within the buffer budget, or drop them and rejoin on a keyframe."""
+        if self.buffer_budget is not None and not self.buffer_budget.reserve(self, len(data)):
+            if self.joined:  # nothing could be evicted, this send alone doesn't fit
+                print(f"[{self.name}] over the buffer budget, skipping to the next keyframe")
+                self.joined = False
+            self.dropped_tags += tag_count
+            return
+        try:
+            self._queue.put_nowait((data, tag_count))
+        except asyncio.QueueFull:
+            print(f"[{self.name}] falling behind, skipping to the next keyframe")
+            if self.buffer_budget is not None:
+                self.buffer_budget.release(len(data))
+            self.dropped_tags += tag_count + self._clear_queue()
+            self.joined = False
+            return
+        self.buffered_bytes += len(data)
+
+    def evict(self) -> int:
+        """Drop everything queued to make room in the budget, returns how many bytes that freed."""
+        freed = self.buffered_bytes
+        print(f"[{self.name}] evicted from the buffer budget, skipping to the next keyframe")
+        self.tracer.emit("output_evicted", self.name, bytes=freed)
+        self.dropped_tags += self._clear_queue()
+        self.joined = False
+        self.evictions += 1
+        return freed
+
+    def _dequeued(self, data: bytes) -> None:
+        self.buffered_bytes -= len(data)
+        if self.buffer_budget is not None:
+            self.buffer_budget.release(len(data))
+
+    def _clear_queue(self) -> int:
+        """Drop everything queued, returns how many tags that was."""
+        cleared = 0
+        while not self._queue.empty():
+            data, tag_count = self._queue.get_nowait()
+            self._dequeued(data)
+            cleared += tag_count
+        return cleared
+
+    async def _write_loop(self, process: asyncio.subprocess.Process) -> None:
+        assert process.stdin is not None  # nosec
+        process.stdin.write(self.flv_header)
+        try:
+            while True:
+                data, _ = await self._queue.get()
+                self._dequeued(data)
+                process.stdin.write(data)
+                self.bytes_in += len(data)
+                self.fed_since_progress += len(data)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the watchdog notices the process exit
+
+    def _update_progress(self, progress: dict[str, str]) -> None:
+        self.progress = progress
+        if not self._connected:
+            self._connected = True  # ffmpeg only reports progress once its output is open
+            self.tracer.emit("output_connect", self.name, key=self.url)
+        try:
+            out_time_us = int(progress.get("out_time_us", "0"))
+            total_size = int(progress.get("total_size", "0"))
+        except ValueError:  # N/A before the first packet
+            return
+        if total_size > 0 and self.total_size == 0:
+            self.tracer.emit("output_first_byte", self.name, key=self.url, total_size=total_size)
+        if out_time_us > self.out_time_us or total_size > self.total_size:
+            self.last_progress = time.monotonic()
+            self.fed_since_progress = 0
+            self.restarts_since_progress = 0
+            if self.stall_detected_at is not None:
+                self.recovery_times.append(self.last_progress - self.stall_detected_at)
+                self.stall_detected_at = None
+        self.out_time_us = max(out_time_us, self.out_time_us)
+        self.total_size = max(total_size, self.total_size)
+
+    async def _progress_loop(self, process: asyncio.subprocess.Process) -> None:
+        assert process.stdout is not None  # nosec
+        progress: dict[str, str] = {}
+        async for line in process.stdout:
+            key, _, value = line.decode(errors="replace").strip().partition("=")
+            progress[key] = value
+            if key == "progress":  # last line of each block
+                self._update_progress(progress)
+                progress = {}
+
+    async def start(self) -> None:
+        print(f"Starting output {self.name}")
+        self.tracer.emit("output_start", self.name, key=self.url, restarts=self.restarts)
+        self.joined = False
+        self._connected = False
+        self._skipping_video = False
+        self._clear_queue()
+        # progress restarts from zero with the new process
+        self.out_time_us = 0
+        self.total_size = 0
+        self.last_progress = self.started_at = time.monotonic()
+        self.fed_since_progress = 0
+        if self.resolve_url is not None:
+            self.target_url = await self.resolve_url(strip_options(self.url))
+        self.process = await asyncio.create_subprocess_exec(
+            *self.build_command(),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        self._tasks = [
+            asyncio.create_task(self._write_loop(self.process)),
+            asyncio.create_task(self._progress_loop(self.process)),
+            asyncio.create_task(print_stderr(self.process, self.name)),
+        ]
+
+    async def stop(self, grace: float = 0.0) -> None:
+        if self.process is None:
+            return
+        self._tasks[0].cancel()  # the writer, the other two end with the process
+        await stop_process(self.process, grace)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.process = None
+        self._clear_queue()  # gives its share of the buffer budget back
+        self.tracer.emit("output_stop", self.name)
+
+    async def restart(self) -> None:
+        self.tracer.emit("output_restart", self.name, stalled=self.running, restarts=self.restarts + 1)
+        self.restarts += 1
+        self.restarts_since_progress += 1
+        await self.stop()
+        await self.start()
+
+    def sample(self) -> None:
+        """Record the current bitrate, fps & queue depth in the telemetry history."""
+        if self.running:
+            bitrate = parse_rate(self.progress.get("bitrate", ""))
+            fps = parse_rate(self.progress.get("fps", ""))
+            self.telemetry.append(bitrate, fps, self.queue_depth)
+        else:
+            self.telemetry.append(0, 0, 0)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "url": self.name,
+            "target": redact_url(self.target_url),
+            "running": self.running,
+            "restarts": self.restarts,
+            "dropped_tags": self.dropped_tags,
+            "tracks": list(self.options.tracks),
+            "max_kbps": self.options.max_kbps,
+            "priority": self.options.priority,
+            "buffered_bytes": self.buffered_bytes,
+            "buffer_share": self.buffer_budget.share if self.buffer_budget is not None else None,
+            "evictions": self.evictions,
+            "filtered_bytes": self.filtered_bytes,
+            "capped_tags": self.capped_tags,
+            "capped_bytes": self.capped_bytes,
+            "queue_depth": self.queue_depth,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.total_size,
+            "out_time": self.out_time_us / 1_000_000,
+            "bitrate": self.progress.get("bitrate", "N/A"),
+            "fps": self.progress.get("fps", "N/A"),
+            "recovery_times": list(self.recovery_times),
+        }
+
+
+__all__ = (
+    "DEFAULT_BUFFER_BUDGET",
+    "BufferBudget",
+    "DestinationOptions",
+    "Output",
+    "TokenBucket",
+    "can_join",
+    "print_stderr",
+    "print_stream",
+    "redact_url",
+    "stop_process",
+    "strip_options",
+)
@@ -0,0 +1,184 @@
+"""Playout for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+import mmap
+from contextlib import aclosing
+from pathlib import Path
+from typing import AsyncGenerator
+from typing import Generator
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+from urllib.parse import urlsplit
+
+from .flv import FLV_HEADER_SIZE
+from .flv import PREVIOUS_TAG_SIZE
+from .flv import TAG_HEADER_SIZE
+from .flv import FlvTag
+from .flv import check_flv_header
+from .flv import iter_flv_tags
+from .flv import read_flv_tags
+from .output import print_stderr
+from .output import stop_process
+
+
+# A recording can stand in for the ingest: file:///path/to/recording.flv?loop=1 as the relay's ingest url.
+# FLV is read straight out of an mmap, a window of READ_AHEAD bytes is prefetched ahead of playback and
+# what has been played is dropped again, so memory stays flat however large the file. Anything else (MP4)
+# is remuxed to FLV by ffmpeg, and since playback is paced, the pipe keeps ffmpeg from reading ahead.
+FILE_SCHEME = "file"
+READ_AHEAD = 8 * 2**20
+DEFAULT_FRAME_GAP = 33  # ms between passes of a looped file
+
+
+def is_file_url(url: str) -> bool:
+    return url.startswith(f"{FILE_SCHEME}://")
+
+
+def build_file_url(path: Path, loop: bool = False) -> str:
+    return Path(path).absolute().as_uri() + ("?loop=1" if loop else "")
+
+
+def parse_file_url(url: str) -> tuple[Path, bool]:
+    """The path & whether to loop of a file:// url."""
+    parts = urlsplit(url)
+    if parts.scheme != FILE_SCHEME:
+        raise ValueError(f"Not a {FILE_SCHEME}:// url: {url}")
+    path = unquote(parts.path)
+    if len(path) > 2 and path[0] == "/" and path[2] == ":":  # file:///C:/...
+        path = path[1:]
+    loop = parse_qs(parts.query).get("loop", ["0"])[-1] not in ("0", "false", "")
+    return Path(path), loop
+
+
+def _advise(mapped: mmap.mmap, option: str, start: int, length: int) -> None:
+    """madvise where there is one (not on Windows), a hint the OS is free to ignore anyway."""
+    advice = getattr(mmap, option, None)
+    start -= start % mmap.PAGESIZE  # the start has to be page aligned
+    length = min(length, len(mapped) - start)
+    if advice is not None and hasattr(mapped, "madvise") and length > 0:
+        mapped.madvise(advice, start, length)
+
+
+def iter_mapped_flv(mapped: mmap.mmap, read_ahead: int = READ_AHEAD) -> Generator[FlvTag, None, None]:
+    """The tags of an mmap'd FLV file, with bounded read-ahead. A truncated final tag is ignored."""
+    _advise(mapped, "MADV_SEQUENTIAL", 0, len(mapped))
+    view = memoryview(mapped)
+    tags = iter_flv_tags(view)
+    try:
+        offset = check_flv_header(view[:FLV_HEADER_SIZE]) + PREVIOUS_TAG_SIZE
+        released = 0  # everything before this has been played and dropped
+        prefetched = 0  # everything before this has been asked for
+        for tag in tags:
+            if offset + read_ahead // 2 >= prefetched:
+                _advise(mapped, "MADV_WILLNEED", prefetched, read_ahead)
+                prefetched += read_ahead
+            if offset - released >= read_ahead:
+                # the mapping is read only, dropped pages are simply read from the file again if needed
+                _advise(mapped, "MADV_DONTNEED", released, offset - released - mmap.PAGESIZE)
+                released = offset - mmap.PAGESIZE
+            yield tag
+            offset += TAG_HEADER_SIZE + len(tag.data) + PREVIOUS_TAG_SIZE
+    finally:
+        tags.close()
+        view.release()
+
+
+async def read_file_tags(path: Path, ffmpeg_executable: str) -> AsyncGenerator[FlvTag, None]:
+    """Every tag of a file, once, as fast as they are asked for. Not FLV files are remuxed by ffmpeg."""
+    with open(path, "rb") as file:
+        is_flv = file.read(3) == b"FLV"
+        if is_flv:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                tags = iter_mapped_flv(mapped)
+                try:
+                    for tag in tags:
+                        yield tag
+                finally:
+                    tags.close()
+            return
+    process = await asyncio.create_subprocess_exec(
+        ffmpeg_executable,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-i",
+        str(path),
+        "-c",
+        "copy",
+        "-map",
+        "0:v:0?",
+        "-map",
+        "0:a:0?",
+        "-f",
+        "flv",
+        "pipe:1",
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stderr_task = asyncio.create_task(print_stderr(process, "playout"))
+    assert process.stdout is not None  # nosec
+    try:
+        async for tag in read_flv_tags(process.stdout):
+            yield tag
+    finally:
+        await stop_process(process)
+        await stderr_task
+
+
+async def play_file(
+    path: Path, ffmpeg_executable: str, *, loop: bool = False, speed: float = 1.0
+) -> AsyncGenerator[FlvTag, None]:
+    """The tags of a file at real time pace (or speed times that), forever if loop.
+
+    Each pass of a looped file continues the timestamps of the one before.
+    """
+    event_loop = asyncio.get_running_loop()
+    start = event_loop.time()
+    base = 0
+    while True:
+        first: int | None = None
+        last = 0
+        async with aclosing(read_file_tags(path, ffmpeg_executable)) as tags:
+            async for tag in tags:
+                if first is None:
+                    first = tag.timestamp
+                timestamp = base + tag.timestamp - first
+                last = max(last, timestamp)
+                delay = start + timestamp / 1000 / speed - event_loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield tag._replace(timestamp=timestamp)
+        if not loop or first is None:
+            return
+        base = last + DEFAULT_FRAME_GAP
+
+
+__all__ = (
+    "FILE_SCHEME",
+    "READ_AHEAD",
+    "build_file_url",
+    "is_file_url",
+    "iter_mapped_flv",
+    "parse_file_url",
+    "play_file",
+    "read_file_tags",
+)
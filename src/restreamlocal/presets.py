@@ -0,0 +1,235 @@
+"""Presets for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import socket
+import ssl
+import time
+from typing import Any
+from typing import Mapping
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+
+# A destination like auto://twitch/KEY is pushed to whichever of the preset's ingest servers answers an
+# RTMP handshake the fastest. Choices are cached for ttl seconds and re-measured in the background, and an
+# output only picks up a new choice when it (re)connects, so a refresh never interrupts a running stream.
+AUTO_SCHEME = "auto"
+DEFAULT_TTL = 3600.0
+DEFAULT_TIMEOUT = 3.0
+DEFAULT_ATTEMPTS = 3  # the fastest of these counts, one slow handshake shouldn't rule a server out
+
+_DEFAULT_PORTS = {"rtmp": 1935, "rtmps": 443}
+_C1_SIZE = 1536
+_S0_S1_SIZE = 1 + 1536
+
+
+class Preset(NamedTuple):
+    name: str
+    candidates: tuple[str, ...]  # ingest urls, without the stream key
+
+
+PRESETS = {
+    preset.name: preset
+    for preset in (
+        Preset(
+            "twitch",
+            (
+                "rtmp://ingest.global-contribute.live-video.net/app",
+                "rtmp://iad05.contribute.live-video.net/app",
+                "rtmp://sea02.contribute.live-video.net/app",
+                "rtmp://fra05.contribute.live-video.net/app",
+                "rtmp://lhr08.contribute.live-video.net/app",
+                "rtmp://sao03.contribute.live-video.net/app",
+                "rtmp://syd03.contribute.live-video.net/app",
+                "rtmp://tyo05.contribute.live-video.net/app",
+            ),
+        ),
+        Preset("youtube", ("rtmp://a.rtmp.youtube.com/live2",)),
+    )
+}
+
+
+class Selection(NamedTuple):
+    url: str
+    rtts: dict[str, float]  # seconds, inf for candidates that didn't answer
+    measured_at: float  # time.monotonic()
+
+
+def is_auto_url(url: str) -> bool:
+    return url.startswith(f"{AUTO_SCHEME}://")
+
+
+def build_auto_url(preset: str, stream_key: str = "") -> str:
+    return f"{AUTO_SCHEME}://{preset}" + (f"/{stream_key}" if stream_key else "")
+
+
+def split_auto_url(url: str) -> tuple[str, str]:
+    """auto://preset/rest into the preset name and the rest, usually the stream key."""
+    if not is_auto_url(url):
+        raise ValueError(f"Not an {AUTO_SCHEME}:// url: {url}")
+    preset, _, rest = url[len(AUTO_SCHEME) + 3 :].partition("/")
+    return preset, rest
+
+
+async def measure_rtt(
+    url: str, timeout: float = DEFAULT_TIMEOUT, attempts: int = DEFAULT_ATTEMPTS
+) -> float:
+    """The fastest of attempts RTMP handshakes with an ingest server in seconds, inf if it never answered.
+
+    The name is resolved once up front, so only the connection and handshake are timed: C0+C1 out and S0+S1
+    back, the first exchange of every RTMP session. rtmps connections include the TLS handshake.
+    """
+    parts = urlsplit(url)
+    if parts.hostname is None:
+        return math.inf
+    port = parts.port or _DEFAULT_PORTS.get(parts.scheme, 1935)
+    tls = ssl.create_default_context() if parts.scheme == "rtmps" else None
+    loop = asyncio.get_running_loop()
+    try:
+        addresses = await asyncio.wait_for(
+            loop.getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM), timeout
+        )
+    except (OSError, asyncio.TimeoutError):
+        return math.inf
+    address = str(addresses[0][4][0])  # the host of an IPv4 or IPv6 sockaddr
+    best = math.inf
+    for _ in range(attempts):
+        start = time.perf_counter()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    address, port, ssl=tls, server_hostname=parts.hostname if tls else None
+                ),
+                timeout,
+            )
+            writer.write(b"\x03" + bytes(8) + os.urandom(_C1_SIZE - 8))
+            await asyncio.wait_for(reader.readexactly(_S0_S1_SIZE), timeout)
+            best = min(best, time.perf_counter() - start)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if writer is not None:
+                writer.close()
+    return best
+
+
+class IngestSelector:
+    """Picks the nearest ingest server for auto:// destinations, see measure_rtt.
+
+    All candidates of a preset are measured in parallel. Outputs starting together share one measurement,
+    and run refreshes every preset in use in the background so that a reconnecting output never waits.
+    """
+
+    def __init__(
+        self,
+        presets: Mapping[str, Preset] = PRESETS,
+        *,
+        ttl: float = DEFAULT_TTL,
+        timeout: float = DEFAULT_TIMEOUT,
+        attempts: int = DEFAULT_ATTEMPTS,
+    ) -> None:
+        self.presets = presets
+        self.ttl = ttl
+        self.timeout = timeout
+        self.attempts = attempts
+        self.selections: dict[str, Selection] = {}
+        self._measuring: dict[str, asyncio.Task[Selection]] = {}
+
+    async def _measure(self, name: str) -> Selection:
+        candidates = self.presets[name].candidates
+        rtts = await asyncio.gather(
+            *(measure_rtt(candidate, self.timeout, self.attempts) for candidate in candidates)
+        )
+        # min keeps the first candidate when nothing answers, the output's retries will find out why
+        rtt, url = min(zip(rtts, candidates), key=lambda pair: pair[0])
+        if math.isinf(rtt):
+            print(f"No {name} ingest server answered, using {url}")
+        else:
+            print(f"Using {url} for {name}, {rtt * 1000:.0f}ms")
+        selection = Selection(url, dict(zip(candidates, rtts)), time.monotonic())
+        self.selections[name] = selection
+        return selection
+
+    async def measure(self, name: str) -> Selection:
+        """Measure a preset now, joining a measurement that is already running."""
+        task = self._measuring.get(name)
+        if task is None:
+            task = self._measuring[name] = asyncio.create_task(self._measure(name))
+            task.add_done_callback(lambda _: self._measuring.pop(name, None))
+        return await asyncio.shield(task)
+
+    async def select(self, name: str) -> str:
+        """The preset's fastest ingest url, measured if there is no choice younger than ttl."""
+        selection = self.selections.get(name)
+        if selection is None or time.monotonic() - selection.measured_at >= self.ttl:
+            selection = await self.measure(name)
+        return selection.url
+
+    async def resolve(self, url: str) -> str:
+        """The url to push to: auto:// urls get the preset's ingest url, anything else is returned as is."""
+        if not is_auto_url(url):
+            return url
+        name, rest = split_auto_url(url)
+        if name not in self.presets:
+            print(f"Unknown ingest preset {name}, known are {', '.join(self.presets)}")
+            return url  # ffmpeg fails on it, and the watchdog reports that like any bad url
+        ingest_url = await self.select(name)
+        return f"{ingest_url}/{rest}" if rest else ingest_url
+
+    async def run(self) -> None:
+        """Re-measure the presets in use before their choices expire, until cancelled."""
+        while True:
+            now = time.monotonic()
+            expiring = [
+                name
+                for name, selection in self.selections.items()
+                if now - selection.measured_at >= self.ttl * 0.9
+            ]
+            await asyncio.gather(*(self.measure(name) for name in expiring))
+            await asyncio.sleep(max(self.ttl * 0.1, 0.01))
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        return {
+            name: {
+                "url": selection.url,
+                "rtts": {url: None if math.isinf(rtt) else rtt for url, rtt in selection.rtts.items()},
+                "age": now - selection.measured_at,
+            }
+            for name, selection in self.selections.items()
+        }
+
+
+__all__ = (
+    "AUTO_SCHEME",
+    "DEFAULT_TTL",
+    "IngestSelector",
+    "PRESETS",
+    "Preset",
+    "Selection",
+    "build_auto_url",
+    "is_auto_url",
+    "measure_rtt",
+    "split_auto_url",
+)
@@ -0,0 +1,246 @@
+"""Preview for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import io
+import multiprocessing
+import struct
+import subprocess  # nosec
+import threading
+import time
+from multiprocessing.shared_memory import SharedMemory
+from multiprocessing.synchronize import Event
+from typing import NamedTuple
+
+
+# The preview pulls the ingest itself, in its own process, so decoding never competes with the relay's
+# event loop. Frames come back through shared memory guarded by a sequence lock: the writer makes the
+# sequence number odd, copies the frame in, then makes it even again. A reader that sees an odd number, or a
+# different number after copying, tries again on its next poll.
+PREVIEW_WIDTH = 320
+PREVIEW_HEIGHT = 180
+DEFAULT_PREVIEW_FPS = 1.0
+RETRY_INTERVAL = 1.0
+
+_HEADER = struct.Struct("<Qd")  # sequence number, time.time() the frame was written
+FRAME_OFFSET = _HEADER.size
+
+
+class PreviewFrame(NamedTuple):
+    sequence: int
+    timestamp: float
+    width: int
+    height: int
+    rgb: bytes
+
+    def to_ppm(self) -> bytes:
+        """The frame as a binary PPM, which tk.PhotoImage can load without any extra dependencies."""
+        return b"P6 %d %d 255\n" % (self.width, self.height) + self.rgb
+
+
+def build_preview_command(
+    ffmpeg_executable: str,
+    url: str,
+    max_fps: float = DEFAULT_PREVIEW_FPS,
+    width: int = PREVIEW_WIDTH,
+    height: int = PREVIEW_HEIGHT,
+) -> list[str]:
+    return [
+        ffmpeg_executable,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-skip_frame",
+        "nokey",  # only decode keyframes, everything else is skipped before decoding
+        "-i",
+        url,
+        "-an",
+        "-vf",
+        f"fps={max_fps},scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2",
+        "-f",
+        "rawvideo",
+        "-pix_fmt",
+        "rgb24",
+        "pipe:1",
+    ]
+
+
+def write_frame(buffer: memoryview, frame: bytes | bytearray) -> None:
+    """Publish a frame into a preview shared memory buffer."""
+    sequence, _ = _HEADER.unpack_from(buffer)
+    _HEADER.pack_into(buffer, 0, sequence + 1, 0.0)  # odd, readers back off
+    buffer[FRAME_OFFSET : FRAME_OFFSET + len(frame)] = frame
+    _HEADER.pack_into(buffer, 0, sequence + 2, time.time())
+
+
+def read_frame(buffer: memoryview, frame_size: int) -> tuple[int, float, bytes] | None:
+    """Read the latest frame, or None if there is none yet or the writer was halfway through one."""
+    sequence, timestamp = _HEADER.unpack_from(buffer)
+    if sequence == 0 or sequence % 2:
+        return None
+    frame = bytes(buffer[FRAME_OFFSET : FRAME_OFFSET + frame_size])
+    if _HEADER.unpack_from(buffer)[0] != sequence:
+        return None
+    return sequence, timestamp, frame
+
+
+def shared_buffer(shared_memory: SharedMemory) -> memoryview:
+    buffer = shared_memory.buf
+    assert buffer is not None  # nosec, it is only None once closed
+    return buffer
+
+
+def _read_frame(stdout: io.BufferedReader, view: memoryview) -> bool:
+    """Fill view with the next frame, False if ffmpeg exited before a whole one."""
+    filled = 0
+    while filled < len(view):
+        read = stdout.readinto(view[filled:])
+        if not read:
+            return False
+        filled += read
+    return True
+
+
+def run_preview(
+    command: list[str],
+    shared_memory_name: str,
+    frame_size: int,
+    stop_event: Event,
+) -> None:
+    """The preview process: runs ffmpeg, and copies each frame it decodes into shared memory."""
+    shared_memory = SharedMemory(shared_memory_name)
+    frame = bytearray(frame_size)
+    view = memoryview(frame)
+    lock = threading.Lock()
+    process: subprocess.Popen[bytes] | None = None
+
+    def kill_on_stop() -> None:
+        # ffmpeg can sit in a read for a long time (no ingest, 1 fps), don't make stop wait for it
+        stop_event.wait()
+        with lock:
+            if process is not None:
+                process.kill()
+
+    threading.Thread(target=kill_on_stop, daemon=True).start()
+    try:
+        while not stop_event.is_set():
+            with lock:
+                process = subprocess.Popen(  # nosec
+                    command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+                )
+                if stop_event.is_set():  # kill_on_stop may have looked before this child existed
+                    process.kill()
+            stdout = process.stdout
+            assert isinstance(stdout, io.BufferedReader)  # nosec
+            try:
+                while not stop_event.is_set():
+                    if not _read_frame(stdout, view):
+                        break  # ffmpeg exited, usually because there is no ingest yet
+                    write_frame(shared_buffer(shared_memory), frame)
+            finally:
+                with lock:
+                    process.kill()
+                    process.wait()
+            stop_event.wait(RETRY_INTERVAL)
+    finally:
+        del view
+        shared_memory.close()
+
+
+class Preview:
+    """A low rate keyframe preview of a stream, decoded in a child process.
+
+    The child pulls the stream on its own, so the relay never waits on it, and hands frames back through
+    shared memory, so the window only copies 170KB when there is a new frame. Poll latest from the UI
+    thread.
+    """
+
+    def __init__(
+        self,
+        ffmpeg_executable: str,
+        url: str,
+        *,
+        max_fps: float = DEFAULT_PREVIEW_FPS,
+        width: int = PREVIEW_WIDTH,
+        height: int = PREVIEW_HEIGHT,
+    ) -> None:
+        self.command = build_preview_command(ffmpeg_executable, url, max_fps, width, height)
+        self.width = width
+        self.height = height
+        self.frame_size = width * height * 3
+        self._shared_memory: SharedMemory | None = None
+        self._process: multiprocessing.Process | None = None
+        self._stop_event: Event | None = None
+        self._last_sequence = 0
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def start(self) -> None:
+        self.stop()
+        self._shared_memory = SharedMemory(create=True, size=FRAME_OFFSET + self.frame_size)
+        _HEADER.pack_into(shared_buffer(self._shared_memory), 0, 0, 0.0)
+        self._stop_event = multiprocessing.Event()
+        self._process = multiprocessing.Process(
+            target=run_preview,
+            args=(self.command, self._shared_memory.name, self.frame_size, self._stop_event),
+            name="restreamlocal-preview",
+            daemon=True,
+        )
+        self._process.start()
+        self._last_sequence = 0
+
+    def latest(self) -> PreviewFrame | None:
+        """The newest frame, or None if there is nothing new since the last call."""
+        if self._shared_memory is None:
+            return None
+        result = read_frame(shared_buffer(self._shared_memory), self.frame_size)
+        if result is None or result[0] == self._last_sequence:
+            return None
+        self._last_sequence, timestamp, rgb = result
+        return PreviewFrame(self._last_sequence // 2, timestamp, self.width, self.height, rgb)
+
+    def stop(self, timeout: float = 2.0) -> None:
+        if self._process is not None:
+            assert self._stop_event is not None  # nosec
+            self._stop_event.set()
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.kill()
+                self._process.join()
+            self._process = None
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            self._shared_memory.unlink()
+            self._shared_memory = None
+
+
+__all__ = (
+    "DEFAULT_PREVIEW_FPS",
+    "PREVIEW_HEIGHT",
+    "PREVIEW_WIDTH",
+    "Preview",
+    "PreviewFrame",
+    "build_preview_command",
+    "read_frame",
+    "shared_buffer",
+    "write_frame",
+)
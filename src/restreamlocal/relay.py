@@ -0,0 +1,607 @@
+"""Relay for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import socket
+import tempfile
+import time
+from contextlib import aclosing
+from pathlib import Path
+from typing import Any
+from typing import AsyncIterator
+from typing import Iterable
+from typing import NamedTuple
+
+from .cascade import TapOutput
+from .cascade import authenticate_link
+from .cascade import create_output
+from .cascade import is_link_url
+from .cascade import link_token
+from .cascade import parse_link_url
+from .flv import TAG_TYPE_VIDEO
+from .flv import FlvError
+from .flv import FlvTag
+from .flv import iter_flv_tags
+from .flv import parse_metadata
+from .flv import read_flv_tags
+from .output import BufferBudget
+from .output import Output
+from .output import print_stderr
+from .output import stop_process
+from .playout import is_file_url
+from .playout import parse_file_url
+from .playout import play_file
+from .presets import IngestSelector
+from .telemetry import DEFAULT_SAMPLE_INTERVAL
+from .trace import Tracer
+from .watchdog import DEFAULT_STALL_TIMEOUT
+from .watchdog import Watchdog
+
+
+# The relay pulls the ingest out of MonaServer as FLV on a pipe instead of letting ffmpeg read it directly.
+# That way, when the encoder drops, only the pull dies, and we can keep feeding the outputs ourselves.
+LIVE = "live"
+BACKUP = "backup"  # a second encoder publishing the same channel, used while the primary (LIVE) is stalled
+FILLER = "filler"
+
+DEFAULT_FRAME_GAP = 33  # ms, used to space out a splice until we've seen the real frame rate
+START_BATCH_SIZE = 16  # outputs spawned per loop iteration, spawning hundreds at once stalls the event loop
+DEFAULT_FAILOVER_TIMEOUT = 1.0  # seconds without a tag from the primary before we move to the backup
+
+
+class Splicer:
+    """Merges tags from several sources into a single continuous FLV timeline.
+
+    Only one source is active at a time. Switching is requested with switch_to and takes effect on the
+    requested source's next keyframe, so the outputs never see a partial GOP. Timestamps are rewritten so
+    that they keep increasing across switches, and the decoder headers of the new source are re-sent right
+    before its first keyframe.
+    """
+
+    def __init__(self) -> None:
+        self.active: str | None = None
+        self.pending: str | None = None
+        self.switches = 0
+        self._offset = 0
+        self._last_out = -1
+        self._last_by_type: dict[int, int] = {}
+        self._frame_gap = DEFAULT_FRAME_GAP
+        self._last_video_in: int | None = None
+        self._headers: dict[str, dict[tuple[int, bool], FlvTag]] = {}
+
+    def switch_to(self, source: str) -> None:
+        """Request a switch. Requesting the active source rebases it on its next keyframe."""
+        self.pending = source
+
+    def headers(self, source: str | None = None) -> list[FlvTag]:
+        """The latest metadata & sequence headers seen from a source (the active one by default)."""
+        source = self.active if source is None else source
+        if source is None:
+            return []
+        return list(self._headers.get(source, {}).values())
+
+    def _retime(self, tag: FlvTag) -> FlvTag:
+        timestamp = max(tag.timestamp + self._offset, self._last_by_type.get(tag.tag_type, 0), 0)
+        self._last_by_type[tag.tag_type] = timestamp
+        self._last_out = max(self._last_out, timestamp)
+        return tag._replace(timestamp=timestamp)
+
+    def _is_switch_point(self, source: str, tag: FlvTag) -> bool:
+        if tag.is_keyframe:
+            return True
+        # audio only sources have no keyframes, any audio frame will do
+        has_video = any(key[0] == TAG_TYPE_VIDEO for key in self._headers.get(source, {}))
+        return tag.is_audio and not tag.is_header and not has_video
+
+    def push(self, source: str, tag: FlvTag) -> list[FlvTag]:
+        """Feed a tag from a source, returns the tags that should be sent to the outputs."""
+        if tag.is_header:
+            self._headers.setdefault(source, {})[(tag.tag_type, tag.is_script)] = tag
+            if source == self.active and source != self.pending:
+                return [self._retime(tag)]
+            return []
+
+        if source == self.pending and self._is_switch_point(source, tag):
+            self.active = source
+            self.pending = None
+            self.switches += 1
+            self._offset = self._last_out + self._frame_gap - tag.timestamp
+            self._last_video_in = None
+            return [self._retime(header._replace(timestamp=tag.timestamp)) for header in self.headers()] + [
+                self._retime(tag)
+            ]
+
+        if source != self.active or source == self.pending:
+            return []
+
+        if tag.is_video:
+            if self._last_video_in is not None and 0 < tag.timestamp - self._last_video_in < 1000:
+                self._frame_gap = tag.timestamp - self._last_video_in
+            self._last_video_in = tag.timestamp
+        return [self._retime(tag)]
+
+
+class SlateParams(NamedTuple):
+    """Codec parameters the filler has to match so that the outputs can stream copy it."""
+
+    width: int = 1280
+    height: int = 720
+    framerate: int = 30
+    sample_rate: int = 44100
+    stereo: bool = True
+
+    @classmethod
+    def from_metadata(cls, metadata: dict[str, Any]) -> SlateParams:
+        defaults = cls()
+
+        def number(key: str, default: int) -> int:
+            value = metadata.get(key)
+            return int(value) if isinstance(value, (int, float)) and value > 0 else default
+
+        return cls(
+            width=number("width", defaults.width) // 2 * 2,  # yuv420p needs even dimensions
+            height=number("height", defaults.height) // 2 * 2,
+            framerate=number("framerate", defaults.framerate),
+            sample_rate=number("audiosamplerate", defaults.sample_rate),
+            stereo=bool(metadata.get("stereo", defaults.stereo)),
+        )
+
+
+def build_slate_command(ffmpeg_executable: str, params: SlateParams, output: Path) -> list[str]:
+    # one second, one keyframe at the very start so we can join on any loop boundary
+    return [
+        ffmpeg_executable,
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-y",
+        "-f",
+        "lavfi",
+        "-i",
+        f"color=c=black:s={params.width}x{params.height}:r={params.framerate}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"anullsrc=r={params.sample_rate}:cl={'stereo' if params.stereo else 'mono'}",
+        "-t",
+        "1",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-tune",
+        "stillimage",
+        "-pix_fmt",
+        "yuv420p",
+        "-g",
+        str(params.framerate),
+        "-bf",
+        "0",
+        "-c:a",
+        "aac",
+        "-b:a",
+        "64k",
+        "-f",
+        "flv",
+        str(output),
+    ]
+
+
+async def get_slate_tags(ffmpeg_executable: str, params: SlateParams) -> list[FlvTag]:
+    """Returns the tags of a pre-encoded filler clip, encoding it first if it isn't cached yet."""
+    slate_dir = Path(tempfile.gettempdir()) / "restreamlocal" / "slates"
+    slate_dir.mkdir(exist_ok=True, parents=True)
+    name = hashlib.sha1(repr(tuple(params)).encode(), usedforsecurity=False).hexdigest()[:16]
+    slate_file = slate_dir / f"{name}.flv"
+    if not slate_file.exists():
+        partial_file = slate_file.with_suffix(".part")
+        process = await asyncio.create_subprocess_exec(
+            *build_slate_command(ffmpeg_executable, params, partial_file),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await process.communicate()
+        finally:
+            await stop_process(process)  # if we were cancelled, e.g. the relay stopped while encoding
+        if process.returncode != 0:
+            raise RuntimeError(f"Could not encode slate: {stderr.decode(errors='replace')}")
+        partial_file.replace(slate_file)
+    return list(iter_flv_tags(slate_file.read_bytes()))
+
+
+class Relay:
+    """Pulls the ingest and fans it out to one output per destination.
+
+    With a backup_ingest_url, a second encoder can publish the same channel. The relay moves to it when the
+    primary sends nothing for failover_timeout seconds, and back to the primary once it is flowing again,
+    each time on the new source's next keyframe.
+
+    An ingest url of the form restreamlocal://host:port makes the relay listen there for an upstream
+    instance instead, see restreamlocal.cascade. A file:// ingest url plays a recording at real time pace,
+    see restreamlocal.playout.
+
+    When hold is enabled and every ingest drops, a black & silent filler matching the source's codec
+    parameters is sent instead, so the destinations never see the stream end. The relay switches back to
+    the real source on its first keyframe after it reconnects.
+
+    A watchdog restarts any single output whose ffmpeg exits or stops making progress for stall_timeout
+    seconds. Every sample_interval seconds, each output's bitrate, fps & queue depth go into its telemetry.
+    auto:// destinations are pushed to the nearest of their preset's ingest servers, see IngestSelector.
+
+    Every output's queue counts against buffer_budget, by default one of the relay's own, see BufferBudget.
+    Taps get the same stream without being destinations, the preview of a link or playout uses one.
+
+    Starting & stopping, ingests connecting, stalling & dropping, their first keyframe and every switch of
+    source go into the tracer, along with the outputs' own events, see restreamlocal.trace.
+    """
+
+    def __init__(
+        self,
+        ffmpeg_executable: str,
+        ingest_url: str,
+        destination_urls: Iterable[str] = (),
+        *,
+        backup_ingest_url: str | None = None,
+        hold: bool = True,
+        retry_interval: float = 1.0,
+        read_timeout: float = 5.0,
+        stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+        failover_timeout: float = DEFAULT_FAILOVER_TIMEOUT,
+        sample_interval: float = DEFAULT_SAMPLE_INTERVAL,
+        ingest_selector: IngestSelector | None = None,
+        tracer: Tracer | None = None,
+        buffer_budget: BufferBudget | None = None,
+    ) -> None:
+        self.ffmpeg_executable = ffmpeg_executable
+        self.ingest_urls = {LIVE: ingest_url}
+        if backup_ingest_url is not None:
+            self.ingest_urls[BACKUP] = backup_ingest_url
+        self.hold = hold
+        self.retry_interval = retry_interval
+        self.read_timeout = read_timeout
+        self.failover_timeout = failover_timeout
+        self.sample_interval = sample_interval
+        # from the last tag of a stalled source to the first of the next
+        self.failover_times: list[float] = []
+        self.splicer = Splicer()
+        self.slate_params = SlateParams()
+        self.ingest_selector = ingest_selector if ingest_selector is not None else IngestSelector()
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        if buffer_budget is None:
+            buffer_budget = BufferBudget(get_outputs=lambda: self.outputs)
+        self.buffer_budget = buffer_budget
+        self.outputs = [self._create_output(url) for url in destination_urls]
+        self.taps: list[Output] = []  # fed like the outputs without being destinations, see add_tap
+        self.watchdog = Watchdog(lambda: self.outputs, stall_timeout)
+        self.running = False
+        self._stopping = asyncio.Event()
+        self._filler_task: asyncio.Task[None] | None = None
+        self._tasks: list[asyncio.Task[Any]] = []
+        self._connected: set[str] = set()
+        self.playout_done = asyncio.Event()  # set once a file ingest that doesn't loop has been played
+        self._last_tag_at: dict[str, float] = {}
+
+    @property
+    def destination_urls(self) -> list[str]:
+        return [output.url for output in self.outputs]
+
+    @property
+    def holding(self) -> bool:
+        """True while the outputs are being fed the filler."""
+        return self.splicer.active == FILLER
+
+    @property
+    def ingest_url(self) -> str:
+        return self.ingest_urls[LIVE]
+
+    def _create_output(self, url: str) -> Output:
+        return create_output(
+            self.ffmpeg_executable,
+            url,
+            self.splicer.headers,
+            resolve_url=self.ingest_selector.resolve,
+            tracer=self.tracer,
+            buffer_budget=self.buffer_budget,
+        )
+
+    def build_ingest_command(self, source: str = LIVE) -> list[str]:
+        return [
+            self.ffmpeg_executable,
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            "-i",
+            self.ingest_urls[source],
+            "-c",
+            "copy",
+            "-map",
+            "0",
+            "-f",
+            "flv",
+            "pipe:1",
+        ]
+
+    def _send(self, tags: list[FlvTag]) -> None:
+        if not tags or self._stopping.is_set():
+            return
+        data = b"".join(tag.encode() for tag in tags)
+        for output in self.outputs:
+            output.send(tags, data)
+        for tap in self.taps:
+            tap.send(tags, data)
+
+    def _live_restored(self) -> bool:
+        return self.splicer.active in self.ingest_urls and self.splicer.pending != FILLER
+
+    def _select_source(self, now: float) -> None:
+        """Switch to the first of primary & backup that is flowing, they are checked on every tag."""
+        for source in self.ingest_urls:
+            if source in self._connected and now - self._last_tag_at[source] < self.failover_timeout:
+                break
+        else:
+            return  # nothing is flowing, once the ingests time out we fall back to the filler
+        splicer = self.splicer
+        if source == splicer.active:
+            if splicer.pending is not None and splicer.pending != source:
+                print(f"Staying on the {source} ingest")
+                splicer.pending = None  # it recovered before the other source reached a keyframe
+        elif splicer.pending != source:
+            if splicer.active is not None and splicer.active != FILLER:
+                print(f"Switching to the {source} ingest")
+            splicer.switch_to(source)
+
+    def _handle_tag(self, source: str, tag: FlvTag) -> None:
+        now = time.monotonic()
+        self._last_tag_at[source] = now
+        self._select_source(now)
+        before = self.splicer.active
+        tags = self.splicer.push(source, tag)
+        if self.splicer.active != before:
+            self.tracer.emit("ingest_switch", source, previous=before)
+            silence = now - self._last_tag_at[before] if before in self.ingest_urls else 0.0
+            if silence >= self.failover_timeout:  # not when a recovered primary takes over again
+                self.failover_times.append(silence)
+        self._send(tags)
+
+    async def _run_filler(self) -> None:
+        try:
+            tags = await get_slate_tags(self.ffmpeg_executable, self.slate_params)
+        except (RuntimeError, OSError) as error:
+            print(f"Not holding the stream: {error}")
+            return
+        if not tags or self._connected or self._stopping.is_set():
+            return  # an ingest may have come back while the slate was being encoded
+        duration = max(tags[-1].timestamp, 1) + DEFAULT_FRAME_GAP
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        base = 0
+        self.splicer.switch_to(FILLER)
+        while not self._live_restored() and not self._stopping.is_set():
+            for tag in tags:
+                timestamp = base + tag.timestamp
+                # the filler has no clock of its own, pace it to real time
+                await asyncio.sleep(max(0.0, start + timestamp / 1000 - loop.time()))
+                self._send(self.splicer.push(FILLER, tag._replace(timestamp=timestamp)))
+                if self._live_restored():
+                    return
+            base += duration
+
+    def _start_filler(self) -> None:
+        if self.hold and (self._filler_task is None or self._filler_task.done()):
+            self._filler_task = asyncio.create_task(self._run_filler())
+
+    async def _read_ingest(self, source: str, tags: AsyncIterator[FlvTag]) -> bool:
+        """Feed one connection of an ingest to the splicer until it ends, returns whether it sent anything."""
+        connected = False
+        keyframe_seen = False
+        try:
+            async for tag in tags:
+                if self._stopping.is_set():
+                    break  # wait_for can swallow our cancellation when a read completes at the same time
+                if not connected:
+                    connected = True
+                    print(f"{source.capitalize()} ingest connected")
+                    self.tracer.emit("ingest_connect", source)
+                    self._connected.add(source)
+                    if self.splicer.active == source:
+                        self.splicer.switch_to(source)  # a new connection restarts its timestamps
+                if not keyframe_seen and tag.is_keyframe and not tag.is_header:
+                    keyframe_seen = True
+                    self.tracer.emit("ingest_first_keyframe", source, timestamp=tag.timestamp)
+                self._handle_tag(source, tag)
+                metadata = parse_metadata(tag)
+                if metadata is not None and source in (self.splicer.active, self.splicer.pending):
+                    self.slate_params = SlateParams.from_metadata(metadata)
+        except asyncio.TimeoutError:
+            print(f"{source.capitalize()} ingest stalled")
+            self.tracer.emit("ingest_stall", source)
+        finally:
+            self._connected.discard(source)
+        return connected
+
+    def _ingest_lost(self, source: str, connected: bool) -> None:
+        if connected:
+            print(f"{source.capitalize()} ingest disconnected")
+            self.tracer.emit("ingest_disconnect", source)
+        if self.splicer.active is not None and not self._connected:
+            self._start_filler()
+
+    async def _run_link_ingest(self, source: str) -> None:
+        """Listen for an upstream instance, see restreamlocal.cascade.
+
+        Only a connection that starts with the link's token is read. Once it has, it replaces the upstream
+        that was connected before, so an upstream that restarts doesn't wait for its old connection to time
+        out. The old one is closed and done feeding the splicer before the new one starts.
+        """
+        current: tuple[asyncio.Task[Any], asyncio.StreamWriter] | None = None
+        token = link_token(self.ingest_urls[source])
+
+        async def handle_upstream(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            nonlocal current
+            if not await authenticate_link(reader, token):
+                print(f"{source.capitalize()} link from {writer.get_extra_info('peername')} rejected")
+                self.tracer.emit("ingest_rejected", source, peer=str(writer.get_extra_info("peername")))
+                writer.close()
+                return
+            if current is not None:
+                previous_task, previous_writer = current
+                previous_writer.close()
+                await asyncio.wait([previous_task])  # so it's done with the splicer before we start
+            this = (asyncio.current_task(), writer)
+            current = this  # type: ignore[assignment]
+            sock = writer.get_extra_info("socket")
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            connected = False
+            try:
+                # no read timeout, the upstream holds its own stream and closes the link when it stops
+                connected = await self._read_ingest(source, read_flv_tags(reader))
+            except (ConnectionError, FlvError) as error:
+                print(f"{source.capitalize()} link failed: {error!r}")
+            finally:
+                writer.close()
+            if current is this:
+                current = None
+                self._ingest_lost(source, connected)
+
+        host, port = parse_link_url(self.ingest_urls[source])
+        server = await asyncio.start_server(handle_upstream, host, port)
+        print(f"Waiting for an upstream instance on {host}:{port}")
+        try:
+            await self._stopping.wait()
+        finally:
+            server.close()
+            if current is not None:
+                current[1].close()
+            await server.wait_closed()
+
+    async def _run_playout(self, source: str) -> None:
+        """Play a file instead of pulling a live ingest, see restreamlocal.playout. Played once, it holds."""
+        path, loop = parse_file_url(self.ingest_urls[source])
+        print(f"Playing {path}" + (" in a loop" if loop else ""))
+        connected = False
+        try:
+            async with aclosing(play_file(path, self.ffmpeg_executable, loop=loop)) as tags:
+                connected = await self._read_ingest(source, tags)
+        except (OSError, FlvError) as error:
+            print(f"Could not play {path}: {error!r}")
+        self._ingest_lost(source, connected)
+        self.playout_done.set()
+        await self._stopping.wait()
+
+    async def _run_ingest(self, source: str = LIVE) -> None:
+        if is_link_url(self.ingest_urls[source]):
+            await self._run_link_ingest(source)
+            return
+        if is_file_url(self.ingest_urls[source]):
+            await self._run_playout(source)
+            return
+        while not self._stopping.is_set():
+            process = await asyncio.create_subprocess_exec(
+                *self.build_ingest_command(source),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stderr_task = asyncio.create_task(print_stderr(process, f"{source} ingest"))
+            assert process.stdout is not None  # nosec
+            try:
+                tags = read_flv_tags(process.stdout, self.read_timeout)
+                connected = await self._read_ingest(source, tags)
+            finally:
+                await stop_process(process)
+                await stderr_task
+            self._ingest_lost(source, connected)
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.retry_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_telemetry(self) -> None:
+        while True:
+            await asyncio.sleep(self.sample_interval)
+            for output in self.outputs:
+                output.sample()
+
+    async def start(self) -> None:
+        self.running = True
+        self.tracer.emit("relay_start", outputs=len(self.outputs), ingests=list(self.ingest_urls))
+        for index in range(0, len(self.outputs), START_BATCH_SIZE):
+            batch = self.outputs[index : index + START_BATCH_SIZE]
+            await asyncio.gather(*(output.start() for output in batch))
+        self._tasks = [asyncio.create_task(self._run_ingest(source)) for source in self.ingest_urls]
+        self._tasks.append(asyncio.create_task(self.watchdog.run()))
+        self._tasks.append(asyncio.create_task(self._run_telemetry()))
+        self._tasks.append(asyncio.create_task(self.ingest_selector.run()))
+
+    async def stop(self) -> None:
+        self.running = False
+        self._stopping.set()
+        tasks = self._tasks + ([self._filler_task] if self._filler_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.gather(*(output.stop(grace=2.0) for output in self.outputs))
+        await self.remove_taps()
+        self.tracer.emit("relay_stop")
+
+    async def add_destination(self, url: str) -> Output:
+        """Add an output, which joins the running stream on its next keyframe."""
+        output = self._create_output(url)
+        self.outputs.append(output)
+        if self.running:
+            await output.start()
+        return output
+
+    async def add_tap(self, writer: asyncio.StreamWriter) -> None:
+        """Also send what the outputs get down an accepted connection, until it closes, see TapOutput."""
+        for tap in [tap for tap in self.taps if not tap.running]:
+            self.taps.remove(tap)
+            await tap.stop()
+        tap = TapOutput(writer, self.splicer.headers)
+        self.taps.append(tap)
+        await tap.start()
+
+    async def remove_taps(self) -> None:
+        taps, self.taps = self.taps, []
+        await asyncio.gather(*(tap.stop() for tap in taps))
+
+    async def remove_destination(self, url: str) -> None:
+        for output in [output for output in self.outputs if output.url == url]:
+            self.outputs.remove(output)
+            await output.stop(grace=2.0)
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [output.stats() for output in self.outputs]
+
+
+__all__ = (
+    "BACKUP",
+    "DEFAULT_FAILOVER_TIMEOUT",
+    "FILLER",
+    "LIVE",
+    "Relay",
+    "SlateParams",
+    "Splicer",
+    "get_slate_tags",
+)
@@ -0,0 +1,375 @@
+"""Session API for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from sys import platform
+from types import TracebackType
+from typing import Any
+from typing import Callable
+from typing import Iterable
+
+from . import _assets
+from .cascade import Topology
+from .cascade import build_link_url
+from .cascade import valid_link_token
+from .output import DEFAULT_BUFFER_BUDGET
+from .output import BufferBudget
+from .output import DestinationOptions
+from .output import Output
+from .output import print_stream
+from .output import stop_process
+from .playout import build_file_url
+from .presets import IngestSelector
+from .preview import DEFAULT_PREVIEW_FPS
+from .preview import Preview
+from .relay import DEFAULT_FAILOVER_TIMEOUT
+from .relay import Relay
+from .trace import Tracer
+from .watchdog import DEFAULT_STALL_TIMEOUT
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 1935
+DEFAULT_STREAM_KEY = "stream"
+DEFAULT_BACKUP_STREAM_KEY = "stream_backup"
+MONA_STARTUP_TIME = 1.0  # if MonaServer is still alive after this long, we consider it started
+
+
+def build_stream_url(host: str, port: str | int) -> str:
+    return f"rtmp://{host}:{port}/live"
+
+
+class RestreamSession:
+    """Everything ReStreamLocal does, without the window.
+
+    The ingest is the local MonaServer that OBS publishes into. The relay pulls from it and pushes to every
+    destination. Destinations can be added & removed while the relay is running; only the affected outputs
+    are touched.
+
+    With a backup_stream_key, a second encoder can publish to that key as a backup, see Relay. With a
+    link_address, the relay takes its stream from an upstream instance instead of MonaServer, which has to
+    authenticate with link_token, see restreamlocal.cascade. With a playout file, it plays that recording
+    instead, see restreamlocal.playout. auto:// destinations share one IngestSelector, so its choices
+    outlive relay restarts. Lifecycle events go into the tracer, which is disabled unless one is given, see
+    restreamlocal.trace. The outputs of every relay the session starts share a buffer_budget of that many
+    bytes, see BufferBudget.
+
+    The executable lookups default to the bundled binaries and can be swapped out, which is how the tests
+    run the session without MonaServer or ffmpeg.
+
+    Example:
+        async with RestreamSession() as session:
+            await session.start_ingest()
+            await session.add_destination("rtmp://live.twitch.tv/app/key")
+            await session.start_relay()
+    """
+
+    def __init__(
+        self,
+        *,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        stream_key: str = DEFAULT_STREAM_KEY,
+        backup_stream_key: str | None = None,
+        hold: bool = True,
+        stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+        failover_timeout: float = DEFAULT_FAILOVER_TIMEOUT,
+        link_address: tuple[str, int] | None = None,
+        link_token: str = "",
+        playout: Path | None = None,
+        playout_loop: bool = False,
+        get_ffmpeg_executable: Callable[[], Path] | None = None,
+        get_mona_server_directory: Callable[[], Path] | None = None,
+        tracer: Tracer | None = None,
+        buffer_budget: int = DEFAULT_BUFFER_BUDGET,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.stream_key = stream_key
+        self.backup_stream_key = backup_stream_key
+        self.hold = hold
+        self.stall_timeout = stall_timeout
+        self.failover_timeout = failover_timeout
+        if link_address is not None and not valid_link_token(link_token):
+            raise ValueError("A link needs a token without spaces, @ or /")
+        self.link_address = link_address
+        self.link_token = link_token
+        self.playout = playout
+        self.playout_loop = playout_loop
+        self.destinations: list[str] = []
+        self.relay: Relay | None = None
+        self.preview: Preview | None = None
+        self._preview_server: asyncio.Server | None = None
+        self.ingest_selector = IngestSelector()
+        self.tracer = tracer if tracer is not None else Tracer(enabled=False)
+        self.buffer_budget = BufferBudget(buffer_budget, self._get_outputs)
+        self._get_ffmpeg_executable = get_ffmpeg_executable
+        self._get_mona_server_directory = get_mona_server_directory
+        self._mona_process: asyncio.subprocess.Process | None = None
+        self._mona_output_tasks: list[asyncio.Task[None]] = []
+        self._lock = asyncio.Lock()
+
+    @property
+    def stream_url(self) -> str:
+        return build_stream_url(self.host, self.port)
+
+    @property
+    def ingest_url(self) -> str:
+        return f"{self.stream_url}/{self.stream_key}"
+
+    @property
+    def backup_ingest_url(self) -> str | None:
+        if self.backup_stream_key is None or self.link_address is not None or self.playout is not None:
+            return None
+        return f"{self.stream_url}/{self.backup_stream_key}"
+
+    @property
+    def relay_ingest_url(self) -> str:
+        """Where the relay takes the stream from: the upstream link, the playout file or MonaServer."""
+        if self.link_address is not None:
+            return build_link_url(*self.link_address, self.link_token)
+        if self.playout is not None:
+            return build_file_url(self.playout, self.playout_loop)
+        return self.ingest_url
+
+    @classmethod
+    def from_topology(cls, topology: Topology, name: str, **kwargs: Any) -> RestreamSession:
+        """A session for one node of a topology, with its link and its share of the destinations."""
+        node = topology.nodes[name]
+        session = cls(link_address=node.link, link_token=topology.token, **kwargs)
+        session.destinations = topology.destinations_for(name)
+        return session
+
+    def _get_outputs(self) -> list[Output]:
+        return self.relay.outputs if self.relay is not None else []
+
+    @property
+    def ingest_running(self) -> bool:
+        return self._mona_process is not None and self._mona_process.returncode is None
+
+    @property
+    def relay_running(self) -> bool:
+        return self.relay is not None and self.relay.running
+
+    def get_ffmpeg_executable(self) -> Path:
+        return (self._get_ffmpeg_executable or _assets.get_ffmpeg_executable)()
+
+    def get_mona_server_directory(self) -> Path:
+        return (self._get_mona_server_directory or _assets.get_mona_server_directory)()
+
+    async def start_ingest(self) -> None:
+        """Start (or restart) MonaServer. Raises RuntimeError if it exits right away."""
+        async with self._lock:
+            await self._stop_ingest()
+
+            mona_server_directory = await asyncio.to_thread(self.get_mona_server_directory)
+            mona_server_executable_str = str(mona_server_directory / "MonaServer.exe")
+            print(f"Starting {mona_server_executable_str}")
+            self.tracer.emit("server_start")
+            process = await asyncio.create_subprocess_exec(
+                mona_server_executable_str,
+                cwd=mona_server_directory,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            assert process.stdout is not None and process.stderr is not None  # nosec
+            output_tasks = [
+                asyncio.create_task(print_stream(process.stdout, "MonaServer")),
+                asyncio.create_task(print_stream(process.stderr, "MonaServer")),
+            ]
+            # we really should be looking to see if the server printed out "Server Running",
+            # but thats complicated
+            try:
+                await asyncio.wait_for(process.wait(), MONA_STARTUP_TIME)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                await asyncio.gather(*output_tasks)
+                raise RuntimeError("MonaServer failed to start, see console")
+            self._mona_process = process
+            self._mona_output_tasks = output_tasks
+
+    async def _stop_ingest(self) -> None:
+        if self._mona_process is None:
+            return
+        print("Stopping server")
+        self.tracer.emit("server_stop")
+        await stop_process(self._mona_process)
+        await asyncio.gather(*self._mona_output_tasks, return_exceptions=True)
+        self._mona_process = None
+        if platform == "win32":
+            await asyncio.to_thread(_assets.kill_all_monaservers)  # killing it is sometimes ineffective
+
+    async def stop_ingest(self) -> None:
+        async with self._lock:
+            await self._stop_ingest()
+
+    async def start_relay(self) -> None:
+        """Start (or restart) pushing the ingest to every destination."""
+        async with self._lock:
+            await self._stop_relay()
+            ffmpeg_executable = await asyncio.to_thread(self.get_ffmpeg_executable)
+            print(f"Starting {ffmpeg_executable}")
+            self.relay = Relay(
+                str(ffmpeg_executable),
+                self.relay_ingest_url,
+                self.destinations,
+                backup_ingest_url=self.backup_ingest_url,
+                hold=self.hold,
+                stall_timeout=self.stall_timeout,
+                failover_timeout=self.failover_timeout,
+                ingest_selector=self.ingest_selector,
+                tracer=self.tracer,
+                buffer_budget=self.buffer_budget,
+            )
+            await self.relay.start()
+
+    async def _stop_relay(self) -> None:
+        if self.relay is not None:
+            print("Stopping streams")
+            await self.relay.stop()
+            self.relay = None
+
+    async def stop_relay(self) -> None:
+        async with self._lock:
+            await self._stop_relay()
+
+    async def start_preview(self, max_fps: float = DEFAULT_PREVIEW_FPS) -> None:
+        """Start (or restart) decoding the keyframes of the stream the relay takes, in a child process.
+
+        The preview pulls MonaServer itself, see Preview. An upstream link or a playout file only reaches
+        the relay, so then the preview connects to a local tap of the relay instead, see Relay.add_tap.
+        """
+        await self.stop_preview()
+        ffmpeg_executable = await asyncio.to_thread(self.get_ffmpeg_executable)
+        url = self.ingest_url
+        if self.link_address is not None or self.playout is not None:
+            url = await self._start_preview_tap()
+        preview = Preview(str(ffmpeg_executable), url, max_fps=max_fps)
+        await asyncio.to_thread(preview.start)
+        self.preview = preview
+
+    async def _start_preview_tap(self) -> str:
+        async def handle_preview(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            if self.relay is None:
+                writer.close()  # the preview tries again every second
+                return
+            await self.relay.add_tap(writer)
+
+        self._preview_server = await asyncio.start_server(handle_preview, "127.0.0.1", 0)
+        port = self._preview_server.sockets[0].getsockname()[1]
+        return f"tcp://127.0.0.1:{port}"
+
+    async def stop_preview(self) -> None:
+        if self.preview is not None:
+            preview, self.preview = self.preview, None
+            await asyncio.to_thread(preview.stop)
+        if self._preview_server is not None:
+            self._preview_server.close()
+            if self.relay is not None:
+                await self.relay.remove_taps()
+            await self._preview_server.wait_closed()
+            self._preview_server = None
+
+    async def add_destination(self, url: str) -> None:
+        """Raises ValueError for invalid # options, before anything is changed."""
+        DestinationOptions.from_url(url)
+        async with self._lock:
+            if url in self.destinations:
+                return
+            self.destinations.append(url)
+            if self.relay is not None:
+                await self.relay.add_destination(url)
+
+    async def remove_destination(self, url: str) -> None:
+        async with self._lock:
+            if url not in self.destinations:
+                return
+            self.destinations.remove(url)
+            if self.relay is not None:
+                await self.relay.remove_destination(url)
+
+    async def set_destinations(self, urls: Iterable[str]) -> None:
+        """Replace the destination list, only starting & stopping the outputs that changed.
+
+        Raises ValueError if any url isn't a string or has invalid # options, before anything is changed.
+        """
+        urls = list(dict.fromkeys(urls))
+        for url in urls:
+            if not isinstance(url, str):
+                raise ValueError(f"destinations must be urls, not {url!r}")
+            DestinationOptions.from_url(url)
+        async with self._lock:
+            removed = [url for url in self.destinations if url not in urls]
+            added = [url for url in urls if url not in self.destinations]
+            self.destinations[:] = urls  # all at once, the relay's outputs follow below
+            if self.relay is not None:
+                for url in removed:
+                    await self.relay.remove_destination(url)
+                for url in added:
+                    await self.relay.add_destination(url)
+
+    def stats(self) -> dict[str, Any]:
+        """A snapshot of the session, safe to serialize as JSON."""
+        relay = self.relay
+        return {
+            "ingest": {"running": self.ingest_running, "url": self.stream_url},
+            "relay": {
+                "running": self.relay_running,
+                "holding": relay is not None and relay.holding,
+                "source": relay.splicer.active if relay is not None else None,
+                "switches": relay.splicer.switches if relay is not None else 0,
+                "failover_times": list(relay.failover_times) if relay is not None else [],
+            },
+            "destinations": relay.stats() if relay is not None else [],
+            "ingest_servers": self.ingest_selector.stats(),
+            "buffer_budget": self.buffer_budget.stats(),
+            "first_frame": self._first_frame() if self.tracer.enabled else None,
+        }
+
+    def _first_frame(self) -> dict[str, Any]:
+        """The tracer's time to first frame, with the destinations in the same order as in stats."""
+        first_frame = self.tracer.time_to_first_frame()
+        times = first_frame["destinations"]
+        first_frame["destinations"] = [times.get(output.url, {}) for output in self._get_outputs()]
+        return first_frame
+
+    async def close(self) -> None:
+        self.tracer.emit("shutdown")
+        await self.stop_preview()
+        await self.stop_relay()
+        await self.stop_ingest()
+        self.tracer.emit("shutdown_done")
+
+    async def __aenter__(self) -> RestreamSession:
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        await self.close()
+
+
+__all__ = ("DEFAULT_BACKUP_STREAM_KEY", "RestreamSession", "build_stream_url")
@@ -0,0 +1,117 @@
+"""Telemetry for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import re
+from array import array
+from typing import Iterator
+
+
+DEFAULT_SAMPLE_INTERVAL = 5.0  # seconds
+DEFAULT_HISTORY = 1440  # samples, two hours at the default interval
+
+# the largest value each integer typecode can hold, samples are clamped to it instead of overflowing
+_LIMITS = {"B": 2**8 - 1, "H": 2**16 - 1, "I": 2**32 - 1}
+
+_NUMBER_RE = re.compile(r"[0-9.]+")
+
+
+def parse_rate(value: str) -> float:
+    """Parse an ffmpeg progress value like "2500.3kbits/s" or "29.97", N/A is 0."""
+    match = _NUMBER_RE.match(value.strip())
+    if match is None:
+        return 0.0
+    try:
+        return float(match.group())
+    except ValueError:
+        return 0.0
+
+
+class RingBuffer:
+    """A fixed-size history of numbers, oldest first.
+
+    Backed by a preallocated array, so it never grows and costs itemsize bytes per sample (1 for "B").
+    """
+
+    def __init__(self, capacity: int = DEFAULT_HISTORY, typecode: str = "f") -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        # the typecode is only known at runtime, ints from the integer ones are floats as far as readers care
+        self._array: array[float] = array(typecode, bytes(capacity * array(typecode).itemsize))
+        self._limit = _LIMITS.get(typecode)
+        self._next = 0
+        self._count = 0
+        self.appended = 0  # total ever appended, lets readers tell whether anything changed
+
+    @property
+    def capacity(self) -> int:
+        return len(self._array)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._array) * self._array.itemsize
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[float]:
+        return iter(self.last())
+
+    def append(self, value: float) -> None:
+        if self._limit is not None:
+            value = min(max(round(value), 0), self._limit)
+        self._array[self._next] = value
+        self._next = (self._next + 1) % len(self._array)
+        self._count = min(self._count + 1, len(self._array))
+        self.appended += 1
+
+    def last(self, count: int | None = None) -> list[float]:
+        """The newest count samples (all of them by default), oldest first."""
+        count = self._count if count is None else min(count, self._count)
+        start = (self._next - count) % len(self._array)
+        if start + count <= len(self._array):
+            return self._array[start : start + count].tolist()
+        return self._array[start:].tolist() + self._array[: self._next].tolist()
+
+
+class OutputTelemetry:
+    """Bitrate (kbit/s), fps and queue depth history of one output, about 5 bytes per sample."""
+
+    def __init__(self, capacity: int = DEFAULT_HISTORY) -> None:
+        self.bitrate = RingBuffer(capacity, "H")
+        self.fps = RingBuffer(capacity, "B")
+        self.queue_depth = RingBuffer(capacity, "H")
+
+    @property
+    def nbytes(self) -> int:
+        return self.bitrate.nbytes + self.fps.nbytes + self.queue_depth.nbytes
+
+    def append(self, bitrate: float, fps: float, queue_depth: int) -> None:
+        self.bitrate.append(bitrate)
+        self.fps.append(fps)
+        self.queue_depth.append(queue_depth)
+
+
+__all__ = (
+    "DEFAULT_HISTORY",
+    "DEFAULT_SAMPLE_INTERVAL",
+    "OutputTelemetry",
+    "RingBuffer",
+    "parse_rate",
+)
@@ -0,0 +1,147 @@
+"""Trace for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import json
+import time
+from collections import deque
+from pathlib import Path
+from typing import IO
+from typing import Any
+from typing import Iterable
+from typing import NamedTuple
+
+
+DEFAULT_TRACE_CAPACITY = 4096  # events, the lifecycle of a few hundred outputs
+
+# The stages of getting a stream on air, in order. time_to_first_frame measures each from the relay starting.
+INGEST_STAGES = ("ingest_connect", "ingest_first_keyframe")
+OUTPUT_STAGES = ("output_start", "output_join", "output_connect", "output_first_byte")
+
+
+class TraceEvent(NamedTuple):
+    """Something that happened to the stream, at time.monotonic_ns()."""
+
+    time_ns: int
+    name: str
+    source: str = ""  # the ingest or output it happened to
+    fields: dict[str, Any] = {}
+
+    def to_json(self) -> dict[str, Any]:
+        return {"time_ns": self.time_ns, "event": self.name, "source": self.source, **self.fields}
+
+
+class Tracer:
+    """Records lifecycle events into a bounded ring, and into a JSONL file if given one.
+
+    A disabled tracer only checks its flag, so the relay always has one to call instead of checking for None.
+    Timestamps are monotonic; the trace_open event that starts every file also carries the wall clock time.
+
+    The first time of every stage since the latest relay_start is kept apart from the ring, so it survives
+    however many events come after. Outputs pass their url as the key, so two destinations on the same
+    server stay apart; the key never goes into the file, which only gets their redacted name.
+    """
+
+    def __init__(
+        self, capacity: int = DEFAULT_TRACE_CAPACITY, *, path: Path | None = None, enabled: bool = True
+    ) -> None:
+        self.enabled = enabled
+        self.events: deque[TraceEvent] = deque(maxlen=capacity)
+        self.emitted = 0  # total ever emitted, including what has fallen out of the ring
+        self._start_ns: int | None = None
+        self._ingest_times: dict[str, float] = {}
+        self._output_times: dict[str, dict[str, float]] = {}
+        self._file: IO[str] | None = None
+        if path is not None:
+            self.open(path)
+
+    def open(self, path: Path) -> None:
+        """Also append every event to a JSONL file from now on."""
+        self.close()
+        self._file = open(path, "a", buffering=1, encoding="utf-8")  # line buffered, a crash loses nothing
+        self.emit("trace_open", wall_time=time.time())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def emit(self, name: str, source: str = "", *, key: str | None = None, **fields: Any) -> None:
+        if not self.enabled:
+            return
+        event = TraceEvent(time.monotonic_ns(), name, source, fields)
+        self.events.append(event)
+        self.emitted += 1
+        if name == "relay_start":
+            self._start_ns = event.time_ns
+            self._ingest_times = {}
+            self._output_times = {}
+        elif self._start_ns is not None:
+            if name in INGEST_STAGES:
+                self._ingest_times.setdefault(name, (event.time_ns - self._start_ns) / 1e6)
+            elif name in OUTPUT_STAGES:
+                stages = self._output_times.setdefault(source if key is None else key, {})
+                stages.setdefault(name, (event.time_ns - self._start_ns) / 1e6)
+        if self._file is not None:
+            self._file.write(json.dumps(event.to_json()) + "\n")
+
+    def recent(self, count: int | None = None) -> list[dict[str, Any]]:
+        """The newest count events (all of them by default) as JSON, oldest first."""
+        events = list(self.events)
+        if count is not None:
+            events = events[-count:] if count > 0 else []
+        return [event.to_json() for event in events]
+
+    def time_to_first_frame(self) -> dict[str, Any]:
+        """Like time_to_first_frame over every event emitted, with the destinations by their key."""
+        destinations = {key: dict(stages) for key, stages in self._output_times.items()}
+        return {"ingest": dict(self._ingest_times), "destinations": destinations}
+
+
+def time_to_first_frame(events: Iterable[TraceEvent]) -> dict[str, Any]:
+    """How long each stage took to first happen since the latest relay_start, in ms.
+
+    Returns {"ingest": {stage: ms}, "destinations": {name: {stage: ms}}}, stages that haven't happened yet are
+    missing. Outputs that restarted keep the times of their first attempt.
+    """
+    start: int | None = None
+    ingest: dict[str, float] = {}
+    destinations: dict[str, dict[str, float]] = {}
+    for event in events:
+        if event.name == "relay_start":
+            start = event.time_ns
+            ingest = {}
+            destinations = {}
+        elif start is None:
+            continue
+        elif event.name in INGEST_STAGES:
+            ingest.setdefault(event.name, (event.time_ns - start) / 1e6)
+        elif event.name in OUTPUT_STAGES:
+            destinations.setdefault(event.source, {}).setdefault(event.name, (event.time_ns - start) / 1e6)
+    return {"ingest": ingest, "destinations": destinations}
+
+
+__all__ = (
+    "DEFAULT_TRACE_CAPACITY",
+    "INGEST_STAGES",
+    "OUTPUT_STAGES",
+    "TraceEvent",
+    "Tracer",
+    "time_to_first_frame",
+)
@@ -0,0 +1,85 @@
+"""Output watchdog for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable
+from typing import Iterable
+
+from .output import Output
+
+
+DEFAULT_STALL_TIMEOUT = 10.0  # seconds
+MAX_RESTART_BACKOFF = 30.0
+
+
+def is_stalled(output: Output, now: float, stall_timeout: float) -> bool:
+    """An output is stalled when we have been feeding it but neither its timestamps nor its bytes out moved.
+
+    Outputs that aren't being fed (no ingest and no hold) are idle, not stalled.
+    """
+    return output.fed_since_progress > 0 and now - output.last_progress > stall_timeout
+
+
+class Watchdog:
+    """Restarts outputs whose ffmpeg exited or stopped making progress, leaving the healthy ones alone."""
+
+    def __init__(
+        self,
+        get_outputs: Callable[[], Iterable[Output]],
+        stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+        interval: float = 1.0,
+    ) -> None:
+        self.get_outputs = get_outputs
+        self.stall_timeout = stall_timeout
+        self.interval = interval
+        self.stalls_detected = 0
+        self.crashes_detected = 0
+
+    async def check(self) -> None:
+        now = time.monotonic()
+        restarts = []
+        for output in list(self.get_outputs()):
+            if not output.started:
+                continue  # not started, or stopped on purpose
+            if output.running and not is_stalled(output, now, self.stall_timeout):
+                continue
+            # don't hammer a destination that keeps refusing us
+            backoff = min(MAX_RESTART_BACKOFF, 2.0**output.restarts_since_progress - 1)
+            if now - output.started_at < backoff:
+                continue
+            if output.running:
+                self.stalls_detected += 1
+                print(f"[{output.name}] no progress for {now - output.last_progress:.1f}s, restarting")
+            else:
+                self.crashes_detected += 1
+                print(f"[{output.name}] exited, restarting")
+            if output.stall_detected_at is None:  # a restart that didn't help keeps the first detection
+                output.stall_detected_at = now
+            restarts.append(output.restart())
+        await asyncio.gather(*restarts)  # one slow destination shouldn't hold back the others
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+
+__all__ = ("DEFAULT_STALL_TIMEOUT", "Watchdog", "is_stalled")
@@ -0,0 +1,339 @@
+"""Tk widgets for ReStreamLocal - ReStreamLocal provides an easy-to-use locally hosted alternative to restream.io. Simply Open the program in the background and setup your OBS or Streamlabs to stream into it and it will take care of redistributing your stream..
+
+Copyright (C) 2024  Parker Wahle
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""  # noqa: E501, B950
+
+from __future__ import annotations
+
+import tkinter as tk
+from tkinter import ttk
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Sequence
+
+from .output import Output
+from .presets import PRESETS
+from .presets import build_auto_url
+from .telemetry import RingBuffer
+
+
+REMOTE_HOST_TYPE = tuple[str, str]
+
+DEFAULT_VISIBLE_ROWS = 8
+DEFAULT_REFRESH_INTERVAL = 1000  # ms between sparkline redraws
+
+SPARKLINE_WIDTH = 120  # one sample per pixel, so a redraw costs the same however long the history is
+SPARKLINE_HEIGHT = 18
+ROW_HEIGHT = 24
+NAME_WIDTH = 220
+VALUE_WIDTH = 70
+
+
+class _Row:
+    """The widgets for one on-screen row. They are reused for whichever remote host is scrolled into them."""
+
+    def __init__(self, master: tk.Misc, on_edit: Callable[[], None]) -> None:
+        self.frame = tk.Frame(master)
+
+        url_frame = tk.Frame(self.frame)
+        self.label = tk.Label(url_frame, width=14, anchor=tk.W)
+        self.label.pack(side=tk.LEFT)
+        self.url_stringvar = tk.StringVar()
+        # an editable dropdown, any url can be typed and the presets pick their nearest ingest server
+        self.url_entry = ttk.Combobox(
+            url_frame, textvariable=self.url_stringvar, values=[build_auto_url(name) for name in PRESETS]
+        )
+        self.url_entry.pack(side=tk.RIGHT)
+        url_frame.pack(side=tk.LEFT)
+
+        key_frame = tk.Frame(self.frame)
+        key_label = tk.Label(key_frame, text="Stream Key")
+        key_label.pack(side=tk.LEFT)
+        self.key_stringvar = tk.StringVar()
+        self.key_entry = tk.Entry(key_frame, textvariable=self.key_stringvar)
+        self.key_entry.pack(side=tk.RIGHT)
+        key_frame.pack(side=tk.RIGHT)
+
+        self.url_stringvar.trace_add("write", lambda *_: on_edit())
+        self.key_stringvar.trace_add("write", lambda *_: on_edit())
+        self.packed = False
+
+    def show(self, index: int, row: list[str]) -> None:
+        self.label.configure(text=f"Remote Host {index + 1}")
+        # only write what changed, every write fires the traces and moves the cursor
+        if self.url_stringvar.get() != row[0]:
+            self.url_stringvar.set(row[0])
+        if self.key_stringvar.get() != row[1]:
+            self.key_stringvar.set(row[1])
+        if not self.packed:
+            self.frame.pack()
+            self.packed = True
+
+    def hide(self) -> None:
+        if self.packed:
+            self.frame.pack_forget()
+            self.packed = False
+
+
+class DestinationList(tk.Frame):
+    """A scrollable list of remote hosts & stream keys.
+
+    The remote hosts live in a plain list; only the rows on screen have widgets, which are created the first
+    time they are needed and then reused as the list scrolls. Adding or removing a remote host touches at most
+    visible_rows rows, no matter how many there are.
+
+    on_change is called after every edit, add and remove.
+    """
+
+    def __init__(
+        self,
+        master: tk.Misc,
+        rows: Iterable[REMOTE_HOST_TYPE] = (),
+        *,
+        visible_rows: int = DEFAULT_VISIBLE_ROWS,
+        on_change: Callable[[], None] | None = None,
+    ) -> None:
+        super().__init__(master)
+        self.rows: list[list[str]] = [list(row) for row in rows] or [["", ""]]
+        self.visible_rows = visible_rows
+        self.on_change = on_change
+        self.first = 0  # index of the row shown at the top
+        self._slots: list[_Row] = []
+        self._loading = False  # set while we fill the rows in, so that doesn't count as an edit
+
+        self._rows_frame = tk.Frame(self)
+        self._rows_frame.pack(side=tk.LEFT)
+        self._scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self._handle_scrollbar)
+        self._scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        for widget in (self, self._rows_frame):
+            self._bind_mousewheel(widget)
+
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self) -> list[REMOTE_HOST_TYPE]:
+        return [(url, key) for url, key in self.rows]
+
+    def add_row(self, row: REMOTE_HOST_TYPE = ("", "")) -> None:
+        """Append a remote host and scroll it into view."""
+        self.rows.append(list(row))
+        self.first = max(0, len(self.rows) - self.visible_rows)
+        self.refresh()
+        self._changed()
+
+    def remove_row(self) -> None:
+        """Remove the last remote host, there is always at least one."""
+        if len(self.rows) <= 1:
+            return
+        self.rows.pop()
+        self.refresh()
+        self._changed()
+
+    def scroll_to(self, first: int) -> None:
+        self.first = first
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Show rows[first:first + visible_rows] in the row widgets."""
+        self.first = max(0, min(self.first, len(self.rows) - self.visible_rows))
+        shown = min(self.visible_rows, len(self.rows) - self.first)
+        self._loading = True
+        try:
+            for slot in range(shown):
+                if slot == len(self._slots):
+                    self._slots.append(self._create_slot(slot))
+                self._slots[slot].show(self.first + slot, self.rows[self.first + slot])
+            for row in self._slots[shown:]:
+                row.hide()
+        finally:
+            self._loading = False
+        self._scrollbar.set(self.first / len(self.rows), (self.first + shown) / len(self.rows))
+
+    def _create_slot(self, slot: int) -> _Row:
+        row = _Row(self._rows_frame, lambda: self._handle_edit(slot))
+        for widget in (row.frame, row.label, row.url_entry, row.key_entry):
+            self._bind_mousewheel(widget)
+        return row
+
+    def _handle_edit(self, slot: int) -> None:
+        if self._loading:
+            return
+        row = self._slots[slot]
+        self.rows[self.first + slot] = [row.url_stringvar.get(), row.key_stringvar.get()]
+        self._changed()
+
+    def _changed(self) -> None:
+        if self.on_change is not None:
+            self.on_change()
+
+    def _handle_scrollbar(self, action: str, amount: str, unit: str = "units") -> None:
+        if action == "moveto":
+            self.scroll_to(round(float(amount) * len(self.rows)))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll_to(self.first + int(amount) * step)
+
+    def _handle_mousewheel(self, event: Any) -> None:
+        if event.num == 4 or event.delta > 0:
+            self.scroll_to(self.first - 1)
+        elif event.num == 5 or event.delta < 0:
+            self.scroll_to(self.first + 1)
+
+    def _bind_mousewheel(self, widget: tk.Misc) -> None:
+        widget.bind("<MouseWheel>", self._handle_mousewheel)  # Windows & macOS
+        widget.bind("<Button-4>", self._handle_mousewheel)  # X11
+        widget.bind("<Button-5>", self._handle_mousewheel)
+
+
+def sparkline_coords(values: Sequence[float], x: float, y: float, width: float, height: float) -> list[float]:
+    """Canvas coordinates of a line through values, scaled so the largest touches the top."""
+    top = max(max(values), 1)
+    step = width / max(len(values) - 1, 1)
+    coords: list[float] = []
+    for index, value in enumerate(values):
+        coords += (x + index * step, y + height - value / top * height)
+    return coords
+
+
+class _TelemetryRow:
+    """Canvas items for one on-screen destination: its name, and a sparkline & latest value per series."""
+
+    def __init__(self, canvas: tk.Canvas, y: int, series: int) -> None:
+        self.canvas = canvas
+        self.name = canvas.create_text(0, y + ROW_HEIGHT // 2, anchor=tk.W)
+        self.lines: list[int] = []
+        self.values: list[int] = []
+        x = NAME_WIDTH
+        for _ in range(series):
+            self.lines.append(canvas.create_line(0, 0, 0, 0, fill="blue", state=tk.HIDDEN))
+            self.values.append(canvas.create_text(x + SPARKLINE_WIDTH + 4, y + ROW_HEIGHT // 2, anchor=tk.W))
+            x += SPARKLINE_WIDTH + VALUE_WIDTH
+        self.y = y
+        self.drawn: tuple[Any, ...] = ()
+
+    def draw(self, name: str, buffers: list[tuple[RingBuffer, str]]) -> None:
+        drawn = (name, *(buffer.appended for buffer, _ in buffers))
+        if drawn == self.drawn:
+            return  # nothing new since the last redraw
+        self.drawn = drawn
+        self.canvas.itemconfigure(self.name, text=name, state=tk.NORMAL)
+        x = NAME_WIDTH
+        top = self.y + (ROW_HEIGHT - SPARKLINE_HEIGHT) // 2
+        for line, value, (buffer, unit) in zip(self.lines, self.values, buffers):
+            values = buffer.last(SPARKLINE_WIDTH)
+            if len(values) >= 2:
+                self.canvas.coords(line, *sparkline_coords(values, x, top, SPARKLINE_WIDTH, SPARKLINE_HEIGHT))
+                self.canvas.itemconfigure(line, state=tk.NORMAL)
+            else:
+                self.canvas.itemconfigure(line, state=tk.HIDDEN)
+            text = f"{values[-1]:.0f} {unit}" if values else ""
+            self.canvas.itemconfigure(value, text=text, state=tk.NORMAL)
+            x += SPARKLINE_WIDTH + VALUE_WIDTH
+
+    def hide(self) -> None:
+        self.drawn = ()
+        for item in (self.name, *self.lines, *self.values):
+            self.canvas.itemconfigure(item, state=tk.HIDDEN)
+
+
+class TelemetryView(tk.Frame):
+    """Bitrate, fps & queue depth sparklines for each output.
+
+    Everything is drawn on one canvas and only the visible rows have canvas items, which are moved with
+    coords instead of being recreated. The view redraws at most every refresh_interval ms, and skips rows
+    that have no new samples, so it costs next to nothing on the UI thread between samples.
+    """
+
+    def __init__(
+        self,
+        master: tk.Misc,
+        get_outputs: Callable[[], Sequence[Output]],
+        *,
+        visible_rows: int = DEFAULT_VISIBLE_ROWS,
+        refresh_interval: int = DEFAULT_REFRESH_INTERVAL,
+    ) -> None:
+        super().__init__(master)
+        self.get_outputs = get_outputs
+        self.visible_rows = visible_rows
+        self.refresh_interval = refresh_interval
+        self.first = 0
+        self._rows: list[_TelemetryRow] = []
+        self._count = 0
+
+        header = tk.Frame(self)
+        tk.Label(header, text="Destination", anchor=tk.W, width=NAME_WIDTH // 8).pack(side=tk.LEFT)
+        for text in ("Bitrate", "FPS", "Queue"):
+            label = tk.Label(header, text=text, anchor=tk.W, width=(SPARKLINE_WIDTH + VALUE_WIDTH) // 8)
+            label.pack(side=tk.LEFT)
+        header.pack(fill=tk.X)
+        self.canvas = tk.Canvas(
+            self,
+            width=NAME_WIDTH + 3 * (SPARKLINE_WIDTH + VALUE_WIDTH),
+            height=visible_rows * ROW_HEIGHT,
+            highlightthickness=0,
+        )
+        self.canvas.pack(side=tk.LEFT)
+        self._scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self._handle_scrollbar)
+        self._scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self._after_id: str | None = self.after(self.refresh_interval, self._scheduled_refresh)
+
+    def refresh(self) -> None:
+        outputs = list(self.get_outputs())
+        self._count = len(outputs)
+        self.first = max(0, min(self.first, self._count - self.visible_rows))
+        shown = outputs[self.first : self.first + self.visible_rows]
+        for slot, output in enumerate(shown):
+            if slot == len(self._rows):
+                self._rows.append(_TelemetryRow(self.canvas, slot * ROW_HEIGHT, 3))
+            telemetry = output.telemetry
+            self._rows[slot].draw(
+                output.name,
+                [(telemetry.bitrate, "kb/s"), (telemetry.fps, "fps"), (telemetry.queue_depth, "queued")],
+            )
+        for row in self._rows[len(shown) :]:
+            row.hide()
+        if self._count:
+            self._scrollbar.set(self.first / self._count, (self.first + len(shown)) / self._count)
+        else:
+            self._scrollbar.set(0, 1)
+
+    def _scheduled_refresh(self) -> None:
+        if self.winfo_viewable():  # don't draw into a minimized window
+            self.refresh()
+        self._after_id = self.after(self.refresh_interval, self._scheduled_refresh)
+
+    def scroll_to(self, first: int) -> None:
+        self.first = first
+        self.refresh()
+
+    def _handle_scrollbar(self, action: str, amount: str, unit: str = "units") -> None:
+        if action == "moveto":
+            self.scroll_to(round(float(amount) * self._count))
+        elif action == "scroll":
+            step = self.visible_rows if unit == "pages" else 1
+            self.scroll_to(self.first + int(amount) * step)
+
+    def destroy(self) -> None:
+        if self._after_id is not None:
+            self.after_cancel(self._after_id)
+            self._after_id = None
+        super().destroy()
+
+
+__all__ = ("DEFAULT_VISIBLE_ROWS", "DestinationList", "REMOTE_HOST_TYPE", "TelemetryView", "sparkline_coords")
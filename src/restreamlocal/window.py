@@ -17,77 +17,23 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """  # noqa: E501, B950
 from __future__ import annotations
 
-import subprocess
-import sys
-import tempfile
 import tkinter as tk
-import zipfile
-from importlib.abc import Traversable
-from io import BytesIO
-from pathlib import Path
+from concurrent.futures import Future
 from shelve import Shelf
-from sys import platform
-from typing import cast, Callable, List, Tuple
-
-from ._assets import RESOURCES
-from .windows_utils import get_project_local_appdata_dir
-
-
-# yes, these functions should probably not be in a closure. i do not care!!!! el oh el
-# mona process handling
-def get_mona_server_zip() -> Traversable:
-    if platform != "win32":
-        raise NotImplementedError("Only Windows is supported for now.")
-    python_is_64_bit = sys.maxsize > 2 ** 32  # https://stackoverflow.com/questions/1405913/how-do-i-determine-if-my-python-shell-is-executing-in-32bit-or-64bit
-    if python_is_64_bit:
-        # If the python is 64 bit, the system must be as well
-        return RESOURCES / "MonaServer_Win64.zip"
-    else:
-        # While the python is 32 bit, the system could be 32 or 64 bit, use 32 bit which works on both
-        return RESOURCES / "MonaServer_Win32.zip"
-
-
-def get_mona_server_directory() -> Path:
-    # first, see if we already made a mona server tempdir
-    mona_server_dir = Path(tempfile.gettempdir()) / "mona_server"
-    mona_server_dir.mkdir(exist_ok=True, parents=True)  # for some reason, just using the local appdata directory always returns true
-    mona_server_executable = mona_server_dir / "MonaServer.exe"
-    if mona_server_dir.exists() and mona_server_executable.exists():
-        print("Using existing MonaServer")
-        print(mona_server_dir)
-        return mona_server_dir
-
-    # if we didn't, make one
-    mona_server_zip = get_mona_server_zip()
-
-    # all of the files of the zip are top level, just extract straight
-    if mona_server_zip.is_file():
-        with zipfile.ZipFile(cast(Path, mona_server_zip), "r") as zip_ref:
-            zip_ref.extractall(mona_server_dir)
-    else:
-        with BytesIO() as zip_data:
-            zip_data.write(mona_server_zip.read_bytes())
-            zip_data.seek(0)
-            with zipfile.ZipFile(zip_data, "r") as zip_ref:
-                zip_ref.extractall(mona_server_dir)
-
-    print("Successfully extracted MonaServer")
-    print(mona_server_dir)
-
-    return mona_server_dir
-
-
-def kill_all_monaservers() -> None:
-    """Kills all MonaServer instances using taskkill, even if we have lost track of them."""
-    # a little bit of a hack, but it will work for us
-
-    # taskkill /IM MonaServer.exe /F
-
-    subprocess.run(["taskkill", "/IM", "MonaServer.exe", "/F"], shell=True)
-
-
-def build_stream_url(host: str, port: str) -> str:
-    return f"rtmp://{host}:{port}/live"
+from typing import Callable
+
+from ._loop import BackgroundLoop
+from .control import ControlServer
+from .preview import PREVIEW_HEIGHT
+from .preview import PREVIEW_WIDTH
+from .relay import BACKUP
+from .session import DEFAULT_BACKUP_STREAM_KEY
+from .session import RestreamSession
+from .trace import Tracer
+from .watchdog import DEFAULT_STALL_TIMEOUT
+from .widgets import REMOTE_HOST_TYPE
+from .widgets import DestinationList
+from .widgets import TelemetryView
 
 
 def overwrite_clipboard(window: tk.Tk, *args, **kwargs) -> None:
@@ -95,12 +41,9 @@ def overwrite_clipboard(window: tk.Tk, *args, **kwargs) -> None:
     window.clipboard_append(*args, **kwargs)
 
 
-def pack_monaserver_widgets(window: tk.Tk) -> tuple[Callable[[], str], Callable[[], str], Callable[[], None]]:
+def pack_monaserver_widgets(window: tk.Tk, loop: BackgroundLoop, session: RestreamSession) -> Callable[[], None]:
     """
-    Returns a tuple of functions:
-    - get_stream_url: returns the stream URL
-    - get_stream_key: returns the stream key
-    - stop_mona_server: stops the MonaServer
+    Returns a function that stops the MonaServer
     """
 
     # We don't bother to expose options for the host & port, most people won't care at all.
@@ -109,7 +52,7 @@ def pack_monaserver_widgets(window: tk.Tk) -> tuple[Callable[[], str], Callable[
     local_host_label = tk.Label(local_host_frame, text="Local Host")
     local_host_label.pack(side=tk.LEFT)
     local_host_entry = tk.Entry(local_host_frame)
-    local_host_entry.insert(0, "127.0.0.1")
+    local_host_entry.insert(0, session.host)
     local_host_entry.configure(state=tk.DISABLED)  # have to do this after we insert the text
     local_host_entry.pack(side=tk.RIGHT)
     local_host_frame.pack()
@@ -119,19 +62,17 @@ def pack_monaserver_widgets(window: tk.Tk) -> tuple[Callable[[], str], Callable[
     local_port_label = tk.Label(local_host_frame, text="Local Port")
     local_port_label.pack(side=tk.LEFT)
     local_port_entry = tk.Entry(local_host_frame)
-    local_port_entry.insert(0, "1935")
+    local_port_entry.insert(0, str(session.port))
     local_port_entry.configure(state=tk.DISABLED)  # have to do this after we insert the text
     local_port_entry.pack(side=tk.RIGHT)
     local_host_frame.pack()
 
-    get_stream_url = lambda: build_stream_url(local_host_entry.get(), local_port_entry.get())
-
     # Stream key
     stream_key_frame = tk.Frame(window)
     stream_key_label = tk.Label(stream_key_frame, text="Stream Key")
     stream_key_label.pack(side=tk.LEFT)
     stream_key_entry = tk.Entry(stream_key_frame)
-    stream_key_entry.insert(0, "stream")
+    stream_key_entry.insert(0, session.stream_key)
     stream_key_entry.configure(state=tk.DISABLED)  # have to do this after we insert the text
     stream_key_entry.pack(side=tk.RIGHT)
     stream_key_frame.pack()
@@ -142,7 +83,7 @@ def pack_monaserver_widgets(window: tk.Tk) -> tuple[Callable[[], str], Callable[
     start_server_button.bind("<Button-1>", lambda _: start_mona_server())
     start_server_button.pack(side=tk.LEFT)
     copy_url_button = tk.Button(mona_button_frame, text="Copy Stream URL")
-    copy_url_button.bind("<Button-1>", lambda _: overwrite_clipboard(window, get_stream_url()))
+    copy_url_button.bind("<Button-1>", lambda _: overwrite_clipboard(window, session.stream_url))
     copy_url_button.pack(side=tk.LEFT)
     copy_key_button = tk.Button(mona_button_frame, text="Copy Stream Key")
     copy_key_button.bind("<Button-1>", lambda _: overwrite_clipboard(window, stream_key_entry.get()))
@@ -153,64 +94,28 @@ def pack_monaserver_widgets(window: tk.Tk) -> tuple[Callable[[], str], Callable[
     status_label = tk.Label(window, text="Server not running")
     status_label.pack()
 
-    current_mona_subprocess: subprocess.Popen | None = None
-
     def stop_mona_server() -> None:
-        nonlocal current_mona_subprocess
-        if current_mona_subprocess is not None:
+        if session.ingest_running:
             status_label.configure(text="Stopping server")
-            current_mona_subprocess.kill()  # this is sometimes ineffective, hence the above
-            current_mona_subprocess.wait()
-            kill_all_monaservers()
-            current_mona_subprocess = None
+            loop.call(session.stop_ingest())
             status_label.configure(text="Server not running")
-            print("Stopping server")
 
     def start_mona_server():
-        nonlocal current_mona_subprocess
-        stop_mona_server()
-
         status_label.configure(text="Server starting")
-        mona_server_directory = get_mona_server_directory()
-        mona_server_executable = mona_server_directory / "MonaServer.exe"
-        mona_server_executable_str = str(mona_server_executable)
-
-        print(f"Starting {mona_server_executable_str}")
-        current_mona_subprocess = subprocess.Popen(
-            [mona_server_executable_str],
-            cwd=mona_server_directory,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            stdin=subprocess.PIPE
-        )
-
-        # the following is kinda hacky, but it works
         try:
-            # we really should be looking to see if the server printed out "Server Running", but thats complicated
-            stdout, stderr = current_mona_subprocess.communicate(timeout=1)
-            current_mona_subprocess = None
-        except subprocess.TimeoutExpired:
-            pass
-        else:
+            loop.call(session.start_ingest())
+        except RuntimeError:
             status_label.configure(text="Server failed to start, see console")
-            for line in stdout.splitlines():
-                print(line)
-            for line in stderr.splitlines():
-                print(line)
             return
 
         status_label.configure(text="Server running")
 
-    return get_stream_url, lambda: stream_key_entry.get(), stop_mona_server
-
+    return stop_mona_server
 
-REMOTE_HOST_TYPE = tuple[str, str]
 
-
-def pack_remote_host_adding_widgets(window: tk.Tk, config: Shelf) -> Callable[[], list[Callable[[], REMOTE_HOST_TYPE]]]:
+def pack_remote_host_adding_widgets(window: tk.Tk, config: Shelf) -> Callable[[], list[REMOTE_HOST_TYPE]]:
     """
-    Returns a function that returns a list of functions that return a remote url, stream key, and any aditional info
+    Returns a function that returns a list of remote urls & stream keys
     """
 
     # Remote hosts
@@ -219,124 +124,94 @@ def pack_remote_host_adding_widgets(window: tk.Tk, config: Shelf) -> Callable[[]
     # Label to add/remove remote hosts
     remote_host_label = tk.Label(remote_host_header_frame, text="Remote Hosts")
     remote_host_label.pack(side=tk.LEFT)
-    number_of_remote_hosts = config.get("num_remote_hosts", 1)  # volatile variable to keep track of the number of remote hosts
-    remote_host_tuple_getters: list[Callable[
-        [], tuple[str, str]]] = []  # list of functions that return a remote url, stream key, and any aditional info
     # +/- buttons
     remote_host_button_frame = tk.Frame(remote_host_header_frame)
-
-    def handle_add_host(_: tk.Event[tk.Button]) -> None:
-        nonlocal number_of_remote_hosts
-        number_of_remote_hosts += 1
-        store_all_remote_hosts()
-        render_remote_host_entry()
-
     add_remote_host_button = tk.Button(remote_host_button_frame, text="+")
     add_remote_host_button.pack(side=tk.LEFT)
-    add_remote_host_button.bind("<Button-1>", handle_add_host)
-
-    def handle_remove_host(_: tk.Event[tk.Button]) -> None:
-        nonlocal number_of_remote_hosts
-        if number_of_remote_hosts > 1:
-            number_of_remote_hosts -= 1
-        store_all_remote_hosts()
-        render_remote_host_entry()
-
+    add_remote_host_button.bind("<Button-1>", lambda _: destination_list.add_row())
     remove_remote_host_button = tk.Button(remote_host_button_frame, text="-")
     remove_remote_host_button.pack(side=tk.RIGHT)
-    remove_remote_host_button.bind("<Button-1>", handle_remove_host)
+    remove_remote_host_button.bind("<Button-1>", lambda _: destination_list.remove_row())
     remote_host_button_frame.pack(side=tk.RIGHT)
     remote_host_header_frame.pack()
-    # Remote host entries
-    remote_host_frame = tk.Frame(window)
-
-    def save_all_remote_hosts(*args) -> None:
-        nonlocal remote_host_tuple_getters, number_of_remote_hosts
-        config["remote_hosts"] = [getter() for getter in remote_host_tuple_getters]
-        config["num_remote_hosts"] = number_of_remote_hosts
 
-    def store_all_remote_hosts() -> None:
+    # Remote host entries, only the visible ones have widgets
+    number_of_remote_hosts = config.get("num_remote_hosts", 1)
+    saved_remote_hosts = list(config.get("remote_hosts", []))[:number_of_remote_hosts]
+    saved_remote_hosts += [("", "")] * (number_of_remote_hosts - len(saved_remote_hosts))
+    save_pending = False
+
+    def save_all_remote_hosts() -> None:
+        nonlocal save_pending
+        save_pending = False
+        config["remote_hosts"] = destination_list.get()
+        config["num_remote_hosts"] = len(destination_list)
+
+    def schedule_save() -> None:
+        # writing every host to the shelf on every keystroke gets slow with a lot of them
+        nonlocal save_pending
+        if not save_pending:
+            save_pending = True
+            window.after(250, save_all_remote_hosts)
+
+    destination_list = DestinationList(window, saved_remote_hosts, on_change=schedule_save)
+    destination_list.pack()
+
+    def get_remote_hosts() -> list[REMOTE_HOST_TYPE]:
         save_all_remote_hosts()
         config.sync()
+        return destination_list.get()
+
+    return get_remote_hosts
 
-    def render_remote_host_entry() -> None:
-        nonlocal remote_host_tuple_getters
-        remote_host_tuple_getters.clear()
-        saved_remote_hosts = config.get("remote_hosts", [])
-        for widget in remote_host_frame.winfo_children():
-            widget.destroy()
-        for i in range(number_of_remote_hosts):
-            remote_host_i_frame = tk.Frame(remote_host_frame)
-
-            remote_host_url_frame = tk.Frame(remote_host_i_frame)
-            remote_host_label = tk.Label(remote_host_url_frame, text=f"Remote Host {i + 1}")
-            remote_host_label.pack(side=tk.LEFT)
-            remote_host_stringvar = tk.StringVar()
-            remote_host_entry = tk.Entry(remote_host_url_frame, textvariable=remote_host_stringvar)
-            remote_host_stringvar.trace_add("write", save_all_remote_hosts)
-            remote_host_entry.pack(side=tk.RIGHT)
-            remote_host_url_frame.pack(side=tk.LEFT)
-
-            remote_host_key_frame = tk.Frame(remote_host_i_frame)
-            remote_host_key_label = tk.Label(remote_host_key_frame, text="Stream Key")
-            remote_host_key_label.pack(side=tk.LEFT)
-            remote_host_key_stringvar = tk.StringVar()
-            remote_host_key_entry = tk.Entry(remote_host_key_frame, textvariable=remote_host_key_stringvar)
-            remote_host_key_stringvar.trace_add("write", save_all_remote_hosts)
-            remote_host_key_entry.pack(side=tk.RIGHT)
-            remote_host_key_frame.pack(side=tk.RIGHT)
-
-            if i < len(saved_remote_hosts):
-                remote_host_entry.insert(0, saved_remote_hosts[i][0])
-                remote_host_key_entry.insert(0, saved_remote_hosts[i][1])
-
-            # remote_host_entry gets reassigned, we have to be clever with our closures
-            def remote_host_tuple_getter_factory() -> Callable[[], tuple[str, str]]:
-                this_remote_host_entry = remote_host_entry
-                this_remote_host_key_entry = remote_host_key_entry
-                return lambda: (this_remote_host_entry.get(), this_remote_host_key_entry.get())
-
-            remote_host_tuple_getters.append(remote_host_tuple_getter_factory())
-
-            remote_host_i_frame.pack()
-
-    def get_host_tuple_getters() -> list[Callable[[], REMOTE_HOST_TYPE]]:
-        store_all_remote_hosts()
-        return remote_host_tuple_getters
-
-    render_remote_host_entry()
-    remote_host_frame.pack()
-
-    return get_host_tuple_getters
-
-
-def get_ffmpeg_executable() -> Path:
-    ffmpeg_traversable = RESOURCES / "ffmpeg.exe"
-    if ffmpeg_traversable.is_file():
-        return cast(Path, ffmpeg_traversable)
-
-    # we need to check to see if we already made a tempdir
-    project_appdata_dir = Path(tempfile.gettempdir()) / "restreamlocal"
-    project_appdata_dir.mkdir(exist_ok=True)
-    ffmpeg_executable = project_appdata_dir / "ffmpeg.exe"
-    if ffmpeg_executable.exists():
-        print("Using existing ffmpeg")
-        print(ffmpeg_executable)
-        return ffmpeg_executable
-
-    # if we didn't, make one
-    with open(ffmpeg_executable, "wb") as f:
-        f.write(ffmpeg_traversable.read_bytes())
-
-    return ffmpeg_executable
-
-
-def pack_ffmpeg_client_widgets(window: tk.Tk, config: Shelf, get_stream_url: Callable[[], str], get_stream_key: Callable[[], str]) -> Callable[[], None]:
+
+def pack_ffmpeg_client_widgets(window: tk.Tk, config: Shelf, loop: BackgroundLoop, session: RestreamSession) -> Callable[[], None]:
     """
-    Returns a function that stops the ffmpeg process
+    Returns a function that stops the relay
     """
 
-    get_remote_host_tuple_getters = pack_remote_host_adding_widgets(window, config)
+    get_remote_hosts = pack_remote_host_adding_widgets(window, config)
+
+    # Hold the destinations with a slate when OBS drops, instead of letting every platform end the stream
+    hold_booleanvar = tk.BooleanVar(value=config.get("hold_on_disconnect", True))
+    hold_checkbutton = tk.Checkbutton(window, text="Keep streams live while OBS reconnects", variable=hold_booleanvar)
+
+    def save_hold(*args) -> None:
+        config["hold_on_disconnect"] = hold_booleanvar.get()
+
+    hold_booleanvar.trace_add("write", save_hold)
+    hold_checkbutton.pack()
+
+    # A second encoder can publish to the backup key, the streams move to it when the primary freezes
+    backup_booleanvar = tk.BooleanVar(value=config.get("backup_ingest", False))
+    backup_checkbutton = tk.Checkbutton(
+        window,
+        text=f"Accept a backup encoder on stream key \"{DEFAULT_BACKUP_STREAM_KEY}\"",
+        variable=backup_booleanvar,
+    )
+
+    def save_backup(*args) -> None:
+        config["backup_ingest"] = backup_booleanvar.get()
+
+    backup_booleanvar.trace_add("write", save_backup)
+    backup_checkbutton.pack()
+
+    # Restart any single output that stops making progress for this long
+    stall_timeout_frame = tk.Frame(window)
+    stall_timeout_label = tk.Label(stall_timeout_frame, text="Restart frozen streams after (seconds)")
+    stall_timeout_label.pack(side=tk.LEFT)
+    stall_timeout_stringvar = tk.StringVar(value=str(config.get("stall_timeout", DEFAULT_STALL_TIMEOUT)))
+    stall_timeout_entry = tk.Entry(stall_timeout_frame, textvariable=stall_timeout_stringvar, width=6)
+    stall_timeout_entry.pack(side=tk.RIGHT)
+    stall_timeout_frame.pack()
+
+    def get_stall_timeout() -> float:
+        try:
+            stall_timeout = max(float(stall_timeout_stringvar.get()), 1.0)
+        except ValueError:
+            stall_timeout = DEFAULT_STALL_TIMEOUT
+        config["stall_timeout"] = stall_timeout
+        return stall_timeout
 
     # Button to start streams
     start_streams_button = tk.Button(window, text="Start/Restart Streams")
@@ -345,65 +220,146 @@ def pack_ffmpeg_client_widgets(window: tk.Tk, config: Shelf, get_stream_url: Cal
     # Stream status
     stream_status_label = tk.Label(window, text="Streams not running")
     stream_status_label.pack()
-    # ffmpeg process handling
-    current_ffmpeg_subprocess: subprocess.Popen | None = None
+    # Per destination history, sampled by the relay
+    telemetry_view = TelemetryView(window, lambda: session.relay.outputs if session.relay is not None else [])
+    telemetry_view.pack()
+    # the relay itself lives in the session, on the background loop
+    starting: Future[None] | None = None
+    poll_id: str | None = None  # one status poll at a time, however often the button is clicked
+
+    def stop_polling() -> None:
+        nonlocal poll_id
+        if poll_id is not None:
+            window.after_cancel(poll_id)
+            poll_id = None
 
     def stop_ffmpeg_process() -> None:
-        nonlocal current_ffmpeg_subprocess
-        if current_ffmpeg_subprocess is not None:
+        stop_polling()
+        if session.relay is not None:
             stream_status_label.configure(text="Stopping streams")
-            current_ffmpeg_subprocess.kill()
-            current_ffmpeg_subprocess.wait()
-            current_ffmpeg_subprocess = None
+            loop.call(session.stop_relay())
             stream_status_label.configure(text="Streams not running")
-            print("Stopping streams")
 
-    def start_ffmpeg_process() -> None:
-        nonlocal current_ffmpeg_subprocess
-        stop_ffmpeg_process()
-
-        ffmpeg_executable = get_ffmpeg_executable()
-        ffmpeg_executable_str = str(ffmpeg_executable)
+    def poll_relay_status() -> None:
+        nonlocal poll_id
+        poll_id = None
+        relay = session.relay
+        if relay is None:
+            return
+        holding = " (holding, waiting for OBS)" if relay.holding else ""
+        if relay.splicer.active == BACKUP:
+            holding = " (on the backup encoder)"
+        restarts = sum(output.restarts for output in relay.outputs)
+        restarted = f", {restarts} restarts" if restarts else ""
+        stream_status_label.configure(text=f"{len(relay.destination_urls)} Streams running{holding}{restarted}")
+        poll_id = window.after(500, poll_relay_status)
 
+    def start_ffmpeg_process() -> None:
+        nonlocal starting
+        if starting is not None:
+            return  # still busy with the last click
         # we need to assemble the URL of each remote host
         remote_host_urls = []
-        for remote_host_tuple_getter in get_remote_host_tuple_getters():
-            remote_host_url, remote_stream_key = remote_host_tuple_getter()
+        for remote_host_url, remote_stream_key in get_remote_hosts():
             remote_host_urls.append(f"{remote_host_url}/{remote_stream_key}")
 
-        # we need to assemble the command
-
-        tee_filter = "|".join([f"[f=flv]{url}" for url in remote_host_urls])
-
-        print(f"Starting {ffmpeg_executable_str}")
-        current_ffmpeg_subprocess = subprocess.Popen(
-            [
-                ffmpeg_executable_str,
-                "-i",
-                f"{get_stream_url()}/{get_stream_key()}",
-                "-c:v",
-                "copy",  # no reencoding
-                "-c:a",
-                "copy",
-                "-map",
-                "0",
-                "-f",
-                "tee",
-                tee_filter
-            ],
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-
-        stream_status_label.configure(text=f"{len(remote_host_urls)} Streams running")
+        session.hold = hold_booleanvar.get()
+        session.backup_stream_key = DEFAULT_BACKUP_STREAM_KEY if backup_booleanvar.get() else None
+        session.stall_timeout = get_stall_timeout()
+        stream_status_label.configure(text="Starting streams")
+        # starting can take seconds (auto:// measures its servers first), keep the window responding meanwhile
+        starting = loop.submit(start_relay(remote_host_urls))
+        window.after(50, check_started)
+
+    async def start_relay(remote_host_urls: list[str]) -> None:
+        await session.set_destinations(remote_host_urls)
+        await session.start_relay()
+
+    def check_started() -> None:
+        # tkinter only works from its own thread, so this polls the future instead of adding a callback to it
+        nonlocal starting, poll_id
+        if starting is None:
+            return
+        if not starting.done():
+            window.after(50, check_started)
+            return
+        error = starting.exception()
+        starting = None
+        if isinstance(error, ValueError):  # invalid # options, see DestinationOptions
+            stream_status_label.configure(text=f"Invalid destination: {error}")
+            return
+        if error is not None:
+            stream_status_label.configure(text=f"Could not start streams: {error!r}")
+            return
+        stream_status_label.configure(text=f"{len(session.destinations)} Streams running")
+        stop_polling()
+        poll_id = window.after(500, poll_relay_status)
 
     return stop_ffmpeg_process
 
 
-def create_restream_window(config: Shelf) -> tk.Tk:
+def pack_preview_widgets(window: tk.Tk, config: Shelf, loop: BackgroundLoop, session: RestreamSession) -> Callable[[], None]:
+    """
+    Returns a function that stops the preview
+    """
+
+    # Keyframes only, decoded in a child process, so the preview can't slow the streams down
+    preview_booleanvar = tk.BooleanVar(value=config.get("preview", False))
+    preview_checkbutton = tk.Checkbutton(window, text="Show preview", variable=preview_booleanvar)
+    preview_checkbutton.pack()
+    preview_image = tk.PhotoImage(width=PREVIEW_WIDTH, height=PREVIEW_HEIGHT)
+    preview_label = tk.Label(window, image=preview_image)
+    poll_id: str | None = None
+
+    def poll_preview() -> None:
+        nonlocal poll_id
+        if session.preview is not None:
+            frame = session.preview.latest()
+            if frame is not None:
+                preview_image.configure(data=frame.to_ppm(), format="PPM")
+        poll_id = window.after(250, poll_preview)
+
+    def stop_preview() -> None:
+        nonlocal poll_id
+        if poll_id is not None:
+            window.after_cancel(poll_id)
+            poll_id = None
+        if session.preview is not None:
+            loop.call(session.stop_preview())
+        preview_label.pack_forget()
+
+    def toggle_preview(*args) -> None:
+        config["preview"] = preview_booleanvar.get()
+        if preview_booleanvar.get():
+            stop_preview()
+            loop.call(session.start_preview())
+            preview_label.pack()
+            poll_preview()
+        else:
+            stop_preview()
+
+    preview_booleanvar.trace_add("write", toggle_preview)
+    if preview_booleanvar.get():
+        toggle_preview()
+
+    return stop_preview
+
+
+def create_restream_window(config: Shelf, control_port: int | None = None, tracer: Tracer | None = None) -> tk.Tk:
     # overall idea borrowed from https://obsproject.com/forum/resources/obs-studio-stream-to-multiple-platforms-or-channels-at-once.932/
     window = tk.Tk()
+    loop = BackgroundLoop()
+    session = RestreamSession(
+        backup_stream_key=DEFAULT_BACKUP_STREAM_KEY if config.get("backup_ingest", False) else None,
+        hold=config.get("hold_on_disconnect", True),
+        stall_timeout=config.get("stall_timeout", DEFAULT_STALL_TIMEOUT),
+        tracer=tracer,
+    )
+    control_server: ControlServer | None = None
+    if control_port is not None:
+        # lets automation reconfigure the running instance, see restreamlocal.control
+        control_server = ControlServer(session, port=control_port)
+        loop.call(control_server.start())
 
     # Set the window title
     window.title("ReStreamLocal")
@@ -431,13 +387,15 @@ def create_restream_window(config: Shelf) -> tk.Tk:
     spacing = tk.Label(window, text="")
     spacing.pack()
 
-    get_stream_url, get_stream_key, stop_mona_server = pack_monaserver_widgets(window)
+    stop_mona_server = pack_monaserver_widgets(window, loop, session)
 
     # Spacing
     spacing2 = tk.Label(window, text="")
     spacing2.pack()
 
-    stop_ffmpeg_process = pack_ffmpeg_client_widgets(window, config, get_stream_url, get_stream_key)
+    stop_ffmpeg_process = pack_ffmpeg_client_widgets(window, config, loop, session)
+
+    stop_preview = pack_preview_widgets(window, config, loop, session)
 
     # Spacing
     spacing3 = tk.Label(window, text="")
@@ -449,8 +407,12 @@ def create_restream_window(config: Shelf) -> tk.Tk:
     attribution.pack()
 
     def cleanup():
+        stop_preview()
         stop_ffmpeg_process()
         stop_mona_server()
+        if control_server is not None:
+            loop.call(control_server.close())
+        loop.stop()
         config.sync()
         window.destroy()
 
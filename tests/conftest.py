@@ -0,0 +1,16 @@
+"""Fixtures shared by the tests that run against fake executables, see tests/harness.py."""
+
+from pathlib import Path
+
+import pytest
+
+from .harness import FakeExecutables
+
+
+@pytest.fixture
+def fakes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> FakeExecutables:
+    """Fake executables, swapped in for the bundled ones."""
+    fake_executables = FakeExecutables(tmp_path)
+    fake_executables.install(monkeypatch)
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))  # keep fake slates out of the real cache
+    return fake_executables
@@ -0,0 +1,120 @@
+"""Stand-in for ffmpeg pulling the ingest, encoding the slate or a slow output, see tests/harness.py."""
+
+import os
+import socket
+import struct
+import sys
+import time
+from typing import Iterator
+
+
+FRAMERATE = 30
+FRAME_SIZE = int(os.environ.get("FAKE_FRAME_SIZE", "500"))
+INGEST_DURATION = float(os.environ.get("FAKE_INGEST_DURATION", "0"))  # 0 is forever
+SLATE_DELAY = float(os.environ.get("FAKE_SLATE_DELAY", "0"))  # seconds encoding the slate takes
+PRIMARY_STALL_AFTER = float(os.environ.get("FAKE_PRIMARY_STALL_AFTER", "0"))  # 0 is never, then hangs
+PAYLOAD = bytes(range(256)) * (FRAME_SIZE // 256 + 1)
+
+
+def tag(tag_type: int, timestamp: int, data: bytes) -> bytes:
+    header = bytes((tag_type,)) + len(data).to_bytes(3, "big") + (timestamp & 0xFFFFFF).to_bytes(3, "big")
+    return header + bytes((timestamp >> 24, 0, 0, 0)) + data + struct.pack(">I", 11 + len(data))
+
+
+def metadata() -> bytes:
+    body = b"\x02\x00\x0aonMetaData\x08" + struct.pack(">I", 3)
+    for key, value in (("width", 640.0), ("height", 360.0), ("framerate", float(FRAMERATE))):
+        body += struct.pack(">H", len(key)) + key.encode() + b"\x00" + struct.pack(">d", value)
+    return tag(18, 0, body + b"\x00\x00\x09")
+
+
+def frames(count: int) -> Iterator[bytes]:
+    """Header, metadata and sequence headers on the first call, then one video & audio frame per step."""
+    out = b"FLV\x01\x05\x00\x00\x00\x09\x00\x00\x00\x00" + metadata()
+    out += tag(9, 0, b"\x17\x00\x00\x00\x00fake-avcC") + tag(8, 0, b"\xaf\x00\x12\x10")
+    yield out
+    for frame in range(count):
+        timestamp = frame * 1000 // FRAMERATE
+        frame_type = b"\x17" if frame % FRAMERATE == 0 else b"\x27"
+        yield tag(9, timestamp, frame_type + b"\x01\x00\x00\x00" + PAYLOAD[:FRAME_SIZE])
+        yield tag(8, timestamp, b"\xaf\x01" + PAYLOAD[:32])
+
+
+def pull(url: str) -> None:
+    out = sys.stdout.buffer
+    count = int(INGEST_DURATION * FRAMERATE) if INGEST_DURATION else 2**31
+    stall_after = PRIMARY_STALL_AFTER if not url.endswith("_backup") else 0
+    start = time.monotonic()
+    try:
+        for index, chunk in enumerate(frames(count)):
+            if index % 2 == 1:  # pace on video frames
+                time.sleep(max(0.0, start + index // 2 / FRAMERATE - time.monotonic()))
+            if stall_after and time.monotonic() - start > stall_after:
+                time.sleep(86400)
+            out.write(chunk)
+            out.flush()
+    except BrokenPipeError:
+        pass
+
+
+def slate(path: str) -> None:
+    time.sleep(SLATE_DELAY)
+    with open(path, "wb") as file:
+        for chunk in frames(FRAMERATE):
+            file.write(chunk)
+
+
+def preview(args: list[str]) -> None:
+    """Raw RGB frames at the size and rate asked for with -vf fps=...,scale=W:H...
+
+    From a tcp:// input, only while it sends FLV, which is how a preview of the relay's tap is told apart.
+    """
+    filters = dict(part.split("=", 1) for part in args[args.index("-vf") + 1].split(",") if "=" in part)
+    width, height = (int(value) for value in filters["scale"].split(":")[:2])
+    fps = float(filters["fps"])
+    source = args[args.index("-i") + 1]
+    connection = None
+    if source.startswith("tcp://"):
+        host, port = source[len("tcp://") :].split(":")
+        connection = socket.create_connection((host, int(port)))
+        if connection.recv(3, socket.MSG_WAITALL) != b"FLV":
+            return
+    out = sys.stdout.buffer
+    frame = 0
+    start = time.monotonic()
+    try:
+        while True:
+            if connection is not None and not connection.recv(65536):
+                return
+            time.sleep(max(0.0, start + frame / fps - time.monotonic()))
+            out.write(bytes((frame % 256,)) * (width * height * 3))
+            out.flush()
+            frame += 1
+    except BrokenPipeError:
+        pass
+
+
+def sink(url: str) -> None:
+    """Swallows stdin no faster than fake://throttle/KBPS/... allows, reporting -progress blocks."""
+    rate = float(url.split("/")[3]) * 1000 / 8
+    stdin = sys.stdin.buffer
+    size = 0
+    start = time.monotonic()
+    while True:
+        chunk = stdin.read1(4096)
+        if not chunk:
+            break
+        size += len(chunk)
+        time.sleep(max(0.0, start + size / rate - time.monotonic()))
+        print(f"total_size={size}\nprogress=continue", flush=True)
+
+
+if __name__ == "__main__":
+    if sys.argv[1] == "pull":
+        pull(sys.argv[2])
+    elif sys.argv[1] == "sink":
+        sink(sys.argv[2])
+    elif sys.argv[1] == "preview":
+        preview(sys.argv[2:])
+    else:
+        slate(sys.argv[2])
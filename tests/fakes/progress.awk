@@ -0,0 +1,14 @@
+# Swallows an flv on stdin and reports ffmpeg style -progress blocks on stdout, see tests/harness.py.
+{
+    size += length($0) + 1
+    for (i = 0; i < flood; i++) print "[flv @ 0x0] pretending to complain about " size > "/dev/stderr"
+    if (size - reported >= 4096) {
+        printf "total_size=%d\nprogress=continue\n", size
+        fflush()
+        reported = size
+    }
+    if (crash_after && size > crash_after) exit 1
+}
+END {
+    printf "total_size=%d\nprogress=end\n", size
+}
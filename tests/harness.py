@@ -0,0 +1,176 @@
+"""Harness for driving RestreamSession with fake MonaServer & ffmpeg executables.
+
+The fakes live in tests/fakes and only need a POSIX shell, awk and Python, so the whole control plane (process
+spawning, fan-out, the watchdog, the hold) can be exercised offline with hundreds of destinations:
+
+- the fake ffmpeg pulls a paced synthetic FLV, "encodes" a slate, and swallows outputs while reporting
+  -progress blocks. Destinations named ``fake://stall/...``, ``fake://crash/...``, ``fake://flood/...`` and
+  ``fake://slow/...`` freeze, exit after a few KB, spam stderr or start late.
+  ``fake://throttle/KBPS/...`` only takes KBPS kbit/s, like a slow uplink.
+- the fake MonaServer honours FAKE_MONA_STARTUP_DELAY and FAKE_MONA_CRASH.
+- FAKE_INGEST_DURATION makes the ingest drop after that many seconds.
+- FAKE_PRIMARY_STALL_AFTER freezes the primary (not the backup) ingest after that many seconds.
+- FAKE_FRAME_SIZE sets the video frame size.
+- FAKE_SLATE_DELAY makes encoding the slate take that many seconds.
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Any
+from typing import Callable
+from typing import NamedTuple
+
+import pytest
+
+from restreamlocal import _assets
+from restreamlocal.session import RestreamSession
+
+
+FAKES = Path(__file__).parent / "fakes"
+
+
+class FakeExecutables:
+    """Copies the fakes into a temporary directory and swaps them in for the bundled binaries."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        shutil.copytree(FAKES, directory, dirs_exist_ok=True)
+        for name in ("ffmpeg", "MonaServer.exe"):
+            (directory / name).chmod(0o755)
+
+    def get_ffmpeg_executable(self) -> Path:
+        return self.directory / "ffmpeg"
+
+    def get_mona_server_directory(self) -> Path:
+        return self.directory
+
+    def install(self, monkeypatch: pytest.MonkeyPatch) -> None:
+        monkeypatch.setattr(_assets, "get_ffmpeg_executable", self.get_ffmpeg_executable)
+        monkeypatch.setattr(_assets, "get_mona_server_directory", self.get_mona_server_directory)
+        monkeypatch.setenv("FAKE_PYTHON", sys.executable)
+
+
+def get_rss() -> int:
+    """Resident set size of this process in bytes, 0 where /proc isn't available."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return 0
+
+
+async def wait_for(condition: Callable[[], bool], timeout: float, interval: float = 0.05) -> float:
+    """Wait until condition is true and return how long that took, or fail the test."""
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            pytest.fail(f"Condition not met within {timeout}s")
+        await asyncio.sleep(interval)
+    return time.perf_counter() - start
+
+
+class LoopLagProbe:
+    """Measures how late the event loop wakes up, a direct measure of how busy the supervisor is."""
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.max_lag = 0.0
+        self._task: asyncio.Task[None] | None = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, time.perf_counter() - start - self.interval)
+
+    def __enter__(self) -> "LoopLagProbe":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        assert self._task is not None
+        self._task.cancel()
+
+
+class ScaleReport(NamedTuple):
+    """What a scale run measured. Latencies are in seconds, memory in bytes."""
+
+    destinations: int
+    start_latency: float  # start_relay returning, every output spawned
+    first_progress_latency: float  # until every output reported bytes out
+    stop_latency: float
+    cpu_fraction: float  # of one core, for the supervisor process only, while steady
+    max_loop_lag: float
+    rss_growth: int
+    throughput: float  # bytes per second handed to the outputs, while steady
+    preview_frames: int = 0
+
+    def format(self) -> str:
+        return (
+            f"{self.destinations} destinations: start {self.start_latency * 1000:.0f}ms, "
+            f"all flowing {self.first_progress_latency * 1000:.0f}ms, stop {self.stop_latency * 1000:.0f}ms, "
+            f"supervisor cpu {self.cpu_fraction:.1%}, loop lag {self.max_loop_lag * 1000:.0f}ms, "
+            f"rss +{self.rss_growth / 2**20:.1f}MiB, throughput {self.throughput / 2**20:.2f}MiB/s"
+            + (f", {self.preview_frames} preview frames" if self.preview_frames else "")
+        )
+
+
+async def run_scale(
+    destinations: int, steady_seconds: float = 3.0, timeout: float = 120.0, preview: bool = False
+) -> ScaleReport:
+    """Start a session with that many healthy destinations, let it run, and measure the supervisor.
+
+    With preview, the keyframe preview runs too, polled the way the window polls it.
+    """
+    rss_before = get_rss()
+    async with RestreamSession() as session:
+        await session.start_ingest()
+        await session.set_destinations(f"fake://ok/{index}" for index in range(destinations))
+        preview_frames = 0
+        if preview:
+            await session.start_preview(max_fps=5)
+
+        with LoopLagProbe() as probe:
+            start = time.perf_counter()
+            await session.start_relay()
+            start_latency = time.perf_counter() - start
+            assert session.relay is not None
+            outputs = session.relay.outputs
+            first_progress_latency = start_latency + await wait_for(
+                lambda: all(output.total_size > 0 for output in outputs), timeout
+            )
+
+            cpu_start, wall_start = time.process_time(), time.perf_counter()
+            bytes_start = sum(output.bytes_in for output in outputs)
+            while time.perf_counter() - wall_start < steady_seconds:
+                await asyncio.sleep(0.1)
+                if session.preview is not None and session.preview.latest() is not None:
+                    preview_frames += 1
+            elapsed = time.perf_counter() - wall_start
+            cpu_fraction = (time.process_time() - cpu_start) / elapsed
+            throughput = (sum(output.bytes_in for output in outputs) - bytes_start) / elapsed
+            rss_growth = get_rss() - rss_before
+
+            start = time.perf_counter()
+            await session.stop_relay()
+            stop_latency = time.perf_counter() - start
+
+        assert not any(output.started for output in outputs)
+        return ScaleReport(
+            destinations,
+            start_latency,
+            first_progress_latency,
+            stop_latency,
+            cpu_fraction,
+            probe.max_lag,
+            rss_growth,
+            throughput,
+            preview_frames,
+        )
+
+
+__all__ = ("FakeExecutables", "LoopLagProbe", "ScaleReport", "run_scale", "wait_for")
@@ -0,0 +1,151 @@
+"""Test cases for the stream analyzer, against synthetic recordings with known timing."""
+
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from restreamlocal.flv import FLV_HEADER
+from restreamlocal.flv import TAG_TYPE_AUDIO
+from restreamlocal.flv import TAG_TYPE_VIDEO
+from restreamlocal.flv import FlvTag
+
+
+np = pytest.importorskip("numpy")
+
+from restreamlocal.__main__ import cli  # noqa: E402
+from restreamlocal.analyze import KEYFRAME  # noqa: E402
+from restreamlocal.analyze import FlvIndexer  # noqa: E402
+from restreamlocal.analyze import analyze  # noqa: E402
+from restreamlocal.analyze import format_report  # noqa: E402
+from restreamlocal.analyze import index_file  # noqa: E402
+from restreamlocal.analyze import index_stream  # noqa: E402
+from restreamlocal.analyze import tap  # noqa: E402
+
+from .harness import FakeExecutables  # noqa: E402
+
+
+FPS = 30
+GOP = 60  # frames
+AUDIO_INTERVAL = 1024 / 48  # ms, one AAC frame at 48kHz
+DRIFT = 0.001  # the audio clock runs 0.1% fast, 60ms per minute
+
+
+def recording(seconds: float, frame_size: int = 2000) -> bytes:
+    """Video & audio tags in the order an encoder emits them, with the audio timestamps drifting."""
+    tags = [
+        (0.0, FlvTag(TAG_TYPE_VIDEO, 0, b"\x17\x00\x00\x00\x00avcC")),
+        (0.0, FlvTag(TAG_TYPE_AUDIO, 0, b"\xaf\x00\x12\x10")),
+    ]
+    for frame in range(int(seconds * FPS)):
+        at = frame * 1000 / FPS
+        frame_type = b"\x17" if frame % GOP == 0 else b"\x27"
+        tags.append((at, FlvTag(TAG_TYPE_VIDEO, round(at), frame_type + b"\x01" + bytes(frame_size))))
+    for frame in range(int(seconds * 1000 / AUDIO_INTERVAL)):
+        at = frame * AUDIO_INTERVAL
+        tags.append((at, FlvTag(TAG_TYPE_AUDIO, round(at * (1 + DRIFT)), b"\xaf\x01" + bytes(300))))
+    tags.sort(key=lambda pair: pair[0])
+    return FLV_HEADER + b"".join(tag.encode() for _, tag in tags)
+
+
+@pytest.fixture(scope="module")
+def recorded(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    path = tmp_path_factory.mktemp("analyze") / "recording.flv"
+    path.write_bytes(recording(120))
+    return path
+
+
+def test_statistics(recorded: Path) -> None:
+    """Frame timing, GOPs, bitrate & drift come out as they were put in."""
+    report = analyze(index_file(recorded))
+    print(format_report(report))
+    assert report["video_frames"] == 120 * FPS
+    assert report["keyframes"] == 120 * FPS // GOP
+    assert report["fps"] == pytest.approx(FPS, rel=0.01)
+    assert report["frame_interval"]["std"] < 1  # 33 or 34ms
+    assert report["gop_length"]["mean"] == pytest.approx(GOP * 1000 / FPS, abs=1)
+    assert report["gop_frames"] == {"mean": GOP, "std": 0, "min": GOP, "max": GOP}
+    expected_kbps = (FPS * (2000 + 2 + 11) + 1000 / AUDIO_INTERVAL * (302 + 11)) * 8 / 1000
+    assert report["bitrate"]["mean"] == pytest.approx(expected_kbps, rel=0.05)
+    assert report["av_drift"]["per_minute"] == pytest.approx(DRIFT * 60_000, rel=0.1)
+    assert report["timestamps_backwards"] == 0
+    assert report["index_bytes"] == report["tags"] * 18
+
+
+def test_pieces(recorded: Path) -> None:
+    """Feeding a stream in arbitrary pieces indexes it exactly like the whole file, truncation included."""
+    data = recorded.read_bytes()[:-100]
+    indexer = FlvIndexer()
+    pending = b""
+    for start in range(0, len(data), 777):
+        pending += data[start : start + 777]
+        pending = pending[indexer.feed(pending) :]
+    pieces = indexer.index()
+    whole = FlvIndexer()
+    whole.feed(data)
+    expected = whole.index()
+    assert len(pieces) == len(expected) == analyze(index_file(recorded))["tags"] - 1
+    for name in ("offset", "size", "timestamp", "tag_type", "flags"):
+        assert np.array_equal(getattr(pieces, name), getattr(expected, name))
+    keyframe_offsets = expected.offset[(expected.flags & KEYFRAME) != 0]
+    assert data[keyframe_offsets[1] + 11] == 0x17
+
+
+def test_live_stream() -> None:
+    """A live stream is indexed as it arrives, with arrival times."""
+
+    async def test() -> None:
+        reader = asyncio.StreamReader()
+        reader.feed_data(recording(2))
+        reader.feed_eof()
+        index = await index_stream(reader, 5)
+        assert index.arrival is not None and len(index.arrival) == len(index)
+        assert "arrival_jitter" in analyze(index)
+
+    asyncio.run(test())
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="The fakes are POSIX shell scripts")
+def test_tap(fakes: FakeExecutables) -> None:
+    """A url is pulled through ffmpeg for the duration."""
+    index = asyncio.run(tap(str(fakes.get_ffmpeg_executable()), "rtmp://127.0.0.1/live/stream", 2))
+    report = analyze(index)
+    assert 30 < report["video_frames"] <= 2 * 30 + 1
+    assert report["fps"] == pytest.approx(30, rel=0.05)
+
+
+def test_large_recording(tmp_path: Path) -> None:
+    """An hour long recording is indexed & analyzed in seconds, in a small index."""
+    path = tmp_path / "hour.flv"
+    path.write_bytes(recording(3600, frame_size=100))
+    start = time.perf_counter()
+    index = index_file(path)
+    report = analyze(index)
+    elapsed = time.perf_counter() - start
+    print(f"{report['tags']} tags in {elapsed:.2f}s, index {index.nbytes / 2**20:.1f}MiB")
+    assert report["video_frames"] == 3600 * FPS
+    assert elapsed < 30
+
+
+def test_cli(recorded: Path) -> None:
+    """restreamlocal analyze prints the report, the GUI isn't started."""
+    result = CliRunner().invoke(cli, ["analyze", str(recorded), "--json"])
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output)["keyframes"] == 120 * FPS // GOP
+    result = CliRunner().invoke(cli, ["--control-port", "1936", "analyze", str(recorded)])
+    assert result.exit_code == 2 and "--control-port" in result.output  # refused rather than ignored
+
+
+__all__ = (
+    "recording",
+    "test_cli",
+    "test_large_recording",
+    "test_live_stream",
+    "test_pieces",
+    "test_statistics",
+    "test_tap",
+)
@@ -0,0 +1,203 @@
+"""Test cases for cascading between instances, the end to end test runs several on localhost."""
+
+import asyncio
+import socket
+import statistics
+import sys
+import time
+from typing import Any
+
+import pytest
+
+from restreamlocal.cascade import LinkOutput
+from restreamlocal.cascade import Topology
+from restreamlocal.cascade import TopologyError
+from restreamlocal.cascade import build_link_url
+from restreamlocal.cascade import link_token
+from restreamlocal.cascade import parse_link_url
+from restreamlocal.control import run_node
+from restreamlocal.flv import TAG_TYPE_VIDEO
+from restreamlocal.flv import FlvTag
+from restreamlocal.flv import build_flv_header
+from restreamlocal.output import redact_url
+from restreamlocal.relay import Relay
+from restreamlocal.session import RestreamSession
+from restreamlocal.trace import Tracer
+
+from .harness import FakeExecutables
+from .harness import wait_for
+
+
+TOKEN = "s3cret"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return int(sock.getsockname()[1])
+
+
+def topology(origin_port: int, edge_ports: list[int]) -> Topology:
+    edges = [f"edge-{index}" for index in range(len(edge_ports))]
+    nodes: dict[str, Any] = {"origin": {"destinations": ["fake://ok/origin"], "downstream": edges}}
+    for name, port in zip(edges, edge_ports):
+        destinations = [f"fake://ok/{name}/1", f"fake://ok/{name}/2"]
+        nodes[name] = {"link": f"127.0.0.1:{port}", "destinations": destinations}
+    return Topology.from_dict({"nodes": nodes, "token": TOKEN})
+
+
+class TestTopology:
+    """Test cases for declaring topologies."""
+
+    def test_destinations(self) -> None:
+        """Each node pushes to its own destinations and then to its downstream nodes."""
+        cascade = topology(0, [2000, 2001])
+        assert cascade.origin.name == "origin"
+        assert cascade.destinations_for("origin") == [
+            "fake://ok/origin",
+            "restreamlocal://s3cret@127.0.0.1:2000",
+            "restreamlocal://s3cret@127.0.0.1:2001",
+        ]
+        assert cascade.destinations_for("edge-1") == ["fake://ok/edge-1/1", "fake://ok/edge-1/2"]
+
+    @pytest.mark.parametrize(
+        "nodes",
+        [
+            {"a": {}, "b": {}},  # two origins
+            {"a": {"downstream": ["c"]}},  # unknown node
+            {"a": {"downstream": ["b"]}, "b": {}},  # b has no link
+            {"a": {}, "b": {"link": "h:1", "downstream": ["c"]}, "c": {"link": "h:2", "downstream": ["b"]}},
+            {"a": {"downstream": ["b"]}, "b": {"link": "h:1", "downstream": ["b"]}},  # two upstreams
+            {"a": {"downstream": "b"}},  # not a list
+            {"a": {"link": "h:port"}},
+        ],
+    )
+    def test_invalid(self, nodes: dict[str, Any]) -> None:
+        """Topologies that can't be run are rejected up front."""
+        with pytest.raises(TopologyError):
+            Topology.from_dict({"nodes": nodes, "token": TOKEN})
+
+    @pytest.mark.parametrize("token", [None, "", "two words", "a@b"])
+    def test_invalid_token(self, token: str | None) -> None:
+        """Links can't be run without a token."""
+        data: dict[str, Any] = {"nodes": {"a": {"downstream": ["b"]}, "b": {"link": "h:1"}}}
+        if token is not None:
+            data["token"] = token
+        with pytest.raises(TopologyError):
+            Topology.from_dict(data)
+        assert Topology.from_dict({"nodes": {"a": {}}}).token == ""  # a lone origin has no links
+
+    def test_parse_link_url(self) -> None:
+        assert parse_link_url("restreamlocal://10.0.0.2:2000/") == ("10.0.0.2", 2000)
+        assert parse_link_url("restreamlocal://edge") == ("edge", 1946)
+        assert parse_link_url("restreamlocal://s3cret@edge:2000") == ("edge", 2000)
+        assert link_token("restreamlocal://s3cret@edge:2000") == "s3cret"
+        assert link_token("restreamlocal://edge:2000") == ""
+        assert redact_url("restreamlocal://s3cret@edge:2000") == "restreamlocal://edge:2000"
+
+    def test_unknown_node(self) -> None:
+        with pytest.raises(TopologyError):
+            asyncio.run(run_node(topology(0, [2000]), "edge-7"))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="The fakes are POSIX shell scripts")
+def test_localhost_cascade(fakes: FakeExecutables) -> None:
+    """An origin feeds two edges on localhost, every destination flows and a hop adds little latency."""
+    edge_ports = [free_port(), free_port()]
+    cascade = topology(free_port(), edge_ports)
+    sent: dict[int, float] = {}
+    received: dict[int, float] = {}
+
+    async def test() -> None:
+        async with RestreamSession.from_topology(cascade, "origin") as origin, RestreamSession.from_topology(
+            cascade, "edge-0"
+        ) as edge_0, RestreamSession.from_topology(cascade, "edge-1") as edge_1:
+            for edge in (edge_0, edge_1):
+                await edge.start_relay()
+                assert edge.relay is not None
+                handle_tag = edge.relay._handle_tag
+                if edge is edge_0:  # the link carries the origin's tags as they were sent, match them up
+
+                    def record(source: str, tag: FlvTag, handle_tag: Any = handle_tag) -> None:
+                        if tag.tag_type == TAG_TYPE_VIDEO:
+                            received.setdefault(tag.timestamp, time.perf_counter())
+                        handle_tag(source, tag)
+
+                    edge.relay._handle_tag = record  # type: ignore[method-assign]
+            await origin.start_ingest()
+            await origin.start_relay()
+            assert origin.relay is not None
+            send = origin.relay._send
+
+            def record_send(tags: list[FlvTag]) -> None:
+                now = time.perf_counter()
+                for tag in tags:
+                    if tag.tag_type == TAG_TYPE_VIDEO:
+                        sent.setdefault(tag.timestamp, now)
+                send(tags)
+
+            origin.relay._send = record_send  # type: ignore[method-assign]
+            links = [output for output in origin.relay.outputs if isinstance(output, LinkOutput)]
+            assert len(links) == 2
+            outputs = [output for session in (origin, edge_0, edge_1) for output in session.relay.outputs]
+            await wait_for(lambda: all(output.total_size > 0 for output in outputs), timeout=20)
+            await wait_for(lambda: len(received) > 60, timeout=10)
+            assert all(output.restarts == 0 for output in outputs)
+
+    asyncio.run(test())
+
+    latencies = [received[timestamp] - sent[timestamp] for timestamp in received if timestamp in sent]
+    assert len(latencies) > 30
+    print(f"hop latency median {statistics.median(latencies) * 1000:.2f}ms max {max(latencies) * 1000:.2f}ms")
+    assert statistics.median(latencies) < 0.05
+
+
+def test_link_authentication() -> None:
+    """Only an upstream with the token gets in, and a new one replaces the one that was connected."""
+    port = free_port()
+    tag = FlvTag(TAG_TYPE_VIDEO, 0, b"\x17\x01" + bytes(100))
+
+    async def connect(token: str) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(token.encode() + b"\n" + build_flv_header() + tag.encode() * 10)
+        return reader, writer
+
+    async def test() -> None:
+        tracer = Tracer()
+        relay = Relay("ffmpeg", build_link_url("127.0.0.1", port, TOKEN), hold=False, tracer=tracer)
+        events = tracer.events
+        await relay.start()
+        await asyncio.sleep(0.1)
+        try:
+            for token in ("wrong", "", TOKEN + "x"):
+                reader, writer = await connect(token)
+                assert await asyncio.wait_for(reader.read(), 5) == b""  # dropped without being read
+                writer.close()
+            assert [event.name for event in events].count("ingest_rejected") == 3
+            assert not any(event.name == "ingest_connect" for event in events)
+
+            first_reader, first = await connect(TOKEN)
+            await wait_for(lambda: any(event.name == "ingest_connect" for event in events), timeout=5)
+            _, second = await connect(TOKEN)
+            assert await asyncio.wait_for(first_reader.read(), 5) == b""  # the first one was closed
+            await wait_for(lambda: [event.name for event in events].count("ingest_connect") == 2, timeout=5)
+            names = [event.name for event in events]
+            # the old connection is done before the new one starts
+            assert names.index("ingest_disconnect") < len(names) - 1 - names[::-1].index("ingest_connect")
+            assert relay._connected == {"live"}
+            first.close()
+            second.close()
+        finally:
+            await relay.stop()
+
+    asyncio.run(test())
+
+
+__all__ = (
+    "TOKEN",
+    "TestTopology",
+    "free_port",
+    "test_link_authentication",
+    "test_localhost_cascade",
+    "topology",
+)
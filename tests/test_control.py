@@ -0,0 +1,125 @@
+"""Test cases for the session & control socket."""
+
+import asyncio
+import pickle  # nosec
+
+import pytest
+
+from restreamlocal.control import ControlClient
+from restreamlocal.control import ControlError
+from restreamlocal.control import ControlServer
+from restreamlocal.session import RestreamSession
+
+
+async def with_control_server(test) -> None:  # type: ignore[no-untyped-def]
+    session = RestreamSession()
+    server = ControlServer(session, port=0)
+    await server.start()
+    client = ControlClient(port=server.port)
+    try:
+        await test(session, client)
+    finally:
+        await client.close()
+        await server.close()
+        await session.close()
+
+
+class TestControl:
+    """Test cases for reconfiguring a session over the control socket."""
+
+    def test_destinations(self) -> None:
+        """Destinations can be added, replaced and removed without a running relay."""
+
+        async def test(session: RestreamSession, client: ControlClient) -> None:
+            await client.call("add_destination", "rtmp://a/live/1")
+            await client.call("set_destinations", ["rtmp://a/live/1", "rtmp://b/live/2"])
+            await client.call("remove_destination", url="rtmp://a/live/1")
+            assert await client.call("list_destinations") == ["rtmp://b/live/2"]
+            assert session.destinations == ["rtmp://b/live/2"]
+            stats = await client.call("stats")
+            assert stats["relay"]["running"] is False
+
+        asyncio.run(with_control_server(test))
+
+    def test_errors(self) -> None:
+        """Unknown methods and bad params come back as JSON-RPC errors."""
+
+        async def test(session: RestreamSession, client: ControlClient) -> None:
+            with pytest.raises(ControlError) as error:
+                await client.call("format_disk")
+            assert error.value.code == -32601
+            with pytest.raises(ControlError) as error:
+                await client.call("add_destination", "a", "b")
+            assert error.value.code == -32602
+
+        asyncio.run(with_control_server(test))
+
+    def test_invalid_options(self) -> None:
+        """A destination with invalid # options is refused and leaves the session as it was."""
+
+        async def test(session: RestreamSession, client: ControlClient) -> None:
+            await client.call("add_destination", "rtmp://a/live/1")
+            for method, params in (
+                ("add_destination", ["rtmp://h/app/k#max_kbps=abc"]),
+                ("set_destinations", [["rtmp://b/live/2", "rtmp://h/app/k#tracks=none"]]),
+            ):
+                with pytest.raises(ControlError) as error:
+                    await client.call(method, *params)
+                assert error.value.code == -32602
+            assert session.destinations == ["rtmp://a/live/1"]
+
+        asyncio.run(with_control_server(test))
+
+    def test_set_destinations(self) -> None:
+        """The list is replaced in the given order, and a url that isn't a string changes nothing."""
+
+        async def test(session: RestreamSession, client: ControlClient) -> None:
+            await client.call("set_destinations", ["rtmp://a/live/1", "rtmp://b/live/2"])
+            await client.call("set_destinations", ["rtmp://c/live/3", "rtmp://a/live/1"])
+            assert session.destinations == ["rtmp://c/live/3", "rtmp://a/live/1"]
+            with pytest.raises(ControlError) as error:
+                await client.call("set_destinations", ["rtmp://b/live/2", 2])
+            assert error.value.code == -32602
+            assert session.destinations == ["rtmp://c/live/3", "rtmp://a/live/1"]
+
+        asyncio.run(with_control_server(test))
+
+    def test_set_buffer_budget(self) -> None:
+        """The budget takes a positive number of bytes, anything else is refused."""
+
+        async def test(session: RestreamSession, client: ControlClient) -> None:
+            for limit in (True, "1024", 0, -1, 1.5, None):
+                with pytest.raises(ControlError) as error:
+                    await client.call("set_buffer_budget", limit)
+                assert error.value.code == -32602
+            await client.call("set_buffer_budget", 2**20)
+            assert session.buffer_budget.limit == 2**20
+
+        asyncio.run(with_control_server(test))
+
+    def test_sync_errors(self) -> None:
+        """Errors raised by a method that isn't a coroutine come back as responses too."""
+
+        def refuse() -> None:
+            raise ValueError("refused")
+
+        def fail() -> None:
+            raise RuntimeError("failed")
+
+        async def test() -> None:
+            async with RestreamSession() as session:
+                server = ControlServer(session, port=0)
+                server.methods.update({"refuse": refuse, "fail": fail})
+                for method, code in (("refuse", -32602), ("fail", -32603)):
+                    response = await server.handle({"jsonrpc": "2.0", "id": 1, "method": method})
+                    assert response is not None and response["error"]["code"] == code
+
+        asyncio.run(test())
+
+    def test_error_pickles(self) -> None:
+        """A ControlError keeps its code and message through a copy."""
+        error = pickle.loads(pickle.dumps(ControlError(-32602, "refused")))  # nosec
+        assert (error.code, error.message, str(error)) == (-32602, "refused", "refused (-32602)")
+
+
+__all__ = ("TestControl",)
@@ -0,0 +1,97 @@
+"""Test cases for the flv module."""
+
+import asyncio
+import struct
+
+import pytest
+
+from restreamlocal.flv import FLV_HEADER
+from restreamlocal.flv import TAG_TYPE_AUDIO
+from restreamlocal.flv import TAG_TYPE_SCRIPT
+from restreamlocal.flv import TAG_TYPE_VIDEO
+from restreamlocal.flv import FlvError
+from restreamlocal.flv import FlvTag
+from restreamlocal.flv import decode_amf0
+from restreamlocal.flv import iter_flv_tags
+from restreamlocal.flv import parse_metadata
+from restreamlocal.flv import read_flv_tags
+
+
+def amf0_string(value: str) -> bytes:
+    return b"\x02" + struct.pack(">H", len(value)) + value.encode()
+
+
+def metadata_tag(**properties: float) -> FlvTag:
+    body = amf0_string("onMetaData") + b"\x08" + struct.pack(">I", len(properties))
+    for key, value in properties.items():
+        body += struct.pack(">H", len(key)) + key.encode() + b"\x00" + struct.pack(">d", value)
+    return FlvTag(TAG_TYPE_SCRIPT, 0, body + b"\x00\x00\x09")
+
+
+class TestFlvTag:
+    """Test cases for tag flags & serialization."""
+
+    def test_flags(self) -> None:
+        """AVC/AAC frame types are recognized."""
+        assert FlvTag(TAG_TYPE_VIDEO, 0, b"\x17\x00").is_sequence_header
+        assert FlvTag(TAG_TYPE_VIDEO, 0, b"\x17\x01").is_keyframe
+        assert not FlvTag(TAG_TYPE_VIDEO, 0, b"\x27\x01").is_keyframe
+        assert FlvTag(TAG_TYPE_AUDIO, 0, b"\xaf\x00").is_sequence_header
+        assert not FlvTag(TAG_TYPE_AUDIO, 0, b"\xaf\x01").is_header
+        assert FlvTag(TAG_TYPE_VIDEO, 0, b"\x90hvc1").is_keyframe  # enhanced rtmp
+
+    def test_round_trip(self) -> None:
+        """Encoded tags, including extended timestamps, parse back unchanged."""
+        tags = [
+            FlvTag(TAG_TYPE_VIDEO, 0x01020304, b"\x17\x01abc"),
+            FlvTag(TAG_TYPE_AUDIO, 7, b"\xaf\x01"),
+        ]
+        data = FLV_HEADER + b"".join(tag.encode() for tag in tags)
+        assert list(iter_flv_tags(data)) == tags
+        assert list(iter_flv_tags(data[:-5])) == tags[:1]
+
+    def test_read_stream(self) -> None:
+        """Tags can be read off an asyncio stream."""
+        tags = [FlvTag(TAG_TYPE_VIDEO, n, b"\x27\x01") for n in range(3)]
+
+        async def read() -> list[FlvTag]:
+            reader = asyncio.StreamReader()
+            reader.feed_data(FLV_HEADER + b"".join(tag.encode() for tag in tags))
+            reader.feed_eof()
+            return [tag async for tag in read_flv_tags(reader)]
+
+        assert asyncio.run(read()) == tags
+
+    def test_metadata(self) -> None:
+        """onMetaData properties are decoded."""
+        metadata = parse_metadata(metadata_tag(width=1920.0, framerate=60.0))
+        assert metadata == {"width": 1920.0, "framerate": 60.0}
+        assert parse_metadata(FlvTag(TAG_TYPE_AUDIO, 0, b"")) is None
+
+    def test_amf0(self) -> None:
+        """Every AMF0 type onMetaData uses is decoded, anything else is refused."""
+        data = (
+            b"\x01\x01"
+            + b"\x0c"
+            + struct.pack(">I", 4)
+            + b"long"
+            + b"\x03"
+            + struct.pack(">H", 1)
+            + b"k"
+            + b"\x05"
+            + b"\x00\x00\x09"
+            + b"\x0a"
+            + struct.pack(">I", 2)
+            + b"\x00"
+            + struct.pack(">d", 1.5)
+            + b"\x06"
+            + b"\x0b"
+            + struct.pack(">d", 1e12)
+            + bytes(2)
+        )
+        assert decode_amf0(data) == [True, "long", {"k": None}, [1.5, None], 1e12]
+        with pytest.raises(FlvError):
+            decode_amf0(b"\x11")
+
+
+__all__ = ("TestFlvTag", "metadata_tag")
@@ -0,0 +1,197 @@
+"""Test cases for playing recordings in place of the ingest."""
+
+import asyncio
+import mmap
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from typer.testing import CliRunner
+
+from restreamlocal.__main__ import cli
+from restreamlocal.flv import FLV_HEADER
+from restreamlocal.flv import TAG_TYPE_AUDIO
+from restreamlocal.flv import TAG_TYPE_VIDEO
+from restreamlocal.flv import FlvTag
+from restreamlocal.flv import iter_flv_tags
+from restreamlocal.playout import build_file_url
+from restreamlocal.playout import iter_mapped_flv
+from restreamlocal.playout import parse_file_url
+from restreamlocal.playout import play_file
+from restreamlocal.playout import read_file_tags
+from restreamlocal.session import RestreamSession
+
+from .harness import FakeExecutables
+from .harness import get_rss
+from .harness import wait_for
+
+
+posix_only = pytest.mark.skipif(sys.platform == "win32", reason="The fakes are POSIX shell scripts")
+
+
+def write_recording(path: Path, seconds: float, frame_size: int = 500) -> Path:
+    """30fps video with a keyframe every second, and audio."""
+    tags = [
+        FlvTag(TAG_TYPE_VIDEO, 0, b"\x17\x00\x00\x00\x00avcC"),
+        FlvTag(TAG_TYPE_AUDIO, 0, b"\xaf\x00\x12\x10"),
+    ]
+    for frame in range(int(seconds * 30)):
+        frame_type = b"\x17" if frame % 30 == 0 else b"\x27"
+        tags.append(FlvTag(TAG_TYPE_VIDEO, frame * 1000 // 30, frame_type + b"\x01" + bytes(frame_size)))
+        tags.append(FlvTag(TAG_TYPE_AUDIO, frame * 1000 // 30, b"\xaf\x01" + bytes(32)))
+    with open(path, "wb") as file:
+        file.write(FLV_HEADER)
+        for tag in tags:
+            file.write(tag.encode())
+    return path
+
+
+def test_file_url(tmp_path: Path) -> None:
+    path = tmp_path / "a recording.flv"
+    assert parse_file_url(build_file_url(path)) == (path, False)
+    assert parse_file_url(build_file_url(path, loop=True)) == (path, True)
+    assert parse_file_url("file:///C:/Videos/replay.mp4?loop=1") == (Path("C:/Videos/replay.mp4"), True)
+
+
+def test_mapped(tmp_path: Path) -> None:
+    """Reading through the mmap gives exactly the tags in the file, minus a truncated last one."""
+    path = write_recording(tmp_path / "recording.flv", 2)
+    data = path.read_bytes()
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        assert list(iter_mapped_flv(mapped, read_ahead=4096)) == list(iter_flv_tags(data))
+    path.write_bytes(data[:-10])
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        assert list(iter_mapped_flv(mapped)) == list(iter_flv_tags(data))[:-1]
+
+
+def test_pace_and_loop(tmp_path: Path) -> None:
+    """Tags come out at the pace of their timestamps, which keep increasing across passes of a loop."""
+    path = write_recording(tmp_path / "recording.flv", 1)
+
+    async def test() -> None:
+        tags = []
+        start = time.perf_counter()
+        async for tag in play_file(path, "ffmpeg", loop=True, speed=2):
+            tags.append(tag)
+            if len(tags) == 2 * (2 + 60):  # two passes
+                break
+        elapsed = time.perf_counter() - start
+        assert 0.8 < elapsed < 1.5  # two seconds of stream at double speed
+        for tag_type in (TAG_TYPE_VIDEO, TAG_TYPE_AUDIO):
+            timestamps = [tag.timestamp for tag in tags if tag.tag_type == tag_type and not tag.is_header]
+            assert all(later > earlier for earlier, later in zip(timestamps, timestamps[1:]))
+
+    asyncio.run(test())
+
+
+def test_steady_memory(tmp_path: Path) -> None:
+    """Memory doesn't grow with the file, played pages are dropped again."""
+    path = write_recording(tmp_path / "large.flv", 80, frame_size=40_000)  # ~96MB
+
+    async def test() -> None:
+        baseline = get_rss()
+        peak = 0
+        count = 0
+        async for _ in play_file(path, "ffmpeg", speed=1_000_000):
+            count += 1
+            if count % 200 == 0:
+                peak = max(peak, get_rss() - baseline)
+        print(f"peak growth {peak / 2**20:.1f}MiB")
+        assert count == 2 + 80 * 30 * 2
+        if sys.platform == "linux":
+            assert peak < 48 * 2**20
+
+    asyncio.run(test())
+
+
+@posix_only
+def test_remux(tmp_path: Path, fakes: FakeExecutables, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Anything that isn't FLV goes through ffmpeg."""
+    monkeypatch.setenv("FAKE_INGEST_DURATION", "1")
+    path = tmp_path / "recording.mp4"
+    path.write_bytes(b"\x00\x00\x00\x20ftypisom")
+
+    async def test() -> None:
+        tags = [tag async for tag in read_file_tags(path, str(fakes.get_ffmpeg_executable()))]
+        assert sum(tag.is_keyframe for tag in tags) == 1 + 1  # the sequence header & the first frame
+
+    asyncio.run(test())
+
+
+@posix_only
+def test_session(tmp_path: Path, fakes: FakeExecutables) -> None:
+    """A session plays the file to its destinations without MonaServer, and holds when it's done."""
+    path = write_recording(tmp_path / "recording.flv", 2)
+
+    async def test() -> None:
+        async with RestreamSession(playout=path) as session:
+            await session.add_destination("fake://ok/1")
+            await session.start_relay()
+            relay = session.relay
+            assert relay is not None
+            await wait_for(lambda: relay.outputs[0].total_size > 0, timeout=10)
+            await asyncio.wait_for(relay.playout_done.wait(), 10)
+            await wait_for(lambda: relay.holding, timeout=10)
+            assert not session.ingest_running
+
+    asyncio.run(test())
+
+
+@posix_only
+def test_preview(tmp_path: Path, fakes: FakeExecutables) -> None:
+    """The preview of a playout shows what the relay plays, through a tap, as MonaServer isn't running."""
+    path = write_recording(tmp_path / "recording.flv", 2)
+
+    async def test() -> None:
+        async with RestreamSession(playout=path, playout_loop=True) as session:
+            await session.start_preview(max_fps=5)
+            preview = session.preview
+            assert preview is not None and "tcp://127.0.0.1:" in " ".join(preview.command)
+            await asyncio.sleep(1.5)
+            assert preview.latest() is None  # nothing to tap before the relay starts
+            await session.add_destination("fake://ok/1")
+            await session.start_relay()
+            relay = session.relay
+            assert relay is not None
+            await wait_for(lambda: preview.latest() is not None, timeout=10)
+            assert len(relay.taps) == 1 and relay.outputs[0].url == "fake://ok/1"
+            await session.stop_preview()
+            assert not relay.taps
+
+    asyncio.run(test())
+
+
+@posix_only
+def test_cli(tmp_path: Path, fakes: FakeExecutables) -> None:
+    """restreamlocal playout exits once a file that doesn't loop has been played."""
+    path = write_recording(tmp_path / "recording.flv", 1)
+    result = CliRunner().invoke(cli, ["playout", str(path), "fake://ok/1", "fake://ok/2"])
+    assert result.exit_code == 0, result.output
+    assert "Playing" in result.output
+
+
+@posix_only
+def test_cli_options_before(tmp_path: Path, fakes: FakeExecutables) -> None:
+    """--trace before the subcommand applies to it, --topology can't be combined with one."""
+    path = write_recording(tmp_path / "recording.flv", 1)
+    trace = tmp_path / "trace.jsonl"
+    result = CliRunner().invoke(cli, ["--trace", str(trace), "playout", str(path), "fake://ok/1"])
+    assert result.exit_code == 0, result.output
+    assert '"event": "relay_start"' in trace.read_text()
+    result = CliRunner().invoke(cli, ["--topology", str(path), "playout", str(path), "fake://ok/1"])
+    assert result.exit_code == 2 and "--topology" in result.output
+
+
+__all__ = (
+    "test_cli",
+    "test_cli_options_before",
+    "test_file_url",
+    "test_mapped",
+    "test_pace_and_loop",
+    "test_preview",
+    "test_remux",
+    "test_session",
+    "test_steady_memory",
+    "write_recording",
+)
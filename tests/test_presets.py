@@ -0,0 +1,164 @@
+"""Test cases for picking ingest servers, against stand-in RTMP servers on localhost."""
+
+import asyncio
+import math
+import sys
+
+import pytest
+
+from restreamlocal.output import redact_url
+from restreamlocal.presets import IngestSelector
+from restreamlocal.presets import Preset
+from restreamlocal.presets import measure_rtt
+from restreamlocal.presets import split_auto_url
+from restreamlocal.session import RestreamSession
+
+from .harness import FakeExecutables
+from .harness import wait_for
+
+
+class StandIn:
+    """Answers the first RTMP handshake message after delay seconds, and counts connections."""
+
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+        self.connections = 0
+        self.server: asyncio.AbstractServer | None = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            await reader.readexactly(1537)
+            await asyncio.sleep(self.delay)
+            writer.write(b"\x03" + bytes(1536))
+            await reader.read()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return f"rtmp://127.0.0.1:{self.server.sockets[0].getsockname()[1]}/app"
+
+    def close(self) -> None:
+        assert self.server is not None
+        self.server.close()
+
+
+async def stand_ins(*delays: float) -> tuple[list[StandIn], list[str]]:
+    servers = [StandIn(delay) for delay in delays]
+    return servers, [await server.start() for server in servers]
+
+
+def test_split_auto_url() -> None:
+    assert split_auto_url("auto://twitch/live_123") == ("twitch", "live_123")
+    assert split_auto_url("auto://twitch") == ("twitch", "")
+    with pytest.raises(ValueError):
+        split_auto_url("rtmp://twitch/live_123")
+
+
+def test_redact_auto_url() -> None:
+    """The stream key of an auto:// url never gets printed."""
+    assert redact_url("auto://twitch/live_123_SECRET") == "auto://twitch"
+    assert redact_url("auto://youtube/a/b#tracks=audio") == "auto://youtube"
+    assert redact_url("auto://twitch") == "auto://twitch"
+
+
+def test_measure_rtt() -> None:
+    """The handshake is timed, and servers that don't answer it are infinitely far away."""
+
+    async def test() -> None:
+        servers, (url,) = await stand_ins(0.05)
+        assert 0.05 <= await measure_rtt(url, attempts=2) < 0.5
+        assert servers[0].connections == 2
+        assert await measure_rtt("rtmp://127.0.0.1:1/app") == math.inf  # nothing listens on port 1
+        assert await measure_rtt("rtmp://does-not-exist.invalid/app", timeout=1) == math.inf
+
+        async def hang_up(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+            writer.close()
+
+        server = await asyncio.start_server(hang_up, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        assert await measure_rtt(f"rtmp://127.0.0.1:{port}/app") == math.inf
+        server.close()
+        servers[0].close()
+
+    asyncio.run(test())
+
+
+class TestIngestSelector:
+    """Test cases for choosing, caching & refreshing."""
+
+    def test_fastest(self) -> None:
+        """The fastest server wins, one measurement serves every output starting at once."""
+
+        async def test() -> None:
+            servers, urls = await stand_ins(0.2, 0.01, 0.1)
+            selector = IngestSelector({"local": Preset("local", tuple(urls))}, attempts=1)
+            keys = [f"key{index}" for index in range(10)]
+            resolved = await asyncio.gather(*(selector.resolve(f"auto://local/{key}") for key in keys))
+            assert resolved == [f"{urls[1]}/{key}" for key in keys]
+            assert [server.connections for server in servers] == [1, 1, 1]
+            assert await selector.resolve("auto://local") == urls[1]
+            assert [server.connections for server in servers] == [1, 1, 1]  # cached
+            assert await selector.resolve("rtmp://elsewhere/app/key") == "rtmp://elsewhere/app/key"
+            assert await selector.resolve("auto://nowhere/key") == "auto://nowhere/key"
+            assert selector.stats()["local"]["url"] == urls[1]
+            for server in servers:
+                server.close()
+
+        asyncio.run(test())
+
+    def test_refresh(self) -> None:
+        """Choices are re-measured in the background before they expire."""
+
+        async def test() -> None:
+            servers, urls = await stand_ins(0.01, 0.1)
+            selector = IngestSelector({"local": Preset("local", tuple(urls))}, ttl=0.5, attempts=1)
+            refresh = asyncio.create_task(selector.run())
+            assert await selector.select("local") == urls[0]
+            servers[0].delay = 0.3
+            servers[1].delay = 0.0
+            await wait_for(lambda: selector.selections["local"].url == urls[1], timeout=5)
+            # refreshed ahead of time, so selecting doesn't have to wait for a measurement
+            assert await asyncio.wait_for(selector.select("local"), 0.05) == urls[1]
+            refresh.cancel()
+            for server in servers:
+                server.close()
+
+        asyncio.run(test())
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="The fakes are POSIX shell scripts")
+def test_auto_destination(fakes: FakeExecutables) -> None:
+    """An auto:// destination is pushed to the preset's fastest server."""
+
+    async def test() -> None:
+        servers, urls = await stand_ins(0.1, 0.0)
+        async with RestreamSession() as session:
+            session.ingest_selector = IngestSelector({"local": Preset("local", tuple(urls))}, attempts=1)
+            await session.start_ingest()
+            await session.add_destination("auto://local/key")
+            await session.start_relay()
+            assert session.relay is not None
+            output = session.relay.outputs[0]
+            assert output.target_url == f"{urls[1]}/key"
+            assert output.build_command()[-1] == output.target_url
+            assert output.name == "auto://local" and "/key" not in str(output.stats())
+            await wait_for(lambda: output.total_size > 0, timeout=10)
+        for server in servers:
+            server.close()
+
+    asyncio.run(test())
+
+
+__all__ = (
+    "StandIn",
+    "TestIngestSelector",
+    "stand_ins",
+    "test_auto_destination",
+    "test_measure_rtt",
+    "test_redact_auto_url",
+    "test_split_auto_url",
+)
@@ -0,0 +1,52 @@
+"""Test cases for the preview module."""
+
+from multiprocessing.shared_memory import SharedMemory
+
+from restreamlocal.preview import FRAME_OFFSET
+from restreamlocal.preview import PreviewFrame
+from restreamlocal.preview import build_preview_command
+from restreamlocal.preview import read_frame
+from restreamlocal.preview import write_frame
+
+
+class TestSequenceLock:
+    """Test cases for passing frames through shared memory."""
+
+    def test_write_then_read(self) -> None:
+        shared_memory = SharedMemory(create=True, size=FRAME_OFFSET + 12)
+        try:
+            buffer = shared_memory.buf
+            buffer[:FRAME_OFFSET] = bytes(FRAME_OFFSET)
+            assert read_frame(buffer, 12) is None  # nothing written yet
+            write_frame(buffer, b"a" * 12)
+            write_frame(buffer, b"b" * 12)
+            result = read_frame(buffer, 12)
+            assert result is not None
+            sequence, _, frame = result
+            assert (sequence, frame) == (4, b"b" * 12)
+        finally:
+            del buffer
+            shared_memory.close()
+            shared_memory.unlink()
+
+    def test_torn_read(self) -> None:
+        """A frame that is being written is never returned."""
+        buffer = memoryview(bytearray(FRAME_OFFSET + 4))
+        write_frame(buffer, b"abcd")
+        buffer[0] = 3  # odd, as if a write were in progress
+        assert read_frame(buffer, 4) is None
+
+
+def test_ppm() -> None:
+    frame = PreviewFrame(1, 0.0, 2, 1, b"\xff\x00\x00\x00\xff\x00")
+    assert frame.to_ppm() == b"P6 2 1 255\n" + frame.rgb
+
+
+def test_command_only_decodes_keyframes() -> None:
+    command = build_preview_command("ffmpeg", "rtmp://127.0.0.1:1935/live/stream", max_fps=0.5)
+    assert command[command.index("-skip_frame") + 1] == "nokey"
+    assert command.index("-skip_frame") < command.index("-i")
+    assert "fps=0.5" in command[command.index("-vf") + 1]
+
+
+__all__ = ("TestSequenceLock",)
@@ -0,0 +1,111 @@
+"""Test cases for the relay module."""
+
+from restreamlocal.flv import TAG_TYPE_AUDIO
+from restreamlocal.flv import TAG_TYPE_VIDEO
+from restreamlocal.flv import FlvTag
+from restreamlocal.relay import BACKUP
+from restreamlocal.relay import FILLER
+from restreamlocal.relay import LIVE
+from restreamlocal.relay import Relay
+from restreamlocal.relay import SlateParams
+from restreamlocal.relay import Splicer
+
+
+VIDEO_HEADER = FlvTag(TAG_TYPE_VIDEO, 0, b"\x17\x00header")
+KEYFRAME = b"\x17\x01"
+INTERFRAME = b"\x27\x01"
+
+
+def video(timestamp: int, keyframe: bool = False) -> FlvTag:
+    return FlvTag(TAG_TYPE_VIDEO, timestamp, KEYFRAME if keyframe else INTERFRAME)
+
+
+class TestSplicer:
+    """Test cases for the Splicer."""
+
+    def test_joins_on_keyframe(self) -> None:
+        """Nothing is sent until the first keyframe, which is preceded by the headers."""
+        splicer = Splicer()
+        splicer.switch_to(LIVE)
+        assert splicer.push(LIVE, VIDEO_HEADER) == []
+        assert splicer.push(LIVE, video(1000)) == []
+        out = splicer.push(LIVE, video(1033, keyframe=True))
+        assert [tag.data for tag in out] == [VIDEO_HEADER.data, KEYFRAME]
+        assert splicer.active == LIVE
+
+    def test_switch_keeps_timeline_continuous(self) -> None:
+        """Switching to the filler and back never moves timestamps backwards."""
+        splicer = Splicer()
+        splicer.switch_to(LIVE)
+        splicer.push(LIVE, VIDEO_HEADER)
+        emitted = splicer.push(LIVE, video(5000, keyframe=True)) + splicer.push(LIVE, video(5040))
+        splicer.switch_to(FILLER)
+        emitted += splicer.push(FILLER, VIDEO_HEADER._replace(data=b"\x17\x00slate"))
+        emitted += splicer.push(FILLER, video(0, keyframe=True))
+        assert splicer.active == FILLER
+        assert emitted[-2].data == b"\x17\x00slate"  # filler headers are re-sent
+        emitted += splicer.push(FILLER, video(40))
+        splicer.switch_to(LIVE)
+        assert splicer.push(LIVE, video(100)) == []  # a reconnected source waits for a keyframe
+        emitted += splicer.push(FILLER, video(80))
+        assert emitted[-1].data == INTERFRAME  # and the filler keeps going meanwhile
+        emitted += splicer.push(LIVE, video(133, keyframe=True))
+        assert splicer.active == LIVE
+        timestamps = [tag.timestamp for tag in emitted if tag.is_video and not tag.is_header]
+        assert timestamps == sorted(timestamps)
+        assert timestamps[-1] - timestamps[-2] == 40  # spaced by the observed frame gap
+
+    def test_audio_only_source(self) -> None:
+        """Sources without video switch on their first audio frame."""
+        splicer = Splicer()
+        splicer.switch_to(LIVE)
+        assert splicer.push(LIVE, FlvTag(TAG_TYPE_AUDIO, 10, b"\xaf\x01"))
+        assert splicer.active == LIVE
+
+
+class TestFailover:
+    """Test cases for switching between the primary & backup ingest."""
+
+    def test_failover_and_back(self) -> None:
+        """The backup takes over on its keyframe once the primary is quiet, and hands back the same way."""
+        relay = Relay("ffmpeg", "rtmp://local/live/stream", backup_ingest_url="rtmp://local/live/backup")
+        relay._connected.update((LIVE, BACKUP))
+        for source in (LIVE, BACKUP):
+            relay._handle_tag(source, VIDEO_HEADER)
+        relay._handle_tag(LIVE, video(0, keyframe=True))
+        relay._handle_tag(BACKUP, video(500, keyframe=True))
+        assert relay.splicer.active == LIVE
+
+        relay._last_tag_at[LIVE] -= relay.failover_timeout  # the primary froze
+        relay._handle_tag(BACKUP, video(533))
+        assert relay.splicer.pending == BACKUP and relay.splicer.active == LIVE
+        relay._handle_tag(BACKUP, video(566, keyframe=True))
+        assert relay.splicer.active == BACKUP
+        assert relay.failover_times[0] >= relay.failover_timeout
+
+        relay._handle_tag(LIVE, video(40))
+        assert relay.splicer.pending == LIVE
+        relay._handle_tag(LIVE, video(80, keyframe=True))
+        assert relay.splicer.active == LIVE
+        assert len(relay.failover_times) == 1  # handing back to the primary isn't a failover
+
+    def test_recovered_before_switch(self) -> None:
+        """A primary that recovers before the backup reaches a keyframe stays on without a rejoin."""
+        relay = Relay("ffmpeg", "rtmp://local/live/stream", backup_ingest_url="rtmp://local/live/backup")
+        relay._connected.update((LIVE, BACKUP))
+        relay._handle_tag(LIVE, video(0, keyframe=True))
+        relay._last_tag_at[LIVE] -= relay.failover_timeout
+        relay._handle_tag(BACKUP, video(500))
+        assert relay.splicer.pending == BACKUP
+        relay._handle_tag(LIVE, video(40))
+        assert relay.splicer.pending is None
+        assert relay.splicer.switches == 1
+
+
+def test_slate_params_from_metadata() -> None:
+    """Odd sizes are rounded down and missing values fall back to the defaults."""
+    params = SlateParams.from_metadata({"width": 1281.0, "height": 720.0, "framerate": 60.0})
+    assert params == SlateParams(width=1280, height=720, framerate=60)
+
+
+__all__ = ("TestFailover", "TestSplicer")
@@ -0,0 +1,194 @@
+"""Control-plane tests against fake MonaServer & ffmpeg executables, see tests/harness.py.
+
+Set RESTREAMLOCAL_SCALE_DESTINATIONS to run the scale test with more destinations, e.g. 1000, and
+RESTREAMLOCAL_SOAK_SECONDS to run the buffer budget soak for longer, e.g. 10800 for three hours.
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+from restreamlocal.relay import BACKUP
+from restreamlocal.relay import FILLER
+from restreamlocal.relay import LIVE
+from restreamlocal.session import RestreamSession
+
+from .harness import FakeExecutables
+from .harness import get_rss
+from .harness import run_scale
+from .harness import wait_for
+
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="The fakes are POSIX shell scripts")
+
+SCALE_DESTINATIONS = int(os.environ.get("RESTREAMLOCAL_SCALE_DESTINATIONS", "25"))
+SOAK_SECONDS = float(os.environ.get("RESTREAMLOCAL_SOAK_SECONDS", "10"))
+
+
+class TestControlPlane:
+    """Test cases for process orchestration."""
+
+    def test_scale(self, fakes: FakeExecutables) -> None:
+        """Every destination starts flowing and the supervisor stops them all promptly."""
+        report = asyncio.run(run_scale(SCALE_DESTINATIONS))
+        print(report.format())
+        assert report.stop_latency < 10
+        assert report.max_loop_lag < 1
+
+    def test_preview(self, fakes: FakeExecutables) -> None:
+        """The preview delivers frames without slowing the relay down, compare the two printed reports."""
+        baseline = asyncio.run(run_scale(SCALE_DESTINATIONS))
+        report = asyncio.run(run_scale(SCALE_DESTINATIONS, preview=True))
+        print(baseline.format())
+        print(report.format())
+        assert report.preview_frames > 0
+        assert report.max_loop_lag < 1
+        assert report.throughput > baseline.throughput * 0.8
+
+    def test_faulty_outputs(self, fakes: FakeExecutables) -> None:
+        """Frozen and crashing outputs are restarted, healthy, noisy & slow starting ones are left alone."""
+
+        async def test() -> None:
+            async with RestreamSession(stall_timeout=3) as session:
+                await session.start_ingest()
+                await session.set_destinations(
+                    ["fake://ok/1", "fake://flood/2", "fake://slow/3", "fake://stall/4", "fake://crash/5"]
+                )
+                await session.start_relay()
+                assert session.relay is not None
+                ok, flood, slow, stall, crash = session.relay.outputs
+                await wait_for(lambda: stall.restarts > 0 and crash.restarts > 0, timeout=20)
+                await wait_for(lambda: slow.total_size > 0, timeout=20)
+                assert (ok.restarts, flood.restarts, slow.restarts) == (0, 0, 0)
+                assert ok.total_size > 0 and flood.total_size > 0
+                assert session.relay.watchdog.stalls_detected >= 1
+                assert session.relay.watchdog.crashes_detected >= 1
+
+        asyncio.run(test())
+
+    def test_hold(self, fakes: FakeExecutables, monkeypatch: pytest.MonkeyPatch) -> None:
+        """When the ingest drops the outputs are held on the slate, and the ingest comes back later."""
+        monkeypatch.setenv("FAKE_INGEST_DURATION", "1")
+
+        async def test() -> None:
+            async with RestreamSession() as session:
+                await session.start_ingest()
+                await session.add_destination("fake://ok/1")
+                await session.start_relay()
+                relay = session.relay
+                assert relay is not None
+                await wait_for(lambda: relay.holding, timeout=10)
+                await wait_for(lambda: not relay.holding, timeout=10)
+                assert relay.outputs[0].restarts == 0
+
+        asyncio.run(test())
+
+    def test_reconnect_while_encoding_slate(
+        self, fakes: FakeExecutables, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        """An ingest that is back by the time the slate is encoded isn't cut to the slate."""
+        monkeypatch.setenv("FAKE_INGEST_DURATION", "2")
+        monkeypatch.setenv("FAKE_SLATE_DELAY", "2")  # the ingest reconnects after 1s
+
+        async def test() -> None:
+            async with RestreamSession() as session:
+                await session.start_ingest()
+                await session.add_destination("fake://ok/1")
+                await session.start_relay()
+                relay = session.relay
+                assert relay is not None
+                switches: list[tuple[str, bool]] = []
+                switch_to = relay.splicer.switch_to
+
+                def record(source: str) -> None:
+                    switches.append((source, bool(relay._connected)))
+                    switch_to(source)
+
+                relay.splicer.switch_to = record  # type: ignore[method-assign]
+                await wait_for(lambda: relay._filler_task is not None, timeout=10)
+                filler_task = relay._filler_task
+                assert filler_task is not None
+                await asyncio.wait_for(filler_task, 10)
+                assert (FILLER, True) not in switches
+                assert not relay.holding
+
+        asyncio.run(test())
+
+    def test_failover(self, fakes: FakeExecutables, monkeypatch: pytest.MonkeyPatch) -> None:
+        """A frozen primary fails over to the backup within a GOP, and comes back once it reconnects."""
+        monkeypatch.setenv("FAKE_PRIMARY_STALL_AFTER", "2")
+
+        async def test() -> None:
+            async with RestreamSession(backup_stream_key="stream_backup") as session:
+                await session.start_ingest()
+                await session.add_destination("fake://ok/1")
+                await session.start_relay()
+                relay = session.relay
+                assert relay is not None
+                await wait_for(lambda: relay.splicer.active == LIVE, timeout=10)
+                await wait_for(lambda: relay.splicer.active == BACKUP, timeout=10)
+                assert not relay.holding
+                # timeout to notice, plus at most one GOP (1s in the fakes) to the backup's keyframe
+                assert relay.failover_times[0] < relay.failover_timeout + 1.5
+                await wait_for(lambda: relay.splicer.active == LIVE, timeout=20)
+                assert relay.outputs[0].restarts == 0
+
+        asyncio.run(test())
+
+    def test_buffer_budget_soak(self, fakes: FakeExecutables, monkeypatch: pytest.MonkeyPatch) -> None:
+        """Outputs on uplinks slower than the stream stay within the budget, and memory stays flat."""
+        monkeypatch.setenv("FAKE_FRAME_SIZE", "20000")  # ~4.8Mbit/s
+        limit = 4 * 2**20
+
+        async def test() -> None:
+            async with RestreamSession(buffer_budget=limit) as session:
+                await session.start_ingest()
+                await session.set_destinations(
+                    [
+                        "fake://ok/1",
+                        "fake://throttle/2000/2#priority=1",
+                        "fake://throttle/1000/3",
+                        "fake://throttle/1000/4",
+                    ]
+                )
+                await session.start_relay()
+                assert session.relay is not None
+                outputs = session.relay.outputs
+                ok, high, *low = outputs
+                budget = session.buffer_budget
+                await wait_for(lambda: budget.evictions > 0, timeout=30)  # the budget is full
+                rss_start = get_rss()
+                rss_peak = rss_start
+                start = time.monotonic()
+                while time.monotonic() - start < SOAK_SECONDS:
+                    await asyncio.sleep(0.25)
+                    assert budget.used == sum(output.buffered_bytes for output in outputs) <= limit
+                    rss_peak = max(rss_peak, get_rss())
+                print(session.stats()["buffer_budget"], f"rss +{(rss_peak - rss_start) / 2**20:.1f}MiB")
+                assert budget.peak <= limit
+                assert rss_peak - rss_start < limit
+                assert all(output.restarts == 0 for output in outputs)
+                assert ok.total_size > 0 and high.total_size > 0
+                assert high.evictions < min(output.evictions for output in low)
+                await session.stop_relay()
+                assert budget.used == 0  # nothing stays counted for the next relay
+
+        asyncio.run(test())
+
+    def test_mona_server_crash(self, fakes: FakeExecutables, monkeypatch: pytest.MonkeyPatch) -> None:
+        """A MonaServer that exits on startup is reported instead of silently ignored."""
+        monkeypatch.setenv("FAKE_MONA_CRASH", "1")
+
+        async def test() -> None:
+            async with RestreamSession() as session:
+                with pytest.raises(RuntimeError):
+                    await session.start_ingest()
+                assert not session.ingest_running
+
+        asyncio.run(test())
+
+
+__all__ = ("TestControlPlane",)
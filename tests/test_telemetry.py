@@ -0,0 +1,58 @@
+"""Test cases for the telemetry module."""
+
+import pytest
+
+from restreamlocal.telemetry import DEFAULT_HISTORY
+from restreamlocal.telemetry import OutputTelemetry
+from restreamlocal.telemetry import RingBuffer
+from restreamlocal.telemetry import parse_rate
+
+
+class TestRingBuffer:
+    """Test cases for the RingBuffer."""
+
+    def test_wraps_around(self) -> None:
+        """Only the newest samples are kept, oldest first."""
+        buffer = RingBuffer(4)
+        for value in range(6):
+            buffer.append(value)
+        assert buffer.last() == [2, 3, 4, 5]
+        assert buffer.last(3) == [3, 4, 5]
+        assert buffer.last(10) == [2, 3, 4, 5]
+        assert len(buffer) == 4 and buffer.appended == 6
+
+    def test_partially_filled(self) -> None:
+        buffer = RingBuffer(4)
+        assert buffer.last() == []
+        buffer.append(1.5)
+        assert list(buffer) == [1.5]
+
+    def test_clamps_integers(self) -> None:
+        """Integer buffers round and clamp instead of raising OverflowError."""
+        buffer = RingBuffer(3, "B")
+        for value in (-1, 2.6, 1000):
+            buffer.append(value)
+        assert buffer.last() == [0, 3, 255]
+
+    def test_empty_capacity(self) -> None:
+        with pytest.raises(ValueError):
+            RingBuffer(0)
+
+
+def test_output_telemetry_size() -> None:
+    """Two hours of history fit in a few KB per destination."""
+    telemetry = OutputTelemetry()
+    for _ in range(DEFAULT_HISTORY * 2):
+        telemetry.append(6000.5, 60, 3)
+    assert telemetry.nbytes == DEFAULT_HISTORY * 5 < 8 * 1024
+    assert telemetry.bitrate.last(1) == [6000]
+
+
+def test_parse_rate() -> None:
+    assert parse_rate("2500.3kbits/s") == 2500.3
+    assert parse_rate(" 29.97") == 29.97
+    assert parse_rate("N/A") == 0
+    assert parse_rate("1.2.3") == 0
+
+
+__all__ = ("TestRingBuffer",)
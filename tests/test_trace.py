@@ -0,0 +1,148 @@
+"""Test cases for the lifecycle event trace."""
+
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from restreamlocal.control import ControlServer
+from restreamlocal.session import RestreamSession
+from restreamlocal.trace import OUTPUT_STAGES
+from restreamlocal.trace import TraceEvent
+from restreamlocal.trace import Tracer
+from restreamlocal.trace import time_to_first_frame
+
+from .harness import FakeExecutables
+from .harness import wait_for
+
+
+def test_ring() -> None:
+    """The ring keeps the newest events, the count keeps going."""
+    tracer = Tracer(capacity=3)
+    for index in range(5):
+        tracer.emit("tick", "live", index=index)
+    assert [event["index"] for event in tracer.recent()] == [2, 3, 4]
+    assert [event["index"] for event in tracer.recent(2)] == [3, 4]
+    assert tracer.recent(0) == []
+    assert tracer.emitted == 5
+    times = [event.time_ns for event in tracer.events]
+    assert times == sorted(times)
+
+
+def test_file(tmp_path: Path) -> None:
+    """Every event is one JSON line, after the wall clock time of opening the file, and keys stay out."""
+    path = tmp_path / "trace.jsonl"
+    tracer = Tracer(path=path)
+    tracer.emit("output_start", "rtmp://host/app", key="rtmp://host/app/KEY", restarts=0)
+    tracer.close()
+    Tracer(path=path).close()  # appends
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["event"] for line in lines] == ["trace_open", "output_start", "trace_open"]
+    assert lines[0]["wall_time"] == pytest.approx(time.time(), abs=60)
+    assert lines[1] == {
+        "time_ns": lines[1]["time_ns"],
+        "event": "output_start",
+        "source": "rtmp://host/app",
+        "restarts": 0,
+    }
+
+
+def test_disabled() -> None:
+    """A disabled tracer records nothing and costs little more than the call."""
+    tracer = Tracer(enabled=False)
+    count = 100_000
+    start = time.perf_counter()
+    for _ in range(count):
+        tracer.emit("output_join", "rtmp://host/app", timestamp=0)
+    per_call = (time.perf_counter() - start) / count
+    print(f"{per_call * 1e9:.0f}ns per disabled emit")
+    assert not tracer.events and tracer.emitted == 0
+    assert per_call < 5e-6
+
+
+def test_time_to_first_frame() -> None:
+    """Stages are timed from the latest relay start, and only their first occurrence counts."""
+    ms = 1_000_000
+    events = [
+        TraceEvent(0, "relay_start"),
+        TraceEvent(1 * ms, "output_start", "a"),
+        TraceEvent(2 * ms, "relay_start"),
+        TraceEvent(3 * ms, "output_start", "a"),
+        TraceEvent(5 * ms, "ingest_connect", "live"),
+        TraceEvent(9 * ms, "ingest_first_keyframe", "live"),
+        TraceEvent(10 * ms, "output_join", "a"),
+        TraceEvent(12 * ms, "output_start", "a"),
+    ]
+    assert time_to_first_frame(events) == {
+        "ingest": {"ingest_connect": 3.0, "ingest_first_keyframe": 7.0},
+        "destinations": {"a": {"output_start": 1.0, "output_join": 8.0}},
+    }
+
+
+def test_first_frame_outlives_ring() -> None:
+    """The first frame times are kept apart from the ring, per output key, and reset by a relay start."""
+    tracer = Tracer(capacity=4)
+    tracer.emit("relay_start")
+    tracer.emit("ingest_connect", "live")
+    for key in ("rtmp://host/app/1", "rtmp://host/app/2"):
+        tracer.emit("output_start", "rtmp://host/app", key=key)
+        tracer.emit("output_join", "rtmp://host/app", key=key)
+    tracer.emit("output_start", "rtmp://host/app", key="rtmp://host/app/1")  # a restart doesn't count
+    for _ in range(10):
+        tracer.emit("output_evicted", "rtmp://host/app")
+    assert not any(event.name == "relay_start" for event in tracer.events)
+    first_frame = tracer.time_to_first_frame()
+    assert list(first_frame["ingest"]) == ["ingest_connect"]
+    assert set(first_frame["destinations"]) == {"rtmp://host/app/1", "rtmp://host/app/2"}
+    for stages in first_frame["destinations"].values():
+        assert list(stages) == ["output_start", "output_join"]
+        assert stages["output_start"] <= stages["output_join"]
+    tracer.emit("relay_start")
+    assert tracer.time_to_first_frame() == {"ingest": {}, "destinations": {}}
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="The fakes are POSIX shell scripts")
+def test_session(tmp_path: Path, fakes: FakeExecutables) -> None:
+    """A session traces the ingest, every destination's way to its first byte, and the shutdown."""
+    path = tmp_path / "trace.jsonl"
+
+    async def test() -> None:
+        tracer = Tracer(path=path)
+        async with RestreamSession(tracer=tracer) as session:
+            await session.start_ingest()
+            await session.add_destination("fake://ok/app/1")
+            await session.add_destination("fake://ok/app/2")  # both redact to the same name
+            await session.start_relay()
+            relay = session.relay
+            assert relay is not None
+            await wait_for(lambda: all(output.total_size > 0 for output in relay.outputs), timeout=10)
+            first_frame = session.stats()["first_frame"]
+            assert list(first_frame["ingest"]) == ["ingest_connect", "ingest_first_keyframe"]
+            assert len(first_frame["destinations"]) == len(relay.outputs)
+            for stages in first_frame["destinations"]:
+                assert set(stages) == set(OUTPUT_STAGES)
+                assert stages["output_start"] == min(stages.values())
+                assert stages["output_join"] <= stages["output_first_byte"]
+            control_server = ControlServer(session, port=0)
+            request = {"jsonrpc": "2.0", "id": 1, "method": "trace", "params": [3]}
+            response = await control_server.handle(request)
+            assert response is not None and len(response["result"]) == 3
+        tracer.close()
+        events = [json.loads(line)["event"] for line in path.read_text().splitlines()]
+        assert events[-1] == "shutdown_done"
+        assert events.index("shutdown") < events.index("relay_stop") < events.index("shutdown_done")
+
+    asyncio.run(test())
+
+
+__all__ = (
+    "test_disabled",
+    "test_file",
+    "test_first_frame_outlives_ring",
+    "test_ring",
+    "test_session",
+    "test_time_to_first_frame",
+)
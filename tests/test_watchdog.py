@@ -0,0 +1,83 @@
+"""Test cases for the output watchdog."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+from restreamlocal.flv import TAG_TYPE_VIDEO
+from restreamlocal.flv import FlvTag
+from restreamlocal.output import Output
+from restreamlocal.watchdog import Watchdog
+from restreamlocal.watchdog import is_stalled
+
+
+class FakeOutput(Output):
+    """An output with a pretend process that records restarts instead of spawning ffmpeg."""
+
+    def __init__(self) -> None:
+        super().__init__("ffmpeg", "rtmp://example.com/live/key", list)
+        self.process = SimpleNamespace(returncode=None)  # type: ignore[assignment]
+        self.started_at = 0.0
+
+    async def restart(self) -> None:
+        self.restarts += 1
+        self.restarts_since_progress += 1
+        self.started_at = time.monotonic()
+
+
+def progress(out_time_us: int, total_size: int) -> dict[str, str]:
+    return {"out_time_us": str(out_time_us), "total_size": str(total_size), "progress": "continue"}
+
+
+class TestWatchdog:
+    """Test cases for stall detection & recovery metrics."""
+
+    def test_idle_output_is_not_stalled(self) -> None:
+        """An output nobody is feeding isn't frozen, just idle."""
+        output = FakeOutput()
+        assert not is_stalled(output, output.last_progress + 60, 10)
+        output.fed_since_progress = 1
+        assert is_stalled(output, output.last_progress + 60, 10)
+
+    def test_restarts_only_the_frozen_output(self) -> None:
+        """The healthy output is left alone and the recovery time is recorded."""
+        frozen, healthy = FakeOutput(), FakeOutput()
+        for output in (frozen, healthy):
+            output.fed_since_progress = 100
+            output.last_progress = time.monotonic() - 30
+        healthy._update_progress(progress(1_000_000, 4096))
+
+        watchdog = Watchdog(lambda: [frozen, healthy], stall_timeout=10)
+        asyncio.run(watchdog.check())
+        assert (frozen.restarts, healthy.restarts) == (1, 0)
+        assert watchdog.stalls_detected == 1
+
+        frozen._update_progress(progress(1_000_000, 4096))
+        assert len(frozen.recovery_times) == 1
+        assert frozen.stall_detected_at is None
+
+    def test_crashed_output_backs_off(self) -> None:
+        """An output that keeps exiting isn't restarted again right away."""
+        output = FakeOutput()
+        output.process.returncode = 1  # type: ignore[union-attr]
+        watchdog = Watchdog(lambda: [output])
+        asyncio.run(watchdog.check())
+        asyncio.run(watchdog.check())
+        assert output.restarts == 1
+        assert watchdog.crashes_detected == 1
+
+
+def test_output_joins_on_keyframe() -> None:
+    """A (re)started output skips to the next keyframe and sends the headers in front of it."""
+    header = FlvTag(TAG_TYPE_VIDEO, 0, b"\x17\x00")
+    output = Output("ffmpeg", "rtmp://example.com/live/key", lambda: [header])
+    output.process = SimpleNamespace(returncode=None)  # type: ignore[assignment]
+    output.send([FlvTag(TAG_TYPE_VIDEO, 10, b"\x27\x01")])
+    assert output.queue_depth == 0
+    output.send([FlvTag(TAG_TYPE_VIDEO, 20, b"\x27\x01"), FlvTag(TAG_TYPE_VIDEO, 30, b"\x17\x01")])
+    assert output.joined
+    assert output.queue_depth == 1
+    assert output.name == "rtmp://example.com/live"
+
+
+__all__ = ("TestWatchdog",)
@@ -0,0 +1,104 @@
+"""Test cases for the Tk widgets, skipped where there is no display."""
+
+import time
+import tkinter as tk
+from types import SimpleNamespace
+from typing import Iterator
+
+import pytest
+
+from restreamlocal.telemetry import OutputTelemetry
+from restreamlocal.widgets import DestinationList
+from restreamlocal.widgets import TelemetryView
+from restreamlocal.widgets import sparkline_coords
+
+
+@pytest.fixture
+def root() -> Iterator[tk.Tk]:
+    try:
+        window = tk.Tk()
+    except tk.TclError as error:
+        pytest.skip(f"No display: {error}")
+    window.withdraw()
+    yield window
+    window.destroy()
+
+
+class TestDestinationList:
+    """Test cases for the virtualized remote host list."""
+
+    def test_edit(self, root: tk.Tk) -> None:
+        """Edits land in the right row, also after scrolling, and loading rows isn't an edit."""
+        changes = []
+        destinations = DestinationList(
+            root, [(f"rtmp://{index}/app", str(index)) for index in range(20)], visible_rows=5
+        )
+        destinations.on_change = lambda: changes.append(1)
+        destinations.scroll_to(10)
+        assert not changes
+        destinations._slots[2].key_stringvar.set("new")
+        assert destinations.get()[12] == ("rtmp://12/app", "new")
+        assert len(changes) == 1
+
+    def test_add_remove(self, root: tk.Tk) -> None:
+        """There is always one row, and new rows are scrolled into view."""
+        destinations = DestinationList(root, visible_rows=5)
+        destinations.remove_row()
+        assert destinations.get() == [("", "")]
+        for _ in range(9):
+            destinations.add_row()
+        assert len(destinations) == 10
+        assert destinations.first == 5
+        destinations.remove_row()
+        assert destinations.first == 4
+
+    def test_constant_time(self, root: tk.Tk) -> None:
+        """Adding & removing at 500 rows costs about what it does at 10, and never creates more widgets."""
+        destinations = DestinationList(root)
+
+        def time_add_remove() -> float:
+            start = time.perf_counter()
+            for _ in range(20):
+                destinations.add_row()
+                destinations.remove_row()
+                destinations.add_row()
+            root.update_idletasks()
+            return time.perf_counter() - start
+
+        while len(destinations) < 10:
+            destinations.add_row()
+        small = time_add_remove()
+        while len(destinations) < 500:
+            destinations.add_row()
+        large = time_add_remove()
+        assert len(destinations._slots) == destinations.visible_rows
+        assert large < small * 5 + 0.05
+
+
+class TestTelemetryView:
+    """Test cases for the sparklines."""
+
+    def test_only_visible_rows_are_drawn(self, root: tk.Tk) -> None:
+        """500 outputs get canvas items for the visible rows only, and unchanged rows aren't redrawn."""
+        outputs = [
+            SimpleNamespace(name=f"rtmp://{index}/app", telemetry=OutputTelemetry()) for index in range(500)
+        ]
+        for output in outputs:
+            for sample in range(200):
+                output.telemetry.append(sample, 30, 0)
+        view = TelemetryView(root, lambda: outputs)
+        view.refresh()
+        items = len(view.canvas.find_all())
+        assert len(view._rows) == view.visible_rows
+        drawn = [row.drawn for row in view._rows]
+        view.refresh()
+        assert [row.drawn for row in view._rows] == drawn
+        view.scroll_to(490)
+        assert len(view.canvas.find_all()) == items
+        view.destroy()
+
+
+def test_sparkline_coords() -> None:
+    """The largest value touches the top and zero sits on the bottom."""
+    assert sparkline_coords([0, 5, 10], 100, 20, 10, 18) == [100, 38, 105, 29, 110, 20]
+    assert sparkline_coords([0, 0], 0, 0, 10, 18) == [0, 18, 10, 18]